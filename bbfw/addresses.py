@@ -0,0 +1,156 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import socket, struct
+
+# Addresses are handled as (family, network, mask) tuples of integers, with
+# the host bits of network cleared, so that equivalent forms of the same
+# network (10.0.0.0/24, 10.0.0.5/24, 10.0.0.0/255.255.255.0) are equal and
+# containment is a couple of integer operations.
+
+IPV4 = 4
+IPV6 = 6
+
+FAMILY_BITS = { IPV4: 32, IPV6: 128 }
+
+# Rulesets repeat the same addresses a lot, parse each one once
+MAX_CACHED_NETWORKS = 65536
+networkCache = {}
+
+
+class AddressException(Exception):
+    pass
+
+
+def parseIP(text):
+    """Return the (family, integer) pair of an IPv4 or IPv6 address"""
+
+    result = None
+    if text.find(":") == -1:
+        try:
+            result = (IPV4, struct.unpack("!L", socket.inet_aton(text))[0])
+        except socket.error:
+            pass
+
+        # inet_aton accepts shortened forms like "10.1" that iptables doesn't
+        if result is not None and text.count(".") != 3:
+            result = None
+    else:
+        try:
+            high, low = struct.unpack("!QQ", socket.inet_pton(socket.AF_INET6, text))
+            result = (IPV6, (high << 64) | low)
+        except (socket.error, ValueError):
+            pass
+
+    if result is None:
+        raise AddressException("Invalid IP address %s" % text)
+
+    return result
+
+def getPrefixMask(family, prefix):
+    bits = FAMILY_BITS[family]
+    if prefix < 0 or prefix > bits:
+        raise AddressException("Invalid prefix length %s for IPv%s" % (prefix, family))
+
+    return ((1 << bits) - 1) ^ ((1 << (bits - prefix)) - 1)
+
+def parseNetwork(value):
+    """
+    Return the (family, network, mask) tuple of an address in
+    address[/prefix|/mask] form; raise AddressException if it can't be parsed
+    """
+
+    result = networkCache.get(value)
+    if result is None:
+        address = value
+        suffix = None
+        if value.find("/") != -1:
+            address, suffix = value.split("/", 1)
+
+        (family, network) = parseIP(address)
+        if suffix is None:
+            mask = getPrefixMask(family, FAMILY_BITS[family])
+        elif suffix.isdigit():
+            mask = getPrefixMask(family, int(suffix))
+        else:
+            (maskFamily, mask) = parseIP(suffix)
+            if maskFamily != family:
+                raise AddressException("Mask %s does not match address %s" % (suffix, address))
+
+        result = (family, network & mask, mask)
+
+        if len(networkCache) >= MAX_CACHED_NETWORKS:
+            networkCache.clear()
+        networkCache[value] = result
+
+    return result
+
+def networkContains(outer, inner):
+    """Is network inner, as returned by parseNetwork, within network outer?"""
+
+    (family, network, mask) = outer
+    return family == inner[0] and inner[2] & mask == mask and inner[1] & mask == network
+
+def parseAddressRange(value):
+    """
+    Return the ((family, first, last), ports) pair of a NAT target address
+    in address[-address][:port[-port]] form, IPv6 addresses in brackets
+    """
+
+    address = value
+    ports = None
+    if value.startswith("["):
+        # [a] or [a]-[b], then the ports after the last bracket
+        end = value.rfind("]")
+        if end == -1:
+            raise AddressException("Invalid address %s" % value)
+        address = value[0:end + 1]
+        if value[end + 1:end + 2] == ":":
+            ports = value[end + 2:]
+        elif end + 1 != len(value):
+            raise AddressException("Invalid address %s" % value)
+    elif value.count(":") == 1:
+        address, ports = value.split(":")
+
+    if len(address) == 0:
+        # only the ports are translated
+        return (None, ports)
+
+    first = address
+    last = address
+    if address.startswith("["):
+        parts = address[1:-1].split("]-[")
+        if len(parts) > 2:
+            raise AddressException("Invalid address range %s" % value)
+        first = parts[0]
+        last = parts[-1]
+    elif address.find("-") != -1:
+        first, last = address.split("-", 1)
+
+    (family, firstValue) = parseIP(first)
+    (lastFamily, lastValue) = parseIP(last)
+    if lastFamily != family:
+        raise AddressException("Invalid address range %s" % value)
+
+    return ((family, firstValue, lastValue), ports)
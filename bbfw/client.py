@@ -0,0 +1,63 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import os, socket, json
+from defaults import DAEMON_OPERATIONS, DEFAULT_SOCKET
+
+# Requests and responses are a single line of JSON:
+#   request:  {"op": "show", "args": {"table": "nat", ...}}
+#   response: {"status": 0, "output": "..."}
+# A status different from 0 means the operation failed, and output is the error.
+
+
+class DaemonException(Exception):
+    pass
+
+
+def isDaemonRunning(socketPath):
+    return socketPath is not None and os.path.exists(socketPath)
+
+
+class DaemonClient:
+    def __init__(self, socketPath):
+        self.socketPath = socketPath
+
+    def call(self, op, args):
+        """Run op on the daemon and return its output; raise DaemonException if it failed"""
+
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.socketPath)
+            stream = conn.makefile('rw')
+            stream.write(json.dumps({'op': op, 'args': args}) + "\n")
+            stream.flush()
+            response = json.loads(stream.readline())
+            stream.close()
+        finally:
+            conn.close()
+
+        if response['status'] != 0:
+            raise DaemonException(response['output'])
+
+        return response['output']
@@ -0,0 +1,186 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import hashlib
+from elements import newRule, multisetDiff
+from logger import log
+
+# Below this number of chains to compare rule by rule, starting a process pool costs more than it saves
+MIN_PARALLEL_CHAINS = 16
+
+
+def getChainSignature(chain, unordered=False):
+    """
+    A digest of the policy and of the rule signatures of chain. When
+    unordered, the digest doesn't depend on the order of the rules.
+    """
+
+    signatures = [rule.getSignature() for rule in chain.getRules()]
+    if unordered:
+        signatures.sort()
+
+    digest = hashlib.sha1(chain.getPolicy())
+    for signature in signatures:
+        digest.update(signature)
+
+    return digest.digest()
+
+def getChainJob(key, thisChain, otherChain, unordered=False):
+    """Serialize two chains to be compared by compareChainJob(), possibly in another process"""
+
+    return (key, unordered,
+            thisChain.getPolicy(), [rule.toStr() for rule in thisChain.getRules()],
+            otherChain.getPolicy(), [rule.toStr() for rule in otherChain.getRules()])
+
+def compareChainJob(job):
+    """Compare two chains serialized by getChainJob() the same way Chain.equals() does"""
+
+    (key, unordered, thisPolicy, thisRules, otherPolicy, otherRules) = job
+
+    if unordered:
+        (missing, added) = multisetDiff([newRule(r) for r in thisRules], [newRule(r) for r in otherRules])
+        result = thisPolicy == otherPolicy and len(missing) == 0 and len(added) == 0
+    else:
+        result = thisPolicy == otherPolicy and len(thisRules) == len(otherRules)
+
+        index = 0
+        while result and index < len(thisRules):
+            if thisRules[index] != otherRules[index]:
+                result = newRule(thisRules[index]).equals(newRule(otherRules[index]))
+
+            index = index + 1
+
+    return (key, result)
+
+
+class RulesetComparator:
+    """
+    Compare the chains of two rulesets, possibly in parallel.
+    Chains with the same signature are equal; the others are serialized and
+    compared rule by rule by a pool of jobs processes. The results can then be
+    queried with chainEquals(), tableEquals() and equals() in any order.
+    When unordered is set, all the chains are compared as unordered chains.
+    """
+
+    def __init__(self, thisRuleset, otherRuleset, jobs=1, unordered=False):
+        self.thisRuleset = thisRuleset
+        self.otherRuleset = otherRuleset
+        self.unordered = unordered
+        self.jobs = jobs
+        if self.jobs is None:
+            import multiprocessing
+            self.jobs = multiprocessing.cpu_count()
+
+        self.results = None
+
+    def getTableNames(self):
+        names = set(self.thisRuleset.getTables().keys()) | set(self.otherRuleset.getTables().keys())
+        return sorted(names)
+
+    def getChainNames(self, tableName):
+        names = set()
+        for ruleset in [self.thisRuleset, self.otherRuleset]:
+            table = ruleset.getTable(tableName)
+            if table is not None:
+                names.update([c.getName() for c in table.chains()])
+
+        return sorted(names)
+
+    def compare(self):
+        self.results = {}
+        candidates = []
+
+        for tableName in self.getTableNames():
+            thisTable = self.thisRuleset.getTable(tableName)
+            otherTable = self.otherRuleset.getTable(tableName)
+
+            for chainName in self.getChainNames(tableName):
+                thisChain = None
+                if thisTable is not None:
+                    thisChain = thisTable.getChain(chainName)
+
+                otherChain = None
+                if otherTable is not None:
+                    otherChain = otherTable.getChain(chainName)
+
+                key = (tableName, chainName)
+                if thisChain is None or otherChain is None:
+                    self.results[key] = False
+                    continue
+
+                unordered = self.unordered or thisChain.isUnordered() or otherChain.isUnordered()
+                if getChainSignature(thisChain, unordered) == getChainSignature(otherChain, unordered):
+                    self.results[key] = True
+                else:
+                    candidates.append( (key, thisChain, otherChain, unordered) )
+
+        log(50, "%s chains have the same signature, %s need to be compared rule by rule" % (len(self.results), len(candidates)))
+
+        if self.jobs > 1 and len(candidates) >= MIN_PARALLEL_CHAINS:
+            jobs = [getChainJob(*candidate) for candidate in candidates]
+
+            from multiprocessing import Pool
+            pool = Pool(self.jobs)
+            try:
+                results = pool.map(compareChainJob, jobs, max(1, len(jobs) / (self.jobs * 4)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [(key, thisChain.equals(otherChain, unordered)) for key, thisChain, otherChain, unordered in candidates]
+
+        for key, result in results:
+            self.results[key] = result
+
+    def getResults(self):
+        if self.results is None:
+            self.compare()
+
+        return self.results
+
+    def chainEquals(self, tableName, chainName):
+        return self.getResults().get((tableName, chainName), False)
+
+    def tableEquals(self, tableName):
+        result = True
+        for key, equal in self.getResults().items():
+            if key[0] == tableName and not equal:
+                result = False
+                break
+
+        return result
+
+    def equals(self):
+        result = True
+        for equal in self.getResults().values():
+            if not equal:
+                result = False
+                break
+
+        # tables without chains don't show in the results
+        for tableName in self.getTableNames():
+            if self.thisRuleset.getTable(tableName) is None or self.otherRuleset.getTable(tableName) is None:
+                result = False
+
+        return result
@@ -0,0 +1,351 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+from elements import TABLE_CHAINS
+from logger import log
+
+# Targets that end the walk of a chain for the packets they match
+TERMINATING_TARGETS = set(['ACCEPT', 'DROP', 'REJECT', 'RETURN', 'QUEUE', 'NFQUEUE', 'DNAT', 'SNAT', 'MASQUERADE', 'REDIRECT', 'NETMAP', 'SAME', 'TPROXY', 'MIRROR'])
+
+# Estimated sizes, in bytes, of the kernel structures of a rule on a 64 bit
+# kernel: the entry with the addresses and interfaces, a header and a payload
+# for each match and for the target, and counters for each CPU
+ENTRY_SIZE = 112
+MATCH_HEADER_SIZE = 32
+TARGET_HEADER_SIZE = 32
+COUNTERS_SIZE = 16
+
+DEFAULT_MATCH_SIZE = 32
+MATCH_SIZES = {
+    'addrtype': 16, 'comment': 256, 'connlimit': 32, 'conntrack': 168, 'dscp': 8,
+    'hashlimit': 152, 'icmp': 8, 'iprange': 72, 'length': 8, 'limit': 48,
+    'mac': 16, 'mark': 16, 'multiport': 48, 'owner': 16, 'physdev': 80,
+    'recent': 232, 'set': 40, 'state': 8, 'string': 160, 'tcp': 16,
+    'tos': 8, 'udp': 16,
+}
+
+# jumps to user chains use the standard target, a verdict
+DEFAULT_TARGET_SIZE = 8
+TARGET_SIZES = {
+    'CONNMARK': 16, 'CT': 32, 'DNAT': 24, 'LOG': 32, 'MARK': 16, 'MASQUERADE': 24,
+    'NFLOG': 80, 'REDIRECT': 24, 'SNAT': 24, 'TCPMSS': 8, 'TPROXY': 24,
+}
+
+# the entries marking the start of a user chain and its implicit RETURN, or
+# the policy of a builtin chain
+USER_CHAIN_SIZE = 2 * ENTRY_SIZE + TARGET_HEADER_SIZE + 32 + TARGET_HEADER_SIZE + DEFAULT_TARGET_SIZE
+BUILTIN_CHAIN_SIZE = ENTRY_SIZE + TARGET_HEADER_SIZE + DEFAULT_TARGET_SIZE
+
+
+def getRuleMemory(parts, target, cpus):
+    """Estimate the kernel memory of a rule, from the words of its text"""
+
+    result = ENTRY_SIZE + TARGET_HEADER_SIZE + TARGET_SIZES.get(target, DEFAULT_TARGET_SIZE) + COUNTERS_SIZE * cpus
+    for i in range(0, len(parts) - 1):
+        if parts[i] == "-m":
+            result += MATCH_HEADER_SIZE + MATCH_SIZES.get(parts[i + 1], DEFAULT_MATCH_SIZE)
+
+    return result
+
+def isUnconditional(parts):
+    """True if the rule has no match, so every packet reaching it takes its target"""
+
+    start = 0
+    if len(parts) > 1 and parts[0] == "-A":
+        start = 2
+
+    return len(parts) > start and parts[start] in ("-j", "-g")
+
+def formatSize(size):
+    result = "%d B" % size
+    if size >= 1024 * 1024:
+        result = "%.1f MiB" % (size / (1024.0 * 1024))
+    elif size >= 1024:
+        result = "%.1f KiB" % (size / 1024.0)
+
+    return result
+
+
+class ChainCost:
+    """
+    The cost of a chain for the packets traversing it:
+      rules     the rules of the chain
+      memory    the estimated kernel memory of the chain and its rules
+      worst     the most rules a packet can be matched against from entering
+                the chain to leaving it, jumps to other chains included
+      average   the rules a packet entering the chain is matched against on
+                average, according to the hit counters, or None
+      returned  the share of the packets entering the chain that go back to
+                the chain that jumped to it
+      depth     the most jumps from a builtin chain to the chain, or None if
+                no builtin chain reaches it
+      before    the most rules a packet can be matched against, starting from
+                a builtin chain, before entering the chain, or None
+    """
+
+    def __init__(self, rules, memory):
+        self.rules = rules
+        self.memory = memory
+        self.worst = 0
+        self.average = None
+        self.returned = 1.0
+        self.depth = None
+        self.before = None
+
+    def __str__(self):
+        text = "%s rules, %s" % (self.rules, formatSize(self.memory))
+        if self.depth is not None:
+            text = "%s, depth %s, %s before" % (text, self.depth, self.before)
+        text = "%s, worst %s" % (text, self.worst)
+        if self.average is not None:
+            text = "%s, avg %.1f" % (text, self.average)
+
+        return "(%s)" % text
+
+class CostModel:
+    """
+    Estimate how many rules each packet is matched against, on its way from
+    the builtin chains through the jumps to user chains, and how much kernel
+    memory the rules take. The rules are read once; costs are then computed
+    bottom up and top down on the jump graph, ignoring the jumps that close
+    a loop. When the chains have counters, the average cost follows the
+    packets: those matched by a terminating rule don't reach the rules after
+    it, and a jump costs the average of the chain jumped to.
+    """
+
+    def __init__(self, ruleset, cpus=None):
+        self.ruleset = ruleset
+        self.cpus = cpus
+        if self.cpus is None:
+            import multiprocessing
+            self.cpus = multiprocessing.cpu_count()
+
+        # table -> chain -> ChainCost
+        self.costs = {}
+
+    def analyze(self):
+        tables = self.ruleset.getTables()
+        for tableName in sorted(tables.keys()):
+            self.costs[tableName] = self.analyzeTable(tables[tableName])
+
+        return self.costs
+
+    def getCosts(self):
+        if len(self.costs) == 0:
+            self.analyze()
+
+        return self.costs
+
+    def getAnnotations(self):
+        """Return table -> chain -> cost text, the totals of a table being under None"""
+
+        result = {}
+        for tableName, costs in self.getCosts().items():
+            annotations = {}
+            for chainName, cost in costs.items():
+                annotations[chainName] = "%s" % cost
+
+            rules = sum([cost.rules for cost in costs.values()])
+            memory = sum([cost.memory for cost in costs.values()])
+            depths = [cost.depth for cost in costs.values() if cost.depth is not None]
+            annotations[None] = "(%s rules, %s, max depth %s)" % (rules, formatSize(memory), max(depths + [0]))
+            result[tableName] = annotations
+
+        return result
+
+    def readTable(self, table):
+        """
+        Return (costs, steps, incoming, order): the ChainCost of each chain,
+        its rules as (child chain, goto, terminating, returns, unconditional, packets),
+        the packets jumping to each chain and the chains in depth first post order
+        """
+
+        builtins = TABLE_CHAINS[table.getName()]
+        costs = {}
+        steps = {}
+        incoming = {}
+        edges = {}
+
+        for chain in table.chains():
+            chainName = chain.getName()
+            chainSteps = []
+            children = []
+            memory = BUILTIN_CHAIN_SIZE
+            if chainName not in builtins:
+                memory = USER_CHAIN_SIZE
+
+            for index, rule in enumerate(chain.getRules()):
+                parts = rule.toStr().split()
+                target = rule.getTarget()
+                if target is True:
+                    target = None
+                memory += getRuleMemory(parts, target, self.cpus)
+
+                packets = 0
+                counters = chain.getRuleCounters(index)
+                if counters is not None:
+                    packets = counters[0]
+
+                child = None
+                if target is not None and target not in builtins and table.hasChain(target):
+                    child = target
+                    children.append(child)
+                    incoming[child] = incoming.get(child, 0) + packets
+
+                chainSteps.append( (child, rule.isGoto(), target in TERMINATING_TARGETS, target == "RETURN", isUnconditional(parts), packets) )
+
+            costs[chainName] = ChainCost(len(chainSteps), memory)
+            steps[chainName] = chainSteps
+            edges[chainName] = children
+
+        roots = [name for name in builtins if name in edges] + sorted([name for name in edges if name not in builtins])
+        order = self.getPostOrder(roots, edges)
+
+        return (costs, steps, incoming, order)
+
+    def getPostOrder(self, roots, edges):
+        result = []
+        visited = set()
+
+        for root in roots:
+            if root in visited:
+                continue
+
+            # (chain, index of the next child to follow)
+            stack = [ (root, 0) ]
+            visited.add(root)
+            while len(stack) > 0:
+                (chainName, position) = stack[-1]
+                children = edges[chainName]
+                if position == len(children):
+                    stack.pop()
+                    result.append(chainName)
+                    continue
+
+                stack[-1] = (chainName, position + 1)
+                child = children[position]
+                if child not in visited:
+                    visited.add(child)
+                    stack.append( (child, 0) )
+
+        return result
+
+    def analyzeTable(self, table):
+        (costs, steps, incoming, order) = self.readTable(table)
+
+        # a jump is followed unless it goes up the post order, closing a loop
+        position = {}
+        for i, chainName in enumerate(order):
+            position[chainName] = i
+
+        for chainName in order:
+            self.computeChain(table.getChain(chainName), costs, steps[chainName], incoming, position)
+
+        for chainName in TABLE_CHAINS[table.getName()]:
+            if chainName in costs:
+                costs[chainName].depth = 0
+                costs[chainName].before = 0
+
+        for chainName in reversed(order):
+            cost = costs[chainName]
+            if cost.depth is None:
+                continue
+
+            matched = 0
+            for child, goto, terminating, returns, unconditional, packets in steps[chainName]:
+                matched += 1
+                if child is not None and position[child] < position[chainName]:
+                    childCost = costs[child]
+                    if childCost.depth is None or childCost.depth < cost.depth + 1:
+                        childCost.depth = cost.depth + 1
+                    if childCost.before is None or childCost.before < cost.before + matched:
+                        childCost.before = cost.before + matched
+                    if not goto:
+                        matched += childCost.worst
+
+                if unconditional and (goto or terminating):
+                    break
+
+        log(50, "Computed the cost of %s chains of table %s" % (len(costs), table.getName()))
+
+        return costs
+
+    def computeChain(self, chain, costs, chainSteps, incoming, position):
+        """The worst and average cost of chain, once those of the chains it jumps to are known"""
+
+        cost = costs[chain.getName()]
+        chainPosition = position[chain.getName()]
+
+        matched = 0
+        worst = 0
+        for child, goto, terminating, returns, unconditional, packets in chainSteps:
+            matched += 1
+            if child is not None and position[child] < chainPosition:
+                if goto:
+                    worst = max(worst, matched + costs[child].worst)
+                else:
+                    matched += costs[child].worst
+
+            if unconditional and (goto or terminating):
+                break
+
+        cost.worst = max(worst, matched)
+
+        if chain.hasCounters():
+            # packets leaving the chain at each rule, and those going back to the caller
+            left = []
+            returned = 0
+            for child, goto, terminating, returns, unconditional, packets in chainSteps:
+                if child is not None and position[child] < chainPosition and not goto:
+                    left.append(packets * (1 - costs[child].returned))
+                elif goto or terminating:
+                    left.append(packets)
+                else:
+                    left.append(0)
+
+                if returns:
+                    returned += packets
+
+            policyCounters = chain.getPolicyCounters()
+            if not chain.getRoot().isUserChain(chain.getName()) and policyCounters is not None:
+                reachedEnd = policyCounters[0]
+                entered = reachedEnd + sum(left)
+            else:
+                entered = incoming.get(chain.getName(), 0)
+                reachedEnd = max(0, entered - sum(left))
+
+            if entered > 0:
+                # walk back from the end: the packets matched against a rule
+                # are those reaching the next one plus those leaving at it
+                reached = reachedEnd
+                evaluated = 0.0
+                for i in range(len(chainSteps) - 1, -1, -1):
+                    (child, goto, terminating, returns, unconditional, packets) = chainSteps[i]
+                    reached += left[i]
+                    evaluated += reached
+                    if child is not None and position[child] < chainPosition and costs[child].average is not None:
+                        evaluated += packets * costs[child].average
+
+                cost.average = evaluated / entered
+                cost.returned = min(1.0, float(reachedEnd + returned) / entered)
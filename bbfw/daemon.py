@@ -0,0 +1,235 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import os, sys, time, socket, json, argparse, traceback, signal, SocketServer
+from StringIO import StringIO
+from parsers import FileReader, IPTSaveFileParser
+from renderers import RulesetSummaryRenderer, FileRenderer, RulesetDiffRenderer
+from util import getCurrentRuleset, purgeTable, testChainDelta
+from compare import RulesetComparator
+from snapshots import takeSnapshot
+from validator import printFindings
+from watch import ConfigWatcher, PollingWatcher
+from logger import log
+from client import DAEMON_OPERATIONS, DaemonException
+
+
+def decodeArgs(args):
+    """json decodes strings as unicode, the rest of bbfw wants str"""
+
+    result = {}
+    for name, value in args.items():
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        result[name.encode('utf-8')] = value
+
+    return result
+
+def stop(signum, frame):
+    raise SystemExit(0)
+
+
+class DaemonRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if len(line) == 0:
+            return
+
+        status = 0
+        try:
+            request = json.loads(line)
+            output = self.server.daemon.handle(request['op'], argparse.Namespace(**decodeArgs(request['args'])))
+        except Exception, e:
+            log(20, traceback.format_exc())
+            status = 1
+            output = "%s" % e
+
+        self.wfile.write(json.dumps({'status': status, 'output': output}) + "\n")
+
+
+class Daemon:
+    """
+    Keep the live ruleset and the config folders parsed in memory, and run
+    operations on them for bbfwmgr clients connecting to a UNIX socket.
+    The live ruleset is refreshed every refresh seconds, after each load or
+    purge, and on request.
+    """
+
+    def __init__(self, socketPath, refresh=None):
+        self.socketPath = socketPath
+        self.refreshInterval = refresh
+        self.configs = {}
+        self.refresh()
+
+    def refresh(self, args=None):
+        self.live = getCurrentRuleset()
+        self.lastRefresh = time.time()
+
+        # the config watchers compare against the live ruleset
+        for config in self.configs.values():
+            config.live = self.live
+
+    def getConfig(self, directory):
+        """Return the ConfigWatcher of directory, with the files changed since the last request parsed again"""
+
+        directory = os.path.abspath(directory)
+        if directory not in self.configs:
+            self.configs[directory] = ConfigWatcher(directory, PollingWatcher(directory), live=self.live)
+        else:
+            self.configs[directory].refreshConfig()
+
+        return self.configs[directory]
+
+    def getRuleset(self, args):
+        ruleset = None
+        if args.directory is not None:
+            ruleset = self.getConfig(args.directory).config
+            ruleset.name = "Ruleset loaded from directory %s" % args.directory
+        elif args.file is not None:
+            fileReader = FileReader(args.file)
+            ruleset = IPTSaveFileParser(fileReader.getLines(noComments=True)).parse()
+            ruleset.name = "Ruleset loaded from file %s" % args.file
+
+        return ruleset
+
+    def handle(self, op, args):
+        if op not in DAEMON_OPERATIONS:
+            raise DaemonException("Unknown operation %s" % op)
+
+        output = StringIO()
+        stdout = sys.stdout
+        sys.stdout = output
+        try:
+            getattr(self, op)(args)
+        except DaemonException, e:
+            # keep what the operation printed before failing
+            raise DaemonException(output.getvalue() + "%s" % e)
+        finally:
+            sys.stdout = stdout
+
+        return output.getvalue()
+
+    def show(self, args):
+        ruleset = self.getRuleset(args)
+        if ruleset is None:
+            ruleset = self.live
+
+        renderer = None
+        if not args.verbose:
+            renderer = RulesetSummaryRenderer(ruleset)
+        else:
+            renderer = FileRenderer(ruleset)
+
+        print renderer.render(args.table, args.chain)
+
+    def compare(self, args):
+        ruleset = self.getRuleset(args)
+        if ruleset is None:
+            raise DaemonException("Please specify either a config file or a config directory\n")
+
+        unordered = getattr(args, 'unordered', False)
+        comparator = RulesetComparator(self.live, ruleset, getattr(args, 'jobs', 1), unordered)
+        if comparator.equals() and (unordered or ruleset.equals(self.live)):
+            print "No difference.\n"
+        else:
+            renderer = RulesetDiffRenderer(self.live, ruleset, getattr(args, 'table', None), getattr(args, 'chain', None), comparator, unordered)
+            print renderer.render()
+
+    def checkConfig(self, config, delta, args):
+        """Validate the config and test delta with 'iptables-restore --test'; return False if it can't be loaded"""
+
+        result = True
+        if not getattr(args, 'no_validate', False):
+            # the same gate as a local load
+            if not printFindings(config.config.validate(self.live), args.verbose):
+                print "\nThe config has critical problems, no change applied. Use --no-validate to load it anyway.\n"
+                result = False
+
+        if result and not delta.isEmpty() and not getattr(args, 'no_test', False):
+            (result, error) = testChainDelta(delta).getResult()
+            if result:
+                print "\nThe config passed 'iptables-restore --test'."
+            else:
+                print "\nThe config was rejected by 'iptables-restore --test':\n%s" % error
+                print "No change applied.\n"
+
+        return result
+
+    def preload(self, args):
+        """Run the checks of a load, so that clients can show them before asking for confirmation"""
+
+        if args.directory is None:
+            raise DaemonException("The daemon can only load a configuration directory")
+
+        self.refresh()
+        config = self.getConfig(args.directory)
+        if not self.checkConfig(config, config.getSyncDelta(config.getAllChains()), args):
+            raise DaemonException("The config can't be loaded")
+
+    def load(self, args):
+        if args.directory is None:
+            raise DaemonException("The daemon can only load a configuration directory")
+
+        # the snapshot and the delta must be taken from the rules in netfilter now
+        self.refresh()
+        config = self.getConfig(args.directory)
+        delta = config.getSyncDelta(config.getAllChains())
+        if not self.checkConfig(config, delta, args):
+            return
+
+        if delta.isEmpty():
+            print "\nConfiguration and current rules are identical, nothing to do.\n"
+            return
+
+        if not getattr(args, 'no_snapshot', False):
+            snapshotId = takeSnapshot(self.live, args.snapshots, args.keep, "before load of %s" % args.directory)
+            print "Current rules saved as snapshot %s, use 'rollback' to restore them" % snapshotId
+
+        print "Config rules loaded succesfully: %s\n" % config.apply(delta)
+
+    def purge(self, args):
+        try:
+            purgeTable(args.table, args.chain, args.recursive, getattr(args, 'dry_run', False), self.live)
+        finally:
+            self.refresh()
+
+    def serve(self):
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+
+        server = SocketServer.UnixStreamServer(self.socketPath, DaemonRequestHandler)
+        server.daemon = self
+        server.timeout = 1
+        os.chmod(self.socketPath, 0600)
+        signal.signal(signal.SIGTERM, stop)
+        log(40, "bbfw daemon listening on %s" % self.socketPath)
+
+        try:
+            while True:
+                server.handle_request()
+                if self.refreshInterval is not None and time.time() - self.lastRefresh >= self.refreshInterval:
+                    self.refresh()
+        finally:
+            server.server_close()
+            os.remove(self.socketPath)
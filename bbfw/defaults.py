@@ -0,0 +1,41 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+# Settings shared by bbfwmgr and the modules using them. This module
+# imports nothing, so that bbfwmgr can build its command line without
+# loading the modules of the operations it doesn't run.
+
+# The operations a daemon can run on behalf of bbfwmgr
+DAEMON_OPERATIONS = ['show', 'compare', 'preload', 'load', 'purge', 'refresh']
+
+DEFAULT_SOCKET = "/var/run/bbfw.sock"
+
+DEFAULT_SNAPSHOTS = "/var/lib/bbfw/snapshots"
+DEFAULT_KEEP = 50
+
+# Where node_exporter's textfile collector looks for *.prom files
+DEFAULT_METRICS = "/var/lib/node_exporter/textfile_collector/bbfw.prom"
+
+DEFAULT_RING = "/var/lib/bbfw/counters.ring"
+DEFAULT_RECORDS = 1048576
@@ -24,9 +24,12 @@
 
 
 from logger import log
-from matchers import getMatcher, propToBeIgnored
+from matchers import getMatcher, propToBeIgnored, getOptionId, getOptionName, canonicalLine
+from array import array
+from collections import OrderedDict
+import hashlib
 
-global TABLES, TABLE_CHAINS, TABLE_CHAINS_EX, TABLE_TARGETS
+global TABLES, TABLE_CHAINS, TABLE_CHAINS_EX, TABLE_TARGETS, COMPACT_RULES
 
 # for a quick intro to netfilter and iptables: https://www.dbsysnet.com/2016/06/a-deep-dive-into-iptables-and-netfilter-architecture-2
 # for quick diagrams on netfilter inner flows: https://gist.github.com/nerdalert/a1687ae4da1cc44a437d
@@ -40,7 +43,7 @@ DEFAULT_POLICY = 'ACCEPT'
 # Default chains per each table
 TABLE_CHAINS = {
     'mangle': ['PREROUTING', 'INPUT', 'FORWARD', 'OUTPUT', 'POSTROUTING'],
-    'nat': ['PREROUTING', 'OUTPUT', 'POSTROUTING'],
+    'nat': ['PREROUTING', 'INPUT', 'OUTPUT', 'POSTROUTING'],
     'filter': ['INPUT', 'FORWARD', 'OUTPUT'],
     'security': ['INPUT', 'FORWARD', 'OUTPUT'],
     'raw': ['PREROUTING', 'OUTPUT']
@@ -65,6 +68,7 @@ TABLE_TARGETS = {
 
     'nat': {
         'PREROUTING' : ['DNAT', 'NETMAP', 'REDIRECT', 'SAME'],
+        'INPUT' : ['NETMAP', 'SNAT'],
         'OUTPUT' : ['DNAT', 'NETMAP', 'REDIRECT', 'SAME'],
         'POSTROUTING' : ['MASQUERADE', 'NETMAP', 'SNAT', 'SAME']
     },
@@ -87,6 +91,112 @@ TABLE_TARGETS = {
     }
 }
 
+# In a .props file, marks a chain whose rules can be compared regardless of their order
+UNORDERED_MARKER = "unordered"
+
+# Option values that repeat across rules (chain names, targets, modules) and are worth interning
+INTERNED_VALUES = ['-A', '-j', '-g', '-m', '-p']
+
+# Store the rules of new chains in a RuleStore instead of a list of Rule objects
+COMPACT_RULES = False
+
+# Keep the raw text of parsed rules until one of their properties is needed
+LAZY_RULES = False
+
+def setCompactRules(enabled):
+    global COMPACT_RULES
+    COMPACT_RULES = enabled
+
+def setLazyRules(enabled):
+    global LAZY_RULES
+    LAZY_RULES = enabled
+
+def newRule(line):
+    result = None
+    if LAZY_RULES:
+        result = LazyRule(line)
+    else:
+        result = Rule(line)
+
+    return result
+
+def scanOption(line, name):
+    """Return the value of option name in a rule line, without parsing the whole rule"""
+
+    result = None
+    parts = line.split()
+    if name in parts:
+        index = parts.index(name) + 1
+        values = []
+        while index < len(parts) and not (parts[index][0:1] == '-' or parts[index][0:1] == '!'):
+            values.append(parts[index])
+            index = index + 1
+
+        result = True
+        if len(values) > 0:
+            result = " ".join(values)
+
+    return result
+
+def scanTarget(line):
+    # -j has precedence over -g, as in Rule.getTarget
+    target = scanOption(line, "-j")
+    if target is None:
+        target = scanOption(line, "-g")
+
+    return target
+
+def internValue(name, value):
+    result = value
+    if value is not None and name in INTERNED_VALUES:
+        result = intern(value)
+
+    return result
+
+def multisetDiff(thisRules, otherRules):
+    """
+    Compare two lists of rules regardless of their order. Return the rules
+    only found in thisRules and the rules only found in otherRules.
+    Rules are counted by signature first; the few left over on both sides
+    are then compared with Rule.equals, so that equivalent rules written
+    differently still match.
+    """
+
+    counts = {}
+    for rule in otherRules:
+        signature = rule.getSignature()
+        counts[signature] = counts.get(signature, 0) + 1
+
+    missing = []
+    for rule in thisRules:
+        signature = rule.getSignature()
+        if counts.get(signature, 0) > 0:
+            counts[signature] -= 1
+        else:
+            missing.append(rule)
+
+    added = []
+    for rule in otherRules:
+        signature = rule.getSignature()
+        if counts.get(signature, 0) > 0:
+            counts[signature] -= 1
+            added.append(rule)
+
+    result = []
+    for rule in missing:
+        found = False
+        for index in range(0, len(added)):
+            if rule.equals(added[index]):
+                del added[index]
+                found = True
+                break
+
+        if not found:
+            result.append(rule)
+
+    return result, added
+
+
 class TablePropsException(Exception):
     pass
 
@@ -96,18 +206,24 @@ class TableChainException(Exception):
 
 
 
-class Property:
+class Property(object):
+    """An option of a rule; aliases are replaced by the canonical option name and its id"""
+
+    __slots__ = ('id', 'name', 'value')
+
     def __init__(self, name, value=None):
-        self.name = name
-        self.value = value
+        self.id = getOptionId(name)
+        self.name = getOptionName(self.id)
+        self.value = internValue(self.name, value)
 
     def __str__(self):
         return "Property %s with value %s" % (self.name, self.value)
 
-class Rule:
+class Rule(object):
+    __slots__ = ('properties',)
+
     def __init__(self, line):
         self.properties = []
-        self.line = line.strip()
         self.parseLine(line.strip())
 
     def getProperties(self, removeTable=False):
@@ -128,20 +244,17 @@ class Rule:
 
         return line.strip()
 
+    def getSignature(self):
+        """A digest of the rule text, without the -A chain name"""
+
+        return hashlib.sha1(self.toStr(True)).digest()
+
     def propEquals(self, this, that):
         """
         Compare rule properties taking into account possible aliases
         """
 
-        result = this.name == that.name
-        if this.name in RULE_PROP_ALIASES.keys():
-            aliases = RULE_PROP_ALIASES[this.name]
-            for alias in aliases:
-                if that.name == alias:
-                    result = True
-                    break
-
-        return result
+        return this.id == that.id
 
     def equals(self, rule):
         result = True
@@ -173,6 +286,12 @@ class Rule:
         return (string[0:1] == '-' or string[0:1] == '!')
 
     def parseLine(self, line):
+        self.properties.extend(self.parseProperties(line))
+
+    def parseProperties(self, line):
+        """Return the Property list of a rule line"""
+
+        result = []
         if len(line) > 0:
             parts = line.split()
             index = 0
@@ -202,11 +321,13 @@ class Rule:
                     argValue = argValue.strip()
 
                 if self.validateProp(argName, argValue):
-                    self.properties.append(Property(argName, argValue))
+                    result.append(Property(argName, argValue))
 
                 if index >= len(parts):
                     done = True
 
+        return result
+
     def validateProp(self, name, value):
         result = True
 
@@ -240,13 +361,191 @@ class Rule:
         #return self.getProperty("-j")
         return target
 
-class Chain:
+    def isGoto(self):
+        """True if the target is reached with -g, so that it doesn't return to this chain"""
+
+        return self.getProperty("-j") is None and self.getProperty("-g") is not None
+
+class LazyRule(Rule):
+    """
+    A Rule that keeps its raw text and parses it the first time its
+    properties are needed. The target is found with a cheap scan of the text.
+    A rule may be read by an 'iptables-restore --test' thread while the main
+    thread parses it, so the text is dropped only once the parsed properties
+    are complete, and readers take a local copy of it.
+    """
+
+    __slots__ = ('text', 'parsed')
+
+    def __init__(self, line):
+        self.text = canonicalLine(line)
+        self.parsed = None
+
+    def isParsed(self):
+        return self.parsed is not None
+
+    def getText(self):
+        """The raw text of the rule, None once it has been parsed"""
+
+        return self.text
+
+    def dropText(self):
+        self.text = None
+
+    def getParsedProperties(self):
+        result = self.parsed
+        if result is None:
+            text = self.getText()
+            if text is not None:
+                result = self.parseProperties(text)
+                self.parsed = result
+                self.dropText()
+            else:
+                # parsed by another thread in the meantime
+                result = self.parsed
+
+        return result
+
+    properties = property(getParsedProperties)
+
+    def getTarget(self):
+        result = None
+        text = self.getText()
+        if text is not None:
+            result = scanTarget(text)
+        else:
+            result = Rule.getTarget(self)
+
+        return result
+
+    def isGoto(self):
+        result = None
+        text = self.getText()
+        if text is not None:
+            result = scanOption(text, "-j") is None and scanOption(text, "-g") is not None
+        else:
+            result = Rule.isGoto(self)
+
+        return result
+
+    def toStr(self, removeTable=False):
+        result = None
+        text = self.getText()
+        if text is not None and not (removeTable and text.find("-A") != -1):
+            result = text
+        else:
+            result = Rule.toStr(self, removeTable)
+
+        return result
+
+class RuleView(Rule):
+    """A lightweight Rule reading its properties from a RuleStore"""
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def getPropertyRange(self):
+        offsets = self.store.offsets
+        return offsets[self.index], offsets[self.index + 1]
+
+    def getPropertiesList(self):
+        result = []
+        nameIds = self.store.nameIds
+        values = self.store.values
+        start, end = self.getPropertyRange()
+
+        for i in range(start, end):
+            result.append(Property(getOptionName(nameIds[i]), values[i]))
+
+        return result
+
+    properties = property(getPropertiesList)
+
+    def getProperty(self, name):
+        value = None
+        nameId = getOptionId(name)
+        nameIds = self.store.nameIds
+        start, end = self.getPropertyRange()
+
+        for i in range(start, end):
+            if nameIds[i] == nameId:
+                value = True
+                if self.store.values[i] is not None:
+                    value = self.store.values[i]
+
+                break
+
+        return value
+
+class RuleStore(object):
+    """
+    Columnar storage for the rules of a chain.
+    Property names are stored as their option id (see matchers.getOptionId),
+    values in a flat list, and offsets[i]:offsets[i+1] is the slice of rule #i.
+    Indexing a store returns a RuleView.
+    """
+
+    __slots__ = ('nameIds', 'values', 'offsets')
+
+    def __init__(self, rules=None):
+        self.nameIds = array('H')
+        self.values = []
+        self.offsets = array('L', [0])
+
+        if rules is not None:
+            for rule in rules:
+                self.append(rule)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index = index + len(self)
+
+        if index < 0 or index >= len(self):
+            raise IndexError("rule index out of range")
+
+        return RuleView(self, index)
+
+    def __iter__(self):
+        for index in range(0, len(self)):
+            yield RuleView(self, index)
+
+    def append(self, rule):
+        for prop in rule.properties:
+            self.nameIds.append(prop.id)
+            self.values.append(prop.value)
+
+        self.offsets.append(len(self.values))
+
+    def remove(self, view):
+        start, end = view.getPropertyRange()
+        size = end - start
+
+        del self.nameIds[start:end]
+        del self.values[start:end]
+        del self.offsets[view.index + 1]
+
+        for i in range(view.index + 1, len(self.offsets)):
+            self.offsets[i] -= size
+
+class Chain(object):
+    __slots__ = ('rows', 'name', 'builtin', 'policy', 'complete', 'parent', 'table', 'source', 'unordered', 'counters')
+
     def __init__(self, name, parent, rows=None, policy="-"):
-        self.rows = []
-        self.name = name
+        self.rows = self.newRows()
+        self.name = intern(name)
         self.builtin = False
-        self.policy = policy
+        self.policy = intern(policy)
         self.complete = False
+        self.source = None
+        self.unordered = False
+        self.table = None
+        self.counters = None
 
         self.setParent(parent)
         if rows is not None:
@@ -256,6 +555,13 @@ class Chain:
     def __len__(self):
         return len(self.rows)
 
+    def newRows(self):
+        result = []
+        if COMPACT_RULES:
+            result = RuleStore()
+
+        return result
+
     def getChildrenNames(self):
         childrenNames = []
         #for child in self.getChildren():
@@ -298,11 +604,19 @@ class Chain:
 
         return result
 
-    def equals(self, chain):
+    def equals(self, chain, unordered=False):
+        """
+        Compare the policy and the rules of two chains. The rules are compared
+        in order, unless unordered is set or one of the chains is unordered.
+        """
+
         result = True
 
         if self.getPolicy() != chain.getPolicy():
             result = False
+        elif unordered or self.isUnordered() or chain.isUnordered():
+            (missing, added) = multisetDiff(self.getRules(), chain.getRules())
+            result = len(missing) == 0 and len(added) == 0
         elif len(self) == 0 and len(self) == len(chain):
             pass
         elif len(self) != len(chain):
@@ -319,6 +633,12 @@ class Chain:
 
         return result
 
+    def isUnordered(self):
+        return self.unordered
+
+    def setUnordered(self, unordered):
+        self.unordered = unordered
+
     def isComplete(self):
         return self.complete
 
@@ -340,32 +660,96 @@ class Chain:
         for row in self.rows:
             if row.equals(rule):
                 self.rows.remove(row)
+                self.source = None
+                self.counters = None
                 result = True
                 break
 
         return result
 
+    def setSource(self, fileName, lineNumbers):
+        """Record the file the rules were read from, and the line number of each rule in it"""
+
+        self.source = (fileName, lineNumbers)
+
+    def getRuleSource(self, index):
+        """Return the (file name, line number) rule index was read from, or None if unknown"""
+
+        result = None
+        if self.source is not None:
+            (fileName, lineNumbers) = self.source
+            if index >= 0 and index < len(lineNumbers):
+                result = (fileName, lineNumbers[index])
+
+        return result
+
+    def setCounters(self, policyCounters, ruleCounters):
+        """
+        Record the counters read with 'iptables-save -c': the (packets, bytes)
+        of the policy, or None for user chains, and an array with the packets
+        and bytes of each rule, one after the other
+        """
+
+        self.counters = (policyCounters, ruleCounters)
+
+    def hasCounters(self):
+        return self.counters is not None
+
+    def getPolicyCounters(self):
+        """Return the (packets, bytes) that hit the policy, or None if unknown"""
+
+        result = None
+        if self.counters is not None:
+            result = self.counters[0]
+
+        return result
+
+    def getRuleCounters(self, index):
+        """Return the (packets, bytes) matched by rule index, or None if unknown"""
+
+        result = None
+        if self.counters is not None:
+            ruleCounters = self.counters[1]
+            if index >= 0 and 2 * index + 1 < len(ruleCounters):
+                result = (ruleCounters[2 * index], ruleCounters[2 * index + 1])
+
+        return result
+
     def setParent(self, parent):
         self.parent = parent
         if parent is not None:
             if isinstance(parent, Table):
                 self.builtin = TABLE_CHAINS_EX[parent.getName()]
+                self.table = parent
+            elif parent.table is not None:
+                self.table = parent.table
 
     def isChain(self):
         return not self.parent is None
 
     # The root chain (=one of the builtin chains in the table)
     def getRootChain(self, child=None):
-        if self.parent is not None:
-            return self.parent.getRootChain(child=self)
-        else:
-            return child
+        # chains jumping to each other can make their parents loop
+        result = child
+        current = self
+        seen = set()
+        while current.parent is not None and id(current) not in seen:
+            seen.add(id(current))
+            result = current
+            current = current.parent
+
+        return result
 
     def getRoot(self):
-        if self.parent is not None:
-            return self.parent.getRoot()
-        else:
-            return self
+        result = self.table
+        if result is None:
+            result = self
+            seen = set()
+            while result.parent is not None and id(result) not in seen:
+                seen.add(id(result))
+                result = result.parent
+
+        return result
 
     def getChildren(self):
         parentTable = self.getRoot()
@@ -381,20 +765,30 @@ class Chain:
         return self.policy
 
     def setPolicy(self, policy):
-        self.policy = policy
+        self.policy = intern(policy)
 
     def getRules(self):
         return self.rows
 
+    def setRules(self, rows):
+        """Use rows, any sequence of rules with append and remove, as the rules of the chain"""
+
+        self.rows = rows
+
     def purge(self):
-        self.rows = []
+        self.rows = self.newRows()
+        self.source = None
+        self.counters = None
 
 class Table(Chain):
+    __slots__ = ('_chains', '_chainIndex')
+
     def __init__(self, name, *args, **kwargs):
         Chain.__init__(self, name, None, *args, **kwargs)
 
-        # The chains in this table
+        # The chains in this table, and the same chains by name
         self._chains = []
+        self._chainIndex = {}
 
     def __len__(self):
         return len(self._chains)
@@ -414,26 +808,59 @@ class Table(Chain):
         return result
 
     def getChainsTree(self, parentChainName=None ):
-        tree = {}
-        if parentChainName is None:
-            topChains = self.getBuiltinChains()
+        """
+        Return the chains jumped to from parentChainName, or from the top
+        level chains, as nested ordered dicts: chain name -> its own subtree.
+        The subtree of a chain is a single dict shared by all the chains
+        jumping to it, so the tree is built in one pass over the rules; loops
+        between chains make the dicts loop too.
+        Top level chains are the builtin ones, those nobody jumps to and,
+        in the end, those only reachable through a loop.
+        """
 
-            # if a chain has no referers, it's at the top level
-            for chain in self.chains():
-                chainName = chain.getName()
-                referers = chain.getReferers()
-                if len(referers) == 0:
-                    topChains.append(chainName)
+        position = {}
+        for chain in self._chains:
+            position[chain.getName()] = len(position)
+
+        nodes = {}
+        for chain in self._chains:
+            nodes[chain.getName()] = OrderedDict()
 
-            for chainName in topChains:
-                tree[chainName] = self.getChainsTree(chainName)
+        referenced = set()
+        for chain in self._chains:
+            children = [name for name in chain.getChildrenNames() if name in position]
+            children.sort(key=position.get)
+
+            node = nodes[chain.getName()]
+            for child in children:
+                node[child] = nodes[child]
+                referenced.add(child)
 
+        if parentChainName is not None:
+            tree = nodes.get(parentChainName, OrderedDict())
         else:
-            for chain in self.chains():
-                chainName = chain.getName()
-                referers = chain.getReferers()
-                if parentChainName in referers:
-                    tree[chainName] = self.getChainsTree(chainName)
+            tree = OrderedDict()
+            for chainName in self.getBuiltinChains():
+                if chainName in nodes:
+                    tree[chainName] = nodes[chainName]
+
+            for chain in self._chains:
+                if chain.getName() not in referenced:
+                    tree[chain.getName()] = nodes[chain.getName()]
+
+            # chains that jump to each other, but are not reached from the chains above
+            reached = set()
+            pending = tree.keys()
+            for chain in self._chains:
+                while len(pending) > 0:
+                    chainName = pending.pop()
+                    if chainName not in reached:
+                        reached.add(chainName)
+                        pending.extend(nodes[chainName].keys())
+
+                if chain.getName() not in reached:
+                    tree[chain.getName()] = nodes[chain.getName()]
+                    pending.append(chain.getName())
 
         return tree
 
@@ -493,14 +920,9 @@ class Table(Chain):
         return result
 
     def getChain(self, name):
-        result = None
-        #log(60, "Gettign chain %s from table %s. Chains in table: \n%s" % (name, self.getName(), str(self._chains)))
-        for chain in self._chains:
-            if chain.getName() == name:
-                result = chain
-
+        result = self._chainIndex.get(name)
         if result is None:
-            log(101, "Can't find chain %s in table %s. Chains in table: \n%s" % (name, self.getName(), str(self._chains)))
+            log(101, "Can't find chain %s in table %s" % (name, self.getName()))
 
         return result
 
@@ -514,6 +936,7 @@ class Table(Chain):
         chain = self.getChain(newChain.getName())
         if chain is None:
             self._chains.append(newChain)
+            self._chainIndex[newChain.getName()] = newChain
         else:
             raise Exception("Chain %s already exists in table %s" % (chain.getName(), self.name))
 
@@ -522,6 +945,7 @@ class Table(Chain):
         chain = self.getChain(chainToDelete.getName())
         if chain is not None:
             self._chains.remove(chain)
+            del self._chainIndex[chain.getName()]
             result = True
 
         return result
@@ -624,6 +1048,54 @@ class Table(Chain):
             if chain is not None:
                 yield chain
 
+class ChainDelta:
+    """
+    A set of changes to apply to some chains, leaving the others untouched:
+    chains whose content is replaced, single rules to be deleted, and chains
+    to be deleted.
+    """
+
+    def __init__(self):
+        self.tables = {}
+
+    def getTableChanges(self, tableName):
+        if tableName not in self.tables:
+            self.tables[tableName] = {'replace': [], 'deleteRules': [], 'delete': []}
+
+        return self.tables[tableName]
+
+    def replace(self, tableName, chain):
+        self.getTableChanges(tableName)['replace'].append(chain)
+
+    def deleteRule(self, tableName, chain, index):
+        self.getTableChanges(tableName)['deleteRules'].append( (chain, index) )
+
+    def delete(self, tableName, chainName):
+        self.getTableChanges(tableName)['delete'].append(chainName)
+
+    def getTableNames(self):
+        return sorted(self.tables.keys())
+
+    def getReplaced(self, tableName):
+        return self.getTableChanges(tableName)['replace']
+
+    def getDeletedRules(self, tableName):
+        """The (chain, rule index) pairs of the rules to delete"""
+
+        return self.getTableChanges(tableName)['deleteRules']
+
+    def getDeleted(self, tableName):
+        return self.getTableChanges(tableName)['delete']
+
+    def isEmpty(self):
+        result = True
+        for changes in self.tables.values():
+            if len(changes['replace']) > 0 or len(changes['deleteRules']) > 0 or len(changes['delete']) > 0:
+                result = False
+                break
+
+        return result
+
 class Ruleset:
     def __init__(self, name):
         self._tables = {}
@@ -661,13 +1133,13 @@ class Ruleset:
     def equals(self, otherConfig):
         result = True
         thisTables = len(self.getTables().keys())
-        otherTables = len(otherConfig.tables.keys())
+        otherTables = len(otherConfig.getTables().keys())
 
         if thisTables != otherTables:
             result = False
         else:
             for tableName in self.getTables().keys():
-                table = self.tables[tableName]
+                table = self.getTable(tableName)
                 otherTable = otherConfig.getTable(tableName)
 
                 if otherTable is None:
@@ -680,22 +1152,13 @@ class Ruleset:
 
         return result
 
-    def validate(self):
+    def validate(self, base=None):
         """Performs checks on the tables to ensure integrity.
-        Return a list of problems found, with an index (Critical, Warning, info) of their severity
+        Return the problems found, as lists of Finding indexed by severity (Critical, Warning, Info)
+        When base is given, only the chains of this ruleset are checked, jumping to those of base too
         """
 
-        result = { "Critical": [], "Warning": [], "Info": []}
-        tables = self.getTables()
-
-        # Check targets in each chain and ensure they are self-contained
-        for table in tables:
-            for chain in table.chains():
-                targets = chain.getChildrenNames()
-                for target in targets:
-                    c = table.getChain(target)
-                    if c is None:
-                        result['Critical'].append("Chain %s/%s refers to non-existant target %s" % table.getName(), chain.getName(), target)
-
-        return result
+        # the validator needs the table definitions of this module
+        from validator import Validator
+        return Validator(self, base).validate()
 
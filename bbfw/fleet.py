@@ -0,0 +1,277 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+
+
+import os, hashlib
+from elements import TABLES
+from matchers import canonicalLine
+from compare import MIN_PARALLEL_CHAINS, compareChainJob
+from logger import log
+
+# Drift kinds, as reported for every chain of a host
+CHANGED = "changed"
+MISSING = "missing"
+EXTRA = "extra"
+DRIFT_KINDS = [CHANGED, MISSING, EXTRA]
+
+# Extensions of dump files that are not part of the host name
+DUMP_SUFFIXES = [".save", ".rules"]
+
+
+class FleetException(Exception):
+    pass
+
+
+def getContentHash(policy, rules):
+    """A digest of a chain policy and of the text of its rules, in order"""
+
+    digest = hashlib.sha1(policy)
+    for rule in rules:
+        digest.update("\n")
+        digest.update(rule)
+
+    return digest.digest()
+
+def getHostName(fileName):
+    """The host of a dump: its file name, without a dump extension. Host names may contain dots"""
+
+    result = os.path.basename(fileName)
+    for suffix in DUMP_SUFFIXES:
+        if result.endswith(suffix) and len(result) > len(suffix):
+            result = result[0:-len(suffix)]
+            break
+
+    return result
+
+def scanDump(fileName):
+    """
+    Split an iptables-save dump into chains without parsing their rules.
+    Return (host, chains, error): chains maps (table, chain) to
+    (content hash, policy, rule lines), error is None unless the dump
+    can't be read.
+    """
+
+    host = getHostName(fileName)
+    chains = {}
+    error = None
+
+    try:
+        policies = {}
+        rules = {}
+        order = []
+        tableName = None
+
+        f = open(fileName, 'r')
+        for line in f:
+            line = line.strip()
+            if len(line) < 1 or line[0] == "#":
+                continue
+
+            if line[0] == "*":
+                tableName = line[1:]
+                if tableName not in TABLES:
+                    raise Exception("Table %s is not a valid iptables table" % tableName)
+
+            elif line == "COMMIT":
+                for chainName in order:
+                    chainRules = rules[chainName]
+                    policy = policies.get(chainName, "-")
+                    chains[(tableName, chainName)] = (getContentHash(policy, chainRules), policy, chainRules)
+
+                policies = {}
+                rules = {}
+                order = []
+                tableName = None
+
+            elif tableName is None:
+                raise Exception("Found line outside of a table: %s" % line)
+
+            elif line[0] == ":":
+                parts = line.split()
+                chainName = parts[0][1:]
+                policies[chainName] = parts[1]
+                if chainName not in rules:
+                    rules[chainName] = []
+                    order.append(chainName)
+
+            elif line[0:3] == "-A ":
+                parts = line.split(None, 2)
+                chainName = parts[1]
+                if chainName not in rules:
+                    rules[chainName] = []
+                    order.append(chainName)
+
+                if len(parts) > 2:
+                    rules[chainName].append(canonicalLine(parts[2]))
+                else:
+                    rules[chainName].append("")
+
+            else:
+                raise Exception("Found illegal line in table %s: %s" % (tableName, line))
+
+        f.close()
+
+        if tableName is not None:
+            raise Exception("Table %s is not committed" % tableName)
+
+    except Exception, e:
+        chains = {}
+        error = "%s" % e
+
+    return (host, chains, error)
+
+
+class FleetComparator:
+    """
+    Compare the iptables-save dumps of many hosts with the same config.
+    Dumps are split into chains by a pool of jobs processes. Chains are
+    identified by a hash of their content, so that every distinct chain
+    found in the fleet is compared with the config only once, no matter
+    how many hosts share it; chains with the same text as the config are
+    not parsed at all.
+    """
+
+    def __init__(self, config, jobs=1):
+        self.config = config
+        self.jobs = jobs
+        if self.jobs is None:
+            import multiprocessing
+            self.jobs = multiprocessing.cpu_count()
+
+        # (table, chain) -> (content hash, policy, rule lines, unordered) of the config
+        self.expected = {}
+        for tableName, table in config.getTables().items():
+            for chain in table.chains():
+                rules = [rule.toStr() for rule in chain.getRules()]
+                self.expected[(tableName, chain.getName())] = (getContentHash(chain.getPolicy(), rules), chain.getPolicy(), rules, chain.isUnordered())
+
+        self.hosts = {}
+        self.errors = {}
+        self.results = {}
+        self.chainCount = 0
+
+    def scan(self, fileNames):
+        """Split the dumps into chains, keeping the content of each distinct chain only once"""
+
+        contents = {}
+
+        dumps = {}
+        for fileName in fileNames:
+            host = getHostName(fileName)
+            if host in dumps:
+                raise FleetException("Dumps %s and %s are both for host %s" % (dumps[host], fileName, host))
+            dumps[host] = fileName
+
+        if self.jobs > 1 and len(fileNames) > 1:
+            from multiprocessing import Pool
+            pool = Pool(self.jobs)
+            try:
+                scans = pool.imap_unordered(scanDump, fileNames, max(1, len(fileNames) / (self.jobs * 4)))
+                self.addScans(scans, contents)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            self.addScans([scanDump(fileName) for fileName in fileNames], contents)
+
+        return contents
+
+    def addScans(self, scans, contents):
+        for host, chains, error in scans:
+            if error is not None:
+                log(1, "Can't read the dump of host %s: %s" % (host, error))
+                self.errors[host] = error
+                continue
+
+            hashes = {}
+            for key, chain in chains.items():
+                (contentHash, policy, rules) = chain
+                hashes[key] = contentHash
+                if key in self.expected and (key, contentHash) not in contents:
+                    contents[(key, contentHash)] = (policy, rules)
+
+            self.hosts[host] = hashes
+            self.chainCount += len(hashes)
+
+    def compare(self, fileNames):
+        contents = self.scan(fileNames)
+
+        candidates = []
+        for item, content in contents.items():
+            (key, contentHash) = item
+            (expectedHash, expectedPolicy, expectedRules, unordered) = self.expected[key]
+            if contentHash == expectedHash:
+                self.results[item] = True
+            else:
+                (policy, rules) = content
+                candidates.append( (item, unordered, expectedPolicy, expectedRules, policy, rules) )
+
+        log(50, "Found %s distinct chains in %s hosts, %s need to be compared rule by rule" % (len(contents), len(self.hosts), len(candidates)))
+
+        if self.jobs > 1 and len(candidates) >= MIN_PARALLEL_CHAINS:
+            from multiprocessing import Pool
+            pool = Pool(self.jobs)
+            try:
+                results = pool.map(compareChainJob, candidates, max(1, len(candidates) / (self.jobs * 4)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [compareChainJob(candidate) for candidate in candidates]
+
+        for item, result in results:
+            self.results[item] = result
+
+    def getUniqueChainCount(self):
+        return len(self.results)
+
+    def getHostNames(self):
+        return sorted(self.hosts.keys())
+
+    def getErrors(self):
+        return self.errors
+
+    def getDrift(self, host):
+        """
+        Return the list of (kind, table, chain) where the dump of host differs
+        from the config. Chains of tables the config doesn't manage are ignored
+        """
+
+        hashes = self.hosts[host]
+        result = []
+
+        for key in sorted(self.expected.keys()):
+            if key not in hashes:
+                result.append( (MISSING, key[0], key[1]) )
+            elif not self.results[(key, hashes[key])]:
+                result.append( (CHANGED, key[0], key[1]) )
+
+        tableNames = self.config.getTables().keys()
+        for key in sorted(hashes.keys()):
+            if key[0] in tableNames and key not in self.expected:
+                result.append( (EXTRA, key[0], key[1]) )
+
+        return result
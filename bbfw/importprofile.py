@@ -0,0 +1,89 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import __builtin__, sys, time
+
+
+class ImportProfiler:
+    """
+    Measure the time spent importing each module, by wrapping __import__.
+    Self time excludes the modules imported while importing a module,
+    cumulative time includes them.
+    """
+
+    def __init__(self):
+        self.original = None
+        self.stack = []
+        self.results = []
+
+    def install(self):
+        self.original = __builtin__.__import__
+        __builtin__.__import__ = self.profiledImport
+
+    def uninstall(self):
+        if self.original is not None:
+            __builtin__.__import__ = self.original
+            self.original = None
+
+    def profiledImport(self, name, *args, **kwargs):
+        before = len(sys.modules)
+        known = None
+        if before > 0:
+            known = set(sys.modules.keys())
+
+        self.stack.append(0.0)
+        start = time.time()
+        try:
+            return self.original(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            children = self.stack.pop()
+            if len(self.stack) > 0:
+                self.stack[-1] += elapsed
+
+            if len(sys.modules) != before:
+                loaded = [m for m in sys.modules.keys() if m not in known and sys.modules[m] is not None]
+                if len(loaded) > 0:
+                    self.results.append( (self.getModuleName(name, loaded), elapsed - children, elapsed) )
+
+    def getModuleName(self, name, loaded):
+        # implicit relative imports load 'package.name' for 'name'
+        result = sorted(loaded)[-1]
+        for module in loaded:
+            if module == name or module.endswith("." + name):
+                result = module
+                break
+
+        return result
+
+    def report(self, limit=30):
+        lines = ["%10s %10s  %s" % ("self ms", "cumul ms", "module")]
+        results = sorted(self.results, key=lambda r: r[2], reverse=True)
+        for name, selfTime, cumulative in results[0:limit]:
+            lines.append("%10.2f %10.2f  %s" % (selfTime * 1000, cumulative * 1000, name))
+
+        total = sum([r[1] for r in self.results])
+        lines.append("%10.2f %10s  total (%s modules)" % (total * 1000, "", len(self.results)))
+
+        return "\n".join(lines)
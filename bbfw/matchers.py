@@ -21,9 +21,39 @@
 # THE SOFTWARE.
 
 
+import threading
+from addresses import parseNetwork, parseAddressRange, AddressException
+
+# Every option name, and each of its aliases, maps to the id of its canonical
+# name. Matchers and normalizers are stored in lists indexed by that id, and
+# rules are parsed with canonical names only, so '--source' and '-s' compare equal.
+OPTION_ALIASES = {
+    "-A": ["--append"],
+    "-s": ["--source", "--src"],
+    "-d": ["--destination", "--dst"],
+    "-p": ["--protocol"],
+    "-j": ["--jump"],
+    "-g": ["--goto"],
+    "-i": ["--in-interface"],
+    "-o": ["--out-interface"],
+    "-f": ["--fragment"],
+    "-m": ["--match", "--module"],
+    "-c": ["--set-counters"],
+    "--sport": ["--source-port"],
+    "--dport": ["--destination-port"],
+    "--sports": ["--source-ports"],
+    "--dports": ["--destination-ports"],
+}
+
+optionNames = []
+optionIds = {}
+optionAliases = set()
+matchers = []
+normalizers = []
 
-global matchers
-matchers = {}
+# unknown options are registered while rules are parsed, also by the
+# RestoreTest threads; lookups of registered options don't need the lock
+optionLock = threading.Lock()
 
 icmpcommontypes = { "echo-reply": 0,
                       "destination-unreachable": 3,
@@ -59,18 +89,8 @@ def propToBeIgnored(thisProp, thatRule):
 
     return result
 
-def getMatcher(prop):
-    global matchers
-    result = matchers["__default__"]
-    if matchers.has_key(prop.name):
-        result = matchers[prop.name]
-
-    return result
-
-def registerMatcher(name, matcher):
-    global matchers
-    if not matchers.has_key(name):
-        matchers[name] = matcher
+def noNormalizer(value):
+    return value
 
 def defaultMatcher(this, that):
     result = False
@@ -79,7 +99,89 @@ def defaultMatcher(this, that):
 
     return result
 
-registerMatcher("__default__", defaultMatcher)
+def normalizedMatcher(this, that):
+    """match 2 properties of the same option whose values are equal once normalized"""
+
+    result = False
+    if this.id == that.id:
+        normalizer = normalizers[this.id]
+        result = normalizer(this.value) == normalizer(that.value)
+
+    return result
+
+def registerOption(name, aliases=[]):
+    """Register an option and its aliases, return its id"""
+
+    optionLock.acquire()
+    try:
+        if name not in optionIds:
+            # ids are published last, so that lookups never see an id without its name
+            matchers.append(defaultMatcher)
+            normalizers.append(noNormalizer)
+            optionNames.append(intern(name))
+            optionIds[name] = len(optionNames) - 1
+
+        optionId = optionIds[name]
+        for alias in aliases:
+            optionIds[alias] = optionId
+            optionAliases.add(alias)
+    finally:
+        optionLock.release()
+
+    return optionId
+
+def getOptionId(name):
+    """Return the id of the canonical name of option name; unknown options are registered on the fly"""
+
+    result = optionIds.get(name)
+    if result is None:
+        result = registerOption(name)
+
+    return result
+
+def getOptionName(optionId):
+    return optionNames[optionId]
+
+def canonicalName(name):
+    return optionNames[getOptionId(name)]
+
+def canonicalLine(line):
+    """Replace the option aliases in a rule line with their canonical name"""
+
+    parts = line.split()
+    if not optionAliases.isdisjoint(parts):
+        for i in range(0, len(parts)):
+            if parts[i] in optionAliases:
+                parts[i] = optionNames[optionIds[parts[i]]]
+
+    return " ".join(parts)
+
+def getMatcher(prop):
+    return matchers[prop.id]
+
+def registerMatcher(name, matcher, normalizer=None):
+    """Set the matcher, and optionally the value normalizer, of option name and its aliases"""
+
+    optionId = getOptionId(name)
+    matchers[optionId] = matcher
+    if normalizer is not None:
+        normalizers[optionId] = normalizer
+
+def registerMatchers(options):
+    """
+    Register a batch of matchers, e.g. for an extension module.
+    options maps option names to a matcher, or to a (matcher, normalizer) pair.
+    """
+
+    for name, matcher in options.items():
+        normalizer = None
+        if isinstance(matcher, tuple):
+            (matcher, normalizer) = matcher
+
+        registerMatcher(name, matcher, normalizer)
+
+for name, aliases in OPTION_ALIASES.items():
+    registerOption(name, aliases)
 
 def setmarkMatcher(this, that):
     def validate(prop):
@@ -99,70 +201,46 @@ def setmarkMatcher(this, that):
 
     return result
 
-registerMatcher("--set-mark", setmarkMatcher)
-registerMatcher("--set-xmark", setmarkMatcher)
-
 def ipaddress_normalizer(value):
-    result = value
-    if result is not None and result.find("/") == -1:
-        result = "%s/32" % result
+    """
+    Turn a list of addresses into a tuple of (family, network, mask) integer
+    tuples, see addresses.parseNetwork. Old style negation ("! address") is
+    kept. Values that can't be parsed (e.g. host names) are compared as they are.
+    """
 
-    return result
-
-def ipprotocol_normalizer(value):
     result = value
-    if result is not None and result.find("/") == -1:
-        result = "%s/32" % result
+    if value is not None:
+        negated = value.startswith("!")
+        text = value.lstrip("!").strip()
+        try:
+            result = (negated, tuple([parseNetwork(a) for a in text.split(",")]))
+        except AddressException:
+            pass
 
     return result
 
-def ippropertyMatcher(this, that, validNames):
-    """match 2 properties containing IP addresses"""
+def nataddress_normalizer(value):
+    """Turn the address range of a NAT target into integers, see addresses.parseAddressRange"""
 
-    result = False
-
-    thisvalue = ipaddress_normalizer(this.value)
-    thatvalue = ipaddress_normalizer(that.value)
-
-    if this.name in validNames and that.name in validNames and thisvalue == thatvalue:
-        result = True
+    result = value
+    if value is not None:
+        try:
+            result = parseAddressRange(value)
+        except AddressException:
+            pass
 
     return result
 
-def dstpropertyMatcher(this, that):
-    return ippropertyMatcher(this, that, ['-d', '--dst', '--destination'])
-
-registerMatcher("-d", dstpropertyMatcher)
-registerMatcher("--destination", dstpropertyMatcher)
-registerMatcher("--dst", dstpropertyMatcher)
-
-def srcpropertyMatcher(this, that):
-    return ippropertyMatcher(this, that, ['-s', '--src', '--source'])
-
-registerMatcher("-s", srcpropertyMatcher)
-registerMatcher("--src", srcpropertyMatcher)
-registerMatcher("--source", srcpropertyMatcher)
-
-def ipprotocolMatcher(this, that):
-    """match 2 properties containing a protocol"""
-
-    result = False
-    thisvalue = ipprotocol_normalizer(this.value)
-    thatvalue = ipprotocol_normalizer(that.value)
-
-    if this.name == that.name and thisvalue == thatvalue:
-        result = True
+def ipprotocol_normalizer(value):
+    result = value
+    if result is not None and result.find("/") == -1:
+        result = "%s/32" % result
 
     return result
 
-registerMatcher("-p", ipprotocolMatcher)
-registerMatcher("--protocol", ipprotocolMatcher)
-
 def recentDefaults(this, that):
     return True
 
-registerMatcher("--rsource", recentDefaults)
-
 def optionalModuleSpecMatcher(this, that):
     protocols = ['tcp', 'udp', 'icmp']
     result = False
@@ -176,9 +254,6 @@ def optionalModuleSpecMatcher(this, that):
 
     return result
 
-registerMatcher("--module", optionalModuleSpecMatcher)
-registerMatcher("-m", optionalModuleSpecMatcher)
-
 def tcpflagsMatchGroup(groupSX, groupDX):
     result = True
     for flag in groupSX:
@@ -229,32 +304,21 @@ def tcpflagsMatcher(this, that):
 
     return result
 
-registerMatcher("--tcp-flags", tcpflagsMatcher )
-
-def logPrefixMatcher(this, that):
-    result = False
-
-    if this.value is not None and that.value is not None:
-        thisText = this.value[0:29]
-        thatText = that.value[0:29]
-        result = thisText == thatText
+def logPrefixNormalizer(value):
+    # iptables truncates log prefixes to 29 characters
+    result = value
+    if value is not None:
+        result = value[0:29]
 
     return result
 
-registerMatcher("--log-prefix", logPrefixMatcher )
-
-def commentMatcher(this, that):
-    result = False
-
-    if this.value is not None and that.value is not None:
-        thisText = ruleStringNormalizer(this.value)
-        thatText = ruleStringNormalizer(that.value)
-        result = thisText == thatText
+def commentNormalizer(value):
+    result = value
+    if value is not None:
+        result = ruleStringNormalizer(value)
 
     return result
 
-registerMatcher("--comment", commentMatcher )
-
 def getICMPValue(val):
     result = val
     if val is not None and (not val.isdigit()) and (val in icmpcommontypes.keys()):
@@ -262,20 +326,18 @@ def getICMPValue(val):
 
     return result
 
-def icmptypeMatcher(this, that):
-    result = False
-    newThis = str(this.value)
-    newThat = str(that.value)
-
-    if this.value != that.value:
-        newThis = getICMPValue(this.value)
-        newThat = getICMPValue(that.value)
-
-    if newThis == newThat:
-        result = True
-
-    return result
-
-registerMatcher("--icmp-type", icmptypeMatcher )
-
-
+registerMatchers({
+    "--set-mark": setmarkMatcher,
+    "--set-xmark": setmarkMatcher,
+    "-s": (normalizedMatcher, ipaddress_normalizer),
+    "-d": (normalizedMatcher, ipaddress_normalizer),
+    "--to-destination": (normalizedMatcher, nataddress_normalizer),
+    "--to-source": (normalizedMatcher, nataddress_normalizer),
+    "-p": (normalizedMatcher, ipprotocol_normalizer),
+    "--rsource": recentDefaults,
+    "-m": optionalModuleSpecMatcher,
+    "--tcp-flags": tcpflagsMatcher,
+    "--log-prefix": (normalizedMatcher, logPrefixNormalizer),
+    "--comment": (normalizedMatcher, commentNormalizer),
+    "--icmp-type": (normalizedMatcher, getICMPValue),
+})
@@ -0,0 +1,259 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import os, sys, time
+from snapshots import writeFileAtomically
+from logger import log
+from defaults import DEFAULT_METRICS
+
+# name -> (type, help), in the order they are written
+METRICS = [
+    ("bbfw_tables", "gauge", "Number of netfilter tables"),
+    ("bbfw_chains", "gauge", "Number of chains in a table"),
+    ("bbfw_rules", "gauge", "Number of rules in a chain"),
+    ("bbfw_max_jump_depth", "gauge", "Longest chain of jumps from a builtin chain of a table, loops excluded"),
+    ("bbfw_chain_rule_packets_total", "counter", "Packets matched by the rules of a chain"),
+    ("bbfw_chain_rule_bytes_total", "counter", "Bytes matched by the rules of a chain"),
+    ("bbfw_chain_policy_packets_total", "counter", "Packets that reached the policy of a builtin chain"),
+    ("bbfw_chain_policy_bytes_total", "counter", "Bytes that reached the policy of a builtin chain"),
+    ("bbfw_operation_duration_seconds", "gauge", "Duration of the last run of a bbfw operation"),
+    ("bbfw_operation_last_timestamp_seconds", "gauge", "Time of the last run of a bbfw operation"),
+    ("bbfw_config_drift", "gauge", "1 if the current rules differ from a configuration, 0 otherwise"),
+    ("bbfw_config_drift_chains", "gauge", "Number of chains that differ between the current rules and a configuration"),
+]
+
+# Metrics about past operations, kept from the previous file until they are replaced
+CARRIED_METRICS = ["bbfw_operation_duration_seconds", "bbfw_operation_last_timestamp_seconds", "bbfw_config_drift", "bbfw_config_drift_chains"]
+
+
+def escapeLabel(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def formatLabels(labels):
+    result = ""
+    if len(labels) > 0:
+        result = "{%s}" % ",".join(['%s="%s"' % (name, escapeLabel(value)) for name, value in labels])
+
+    return result
+
+def formatValue(value):
+    result = repr(value)
+    if isinstance(value, (int, long)) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+        result = "%d" % value
+
+    return result
+
+def getDriftedChains(comparator):
+    """The number of chains found different by a RulesetComparator"""
+
+    return len([equal for equal in comparator.getResults().values() if not equal])
+
+def getMaxJumpDepth(roots, edges):
+    """
+    Return the longest chain of jumps from the roots, following edges
+    (chain -> children). Jumps back to a chain being walked close a loop
+    and are not followed, so the walk ends on any graph.
+    """
+
+    WALKING = 1
+    DONE = 2
+    state = {}
+    depth = {}
+
+    result = 0
+    for root in roots:
+        if root in state:
+            result = max(result, depth[root])
+            continue
+
+        # (chain, index of the next child to follow)
+        stack = [ (root, 0) ]
+        state[root] = WALKING
+        depth[root] = 0
+
+        while len(stack) > 0:
+            (chainName, position) = stack[-1]
+            children = edges.get(chainName, [])
+
+            if position == len(children):
+                stack.pop()
+                state[chainName] = DONE
+                if len(stack) > 0:
+                    parent = stack[-1][0]
+                    depth[parent] = max(depth[parent], depth[chainName] + 1)
+                continue
+
+            stack[-1] = (chainName, position + 1)
+            child = children[position]
+
+            if child not in state:
+                state[child] = WALKING
+                depth[child] = 0
+                stack.append( (child, 0) )
+            elif state[child] == DONE:
+                depth[chainName] = max(depth[chainName], depth[child] + 1)
+
+        result = max(result, depth[root])
+
+    return result
+
+
+class Metrics:
+    """
+    The metrics of a ruleset and of the last bbfw operations, written as a
+    node_exporter textfile. Rule counts, jump depths and counters come from a
+    single pass over the rules of the ruleset that was already parsed.
+    """
+
+    def __init__(self):
+        # name -> {formatted labels: value}
+        self.samples = {}
+        for name, metricType, description in METRICS:
+            self.samples[name] = {}
+
+    def add(self, name, labels, value):
+        self.samples[name][formatLabels(labels)] = value
+
+    def addRuleset(self, ruleset):
+        tables = ruleset.getTables()
+        self.add("bbfw_tables", [], len(tables))
+
+        for tableName in sorted(tables.keys()):
+            table = tables[tableName]
+            self.add("bbfw_chains", [("table", tableName)], len(table))
+
+            roots = []
+            edges = {}
+            for chain in table.chains():
+                chainName = chain.getName()
+                labels = [("table", tableName), ("chain", chainName)]
+                if not table.isUserChain(chainName):
+                    roots.append(chainName)
+
+                children = []
+                edges[chainName] = children
+                count = 0
+                for rule in chain.getRules():
+                    count += 1
+                    target = rule.getTarget()
+                    if target is not None and target is not True and table.hasChain(target):
+                        children.append(target)
+
+                self.add("bbfw_rules", labels, count)
+
+                if chain.hasCounters():
+                    ruleCounters = chain.counters[1]
+                    self.add("bbfw_chain_rule_packets_total", labels, sum(ruleCounters[0::2]))
+                    self.add("bbfw_chain_rule_bytes_total", labels, sum(ruleCounters[1::2]))
+
+                    policyCounters = chain.getPolicyCounters()
+                    if policyCounters is not None:
+                        self.add("bbfw_chain_policy_packets_total", labels, policyCounters[0])
+                        self.add("bbfw_chain_policy_bytes_total", labels, policyCounters[1])
+
+            self.add("bbfw_max_jump_depth", [("table", tableName)], getMaxJumpDepth(roots, edges))
+
+    def addOperation(self, operation, duration, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        labels = [("operation", operation)]
+        self.add("bbfw_operation_duration_seconds", labels, duration)
+        self.add("bbfw_operation_last_timestamp_seconds", labels, timestamp)
+
+    def addDrift(self, configName, drifted):
+        """The number of chains that differ between the rules and configName"""
+
+        labels = [("config", configName)]
+        self.add("bbfw_config_drift", labels, int(drifted > 0))
+        self.add("bbfw_config_drift_chains", labels, drifted)
+
+    def carryOver(self, fileName):
+        """Keep the operations and drift found in fileName that were not replaced"""
+
+        if not os.path.isfile(fileName):
+            return
+
+        f = open(fileName)
+        try:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+
+                parts = line.strip().rsplit(" ", 1)
+                if len(parts) != 2:
+                    continue
+
+                (sample, value) = parts
+                brace = sample.find("{")
+                if brace == -1:
+                    (name, labels) = (sample, "")
+                else:
+                    (name, labels) = (sample[0:brace], sample[brace:])
+
+                if name in CARRIED_METRICS and labels not in self.samples[name]:
+                    try:
+                        self.samples[name][labels] = float(value)
+                    except ValueError:
+                        log(20, "Ignoring unreadable sample in %s: %s" % (fileName, line.strip()))
+        finally:
+            f.close()
+
+    def renderLines(self):
+        for name, metricType, description in METRICS:
+            samples = self.samples[name]
+            if len(samples) == 0:
+                continue
+
+            yield "# HELP %s %s" % (name, description)
+            yield "# TYPE %s %s" % (name, metricType)
+            for labels in sorted(samples.keys()):
+                yield "%s%s %s" % (name, labels, formatValue(samples[labels]))
+
+    def render(self):
+        return "\n".join(self.renderLines()) + "\n"
+
+    def write(self, fileName=DEFAULT_METRICS):
+        """
+        Replace fileName with the metrics, in one rename so the collector never
+        reads a partial file. '-' writes to stdout.
+        """
+
+        if fileName == "-":
+            sys.stdout.write(self.render())
+        else:
+            self.carryOver(fileName)
+            # the collector usually runs as another user
+            writeFileAtomically(fileName, self.render(), 0644)
+            log(50, "Metrics written to %s" % fileName)
+
+def writeMetrics(fileName, ruleset, operation, duration, configName, drifted):
+    """The hook of load and compare: write what they already know, without reading netfilter again"""
+
+    metrics = Metrics()
+    metrics.addRuleset(ruleset)
+    metrics.addOperation(operation, duration)
+    metrics.addDrift(configName, drifted)
+
+    metrics.write(fileName)
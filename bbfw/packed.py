@@ -0,0 +1,362 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import os, mmap, struct, tempfile
+from elements import LazyRule
+
+# File layout, all integers in network order:
+#   header
+#   table records   (name, first chain, chain count)
+#   chain records   (name, policy, parent chain name, source file name, first rule,
+#                    rule count, flags)
+#   rule records    (text, line number in the source file)
+#   rule signatures (Rule.getSignature(), SIGNATURE_SIZE bytes per rule)
+#   strings         (every name and rule text referenced by the records)
+# Strings are referenced by (offset, length) relative to the strings area.
+# The source file name is empty, and the line numbers 0, for chains that
+# were not read from a config folder.
+
+MAGIC = "BBFWPK04"
+HEADER = struct.Struct("!8sIIIQQQQQ")
+TABLE_RECORD = struct.Struct("!QIII")
+CHAIN_RECORD = struct.Struct("!QIQIQIQIIII")
+RULE_RECORD = struct.Struct("!QII")
+SIGNATURE_SIZE = 20
+
+# chain record flags
+CHAIN_UNORDERED = 1
+
+
+class PackedFormatException(Exception):
+    pass
+
+
+def isPacked(fileName):
+    result = False
+    if os.path.isfile(fileName):
+        data = open(fileName, 'rb')
+        result = data.read(len(MAGIC)) == MAGIC
+        data.close()
+
+    return result
+
+class PackedWriter:
+    """Compile a Ruleset into a single packed file"""
+
+    def __init__(self, ruleset):
+        self.ruleset = ruleset
+        self.strings = []
+        self.stringsSize = 0
+        self.stringOffsets = {}
+
+    def addString(self, text):
+        """Add text to the strings area, identical strings are stored once"""
+
+        if text not in self.stringOffsets:
+            self.stringOffsets[text] = self.stringsSize
+            self.strings.append(text)
+            self.stringsSize += len(text)
+
+        return self.stringOffsets[text], len(text)
+
+    def write(self, fileName):
+        tables = []
+        chains = []
+        rules = []
+        signatures = []
+
+        for tableName in sorted(self.ruleset.getTables().keys()):
+            table = self.ruleset.getTable(tableName)
+            offset, length = self.addString(tableName)
+            tables.append(TABLE_RECORD.pack(offset, length, len(chains), len(table)))
+
+            for chain in table.chains():
+                nameOffset, nameLength = self.addString(chain.getName())
+                policyOffset, policyLength = self.addString(chain.getPolicy())
+
+                # the chain jumping to this one, so that the reader doesn't scan the rules for it
+                parentName = ""
+                parent = chain.getParent()
+                if parent is not None and not parent is table:
+                    parentName = parent.getName()
+                parentOffset, parentLength = self.addString(parentName)
+
+                # where the rules come from, to report load errors against the config files
+                sourceName = ""
+                lineNumbers = []
+                if chain.source is not None:
+                    # the packed file can be used from another directory
+                    (sourceName, lineNumbers) = chain.source
+                    sourceName = os.path.abspath(sourceName)
+                sourceOffset, sourceLength = self.addString(sourceName)
+
+                flags = 0
+                if chain.isUnordered():
+                    flags |= CHAIN_UNORDERED
+
+                chains.append(CHAIN_RECORD.pack(nameOffset, nameLength, policyOffset, policyLength,
+                    parentOffset, parentLength, sourceOffset, sourceLength, len(rules), len(chain), flags))
+
+                for index, rule in enumerate(chain.getRules()):
+                    offset, length = self.addString(rule.toStr())
+                    lineNumber = 0
+                    if index < len(lineNumbers):
+                        lineNumber = lineNumbers[index]
+                    rules.append(RULE_RECORD.pack(offset, length, lineNumber))
+                    signatures.append(rule.getSignature())
+
+        tablesOffset = HEADER.size
+        chainsOffset = tablesOffset + len(tables) * TABLE_RECORD.size
+        rulesOffset = chainsOffset + len(chains) * CHAIN_RECORD.size
+        signaturesOffset = rulesOffset + len(rules) * RULE_RECORD.size
+        stringsOffset = signaturesOffset + len(signatures) * SIGNATURE_SIZE
+
+        header = HEADER.pack(MAGIC, len(tables), len(chains), len(rules), tablesOffset, chainsOffset, rulesOffset, signaturesOffset, stringsOffset)
+
+        folderName = os.path.dirname(os.path.abspath(fileName))
+        (fd, tmpName) = tempfile.mkstemp(prefix=".%s." % os.path.basename(fileName), dir=folderName)
+        try:
+            f = os.fdopen(fd, 'wb')
+            f.write(header)
+            for part in [tables, chains, rules, signatures, self.strings]:
+                f.write("".join(part))
+            f.close()
+            os.chmod(tmpName, 0644)
+            os.rename(tmpName, fileName)
+        except:
+            os.remove(tmpName)
+            raise
+
+        return len(rules)
+
+class PackedConfig:
+    """
+    Read access to a packed file. The file is memory mapped, and tables,
+    chains and rules are only decoded when they are requested. The map stays
+    open as long as the rules read from it are in use.
+    """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        data = open(fileName, 'rb')
+        try:
+            self.data = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            data.close()
+
+        if len(self.data) < HEADER.size:
+            raise PackedFormatException("File %s is too short to be a packed config" % fileName)
+
+        (magic, self.tableCount, self.chainCount, self.ruleCount, self.tablesOffset, self.chainsOffset,
+            self.rulesOffset, self.signaturesOffset, self.stringsOffset) = HEADER.unpack_from(self.data, 0)
+
+        if magic != MAGIC:
+            raise PackedFormatException("File %s is not a packed config" % fileName)
+
+        self.tableIndex = None
+
+    def close(self):
+        self.data.close()
+
+    def getString(self, offset, length):
+        start = self.stringsOffset + offset
+        return self.data[start:start + length]
+
+    def getTableIndex(self):
+        """Return {table name: (first chain, chain count)}"""
+
+        if self.tableIndex is None:
+            self.tableIndex = {}
+            for i in range(0, self.tableCount):
+                (offset, length, firstChain, count) = TABLE_RECORD.unpack_from(self.data, self.tablesOffset + i * TABLE_RECORD.size)
+                self.tableIndex[self.getString(offset, length)] = (firstChain, count)
+
+        return self.tableIndex
+
+    def getTableNames(self):
+        return sorted(self.getTableIndex().keys())
+
+    def getChains(self, tableName):
+        """
+        Return a list of (chain name, policy, parent chain name, source file
+        name, first rule, rule count, flags) for table tableName. The parent
+        name is empty for the chains no other chain jumps to, the source name
+        for the chains not read from a config folder.
+        """
+
+        result = []
+        index = self.getTableIndex()
+        if tableName in index:
+            (firstChain, count) = index[tableName]
+            for i in range(firstChain, firstChain + count):
+                (nameOffset, nameLength, policyOffset, policyLength, parentOffset, parentLength,
+                    sourceOffset, sourceLength, firstRule, ruleCount, flags) = CHAIN_RECORD.unpack_from(self.data, self.chainsOffset + i * CHAIN_RECORD.size)
+                result.append( (self.getString(nameOffset, nameLength), self.getString(policyOffset, policyLength),
+                    self.getString(parentOffset, parentLength), self.getString(sourceOffset, sourceLength),
+                    firstRule, ruleCount, flags) )
+
+        return result
+
+    def getRuleText(self, index):
+        (offset, length, lineNumber) = RULE_RECORD.unpack_from(self.data, self.rulesOffset + index * RULE_RECORD.size)
+        return self.getString(offset, length)
+
+    def getRuleLine(self, index):
+        (offset, length, lineNumber) = RULE_RECORD.unpack_from(self.data, self.rulesOffset + index * RULE_RECORD.size)
+        return lineNumber
+
+    def getRuleSignature(self, index):
+        start = self.signaturesOffset + index * SIGNATURE_SIZE
+        return self.data[start:start + SIGNATURE_SIZE]
+
+    def getRules(self, firstRule, count):
+        """Return the rules firstRule to firstRule + count, read from the map when they are accessed"""
+
+        return PackedRules(self, firstRule, count)
+
+    def getLineNumbers(self, firstRule, count):
+        """Return the source line numbers of the rules firstRule to firstRule + count, read from the map when they are accessed"""
+
+        return PackedLineNumbers(self, firstRule, count)
+
+class PackedRule(LazyRule):
+    """
+    A LazyRule whose text is read from the map of a packed file until it is
+    parsed, and whose signature is the one stored in the file.
+    """
+
+    __slots__ = ('packed', 'index')
+
+    def __init__(self, packed, index):
+        self.packed = packed
+        self.index = index
+        self.text = None
+        self.parsed = None
+
+    def getText(self):
+        result = None
+        if self.parsed is None:
+            result = self.packed.getRuleText(self.index)
+
+        return result
+
+    def dropText(self):
+        # the text lives in the map
+        pass
+
+    def getSignature(self):
+        return self.packed.getRuleSignature(self.index)
+
+    def isRecord(self, rule):
+        """True if rule was read from the same record of the same file"""
+
+        return isinstance(rule, PackedRule) and rule.packed is self.packed and rule.index == self.index
+
+class PackedRules(object):
+    """
+    The rules of a chain in a packed file. Rules are created when they are
+    accessed; the sequence becomes a plain list when it is changed.
+    """
+
+    __slots__ = ('packed', 'first', 'count', 'rules')
+
+    def __init__(self, packed, first, count):
+        self.packed = packed
+        self.first = first
+        self.count = count
+        self.rules = None
+
+    def __len__(self):
+        result = self.count
+        if self.rules is not None:
+            result = len(self.rules)
+
+        return result
+
+    def __getitem__(self, index):
+        result = None
+        if self.rules is not None:
+            result = self.rules[index]
+        else:
+            if index < 0:
+                index = index + self.count
+
+            if index < 0 or index >= self.count:
+                raise IndexError("rule index out of range")
+
+            result = PackedRule(self.packed, self.first + index)
+
+        return result
+
+    def __iter__(self):
+        if self.rules is not None:
+            for rule in self.rules:
+                yield rule
+        else:
+            for index in range(self.first, self.first + self.count):
+                yield PackedRule(self.packed, index)
+
+    def getList(self):
+        if self.rules is None:
+            self.rules = list(iter(self))
+
+        return self.rules
+
+    def append(self, rule):
+        self.getList().append(rule)
+
+    def remove(self, rule):
+        rules = self.getList()
+        found = None
+        for index in range(0, len(rules)):
+            if rules[index] is rule or (isinstance(rules[index], PackedRule) and rules[index].isRecord(rule)):
+                found = index
+                break
+
+        if found is None:
+            raise ValueError("rule not in chain")
+
+        del rules[found]
+
+class PackedLineNumbers(object):
+    """The source line numbers of the rules of a chain in a packed file, see Chain.setSource()"""
+
+    __slots__ = ('packed', 'first', 'count')
+
+    def __init__(self, packed, first, count):
+        self.packed = packed
+        self.first = first
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index = index + self.count
+
+        if index < 0 or index >= self.count:
+            raise IndexError("line number index out of range")
+
+        return self.packed.getRuleLine(self.first + index)
@@ -24,8 +24,11 @@
 
 
 import os, traceback
+from array import array
 
-from elements import TABLES, Ruleset, Rule, Table, Chain, TablePropsException
+from elements import TABLES, UNORDERED_MARKER, Ruleset, Table, Chain, TablePropsException, newRule
+from packed import PackedConfig, CHAIN_UNORDERED
+from compare import getChainSignature
 from logger import log
 
 
@@ -50,6 +53,17 @@ class RulesParser:
 
         return buffer
 
+    def getLineNumbers(self, noComments=False):
+        """Return the line numbers (1 based) of the lines returned by getLines()"""
+
+        numbers = array('l')
+        for i in range(0, len(self.lines)):
+            line = self.lines[i]
+            if not noComments or (not line.startswith("#") and len(line) > 0):
+                numbers.append(i + 1)
+
+        return numbers
+
 class FileReader(RulesParser):
     def __init__(self, f):
 
@@ -74,14 +88,28 @@ class FileReader(RulesParser):
 
 class Parser():
     def __init__(self):
-        pass
+        self.ruleFactory = newRule
+        self.tableFilter = None
+        self.chainFilter = None
+
+    def setFilter(self, table=None, chain=None):
+        """Only parse the specified table and chain; the others are skipped without being read or tokenized"""
+
+        self.tableFilter = table
+        self.chainFilter = chain
+
+    def selectsTable(self, tableName):
+        return self.tableFilter is None or tableName == self.tableFilter
+
+    def selectsChain(self, chainName):
+        return self.chainFilter is None or chainName == self.chainFilter
 
     def resetChainLines(self):
         self.chainLines = {}
 
     def addNewChain(self, chainName):
-        if chainName not in self.chainLines.keys():
-            self.chainLines[chainName] = {'policy': "-", 'rules': [] }
+        if chainName not in self.chainLines:
+            self.chainLines[chainName] = {'policy': "-", 'rules': [], 'source': None, 'lineNumbers': None, 'unordered': False, 'policyCounters': None, 'counters': None }
 
     def parseTableChains(self, table):
         chainNesting = []
@@ -90,23 +118,52 @@ class Parser():
             stdTargets = table.getStandardTargets(chainName)
             chain = Chain(chainName, table)
             chain.setPolicy(self.chainLines[chainName]['policy'])
+            chain.setUnordered(self.chainLines[chainName]['unordered'])
             parent = table
 
-            for line in self.chainLines[chainName]['rules']:
+            # where each rule comes from, to report load errors against the config files
+            sourceLines = self.chainLines[chainName]['lineNumbers']
+            ruleLines = array('l')
+
+            # the counters read with iptables-save -c, if any
+            counterValues = self.chainLines[chainName]['counters']
+            ruleCounters = None
+            if counterValues is not None:
+                ruleCounters = array('L')
+
+            for i, line in enumerate(self.chainLines[chainName]['rules']):
                 if len(line) > 1:
-                    rule = Rule(line)
+                    rule = self.ruleFactory(line)
                     chain.append(rule)
+                    if sourceLines is not None:
+                        ruleLines.append(sourceLines[i])
+                    if counterValues is not None:
+                        ruleCounters.extend(counterValues[2 * i:2 * i + 2])
                     target = rule.getTarget()
                     if target is not None and target not in stdTargets:
                         chainNesting.append( (chainName, target)  )   # (master, slave)
                 else:
                     log(71, "While parsing %s/%s found an empty line: %s" % (table.getName(), chainName, line))
 
+            if sourceLines is not None:
+                chain.setSource(self.chainLines[chainName]['source'], ruleLines)
+
+            policyCounters = self.chainLines[chainName]['policyCounters']
+            if ruleCounters is not None or policyCounters is not None:
+                if ruleCounters is None:
+                    ruleCounters = array('L')
+                chain.setCounters(policyCounters, ruleCounters)
+
             #traceback.print_stack()
             # the chain has been parsed. Shall we add it to the table?
             currentChain = table.getChain(chainName)
             if currentChain is not None:
                 if currentChain.equals(chain):
+                    if chain.source is not None:
+                        currentChain.setSource(*chain.source)
+                    if chain.counters is not None:
+                        currentChain.setCounters(*chain.counters)
+                    currentChain.setUnordered(chain.isUnordered())
                     log(71, "The new chain parsed for %s/%s is identical to the one already in the table, ignored" % (table.getName(), chainName))
                 else:
                     table.removeChain(currentChain)
@@ -121,6 +178,8 @@ class Parser():
             c = table.getChain(child)
             if p is not None and c is not None:
                 c.setParent(p)
+            elif self.chainFilter is not None:
+                log(71, "While parsing table %s skipped parent/child relationship with a chain not selected: %s -> %s" % (table.getName(), child, parent))
             else:
                 log(1, "While parsing table %s found illegal parent/child relationship: %s -> %s" % (table.getName(), child, parent))
 
@@ -137,16 +196,36 @@ class IPTSaveFileParser(Parser):
             conf = Ruleset("File Ruleset")
 
         currentTable = None
+        skipping = False
         for line in self.lines:
             if len(line) < 1:
                 continue
 
+            # the body of a table that isn't selected is only scanned for its end
+            if skipping:
+                skipping = line.find("COMMIT") != 0
+                continue
+
             if line.find("#") == 0:
                 continue
 
+            # 'iptables-save -c' puts the counters of each rule before it
+            counters = None
+            if line[0] == "[":
+                end = line.find("] ")
+                if end == -1:
+                    raise ParserException("Can't find the end of the counters in line '%s'" % line)
+                counters = self.parseCounters(line[0:end + 1])
+                if counters is None:
+                    raise ParserException("Can't read the counters in line '%s'" % line)
+                line = line[end + 2:]
+
             if line.find("*") == 0:
                 if currentTable is not None:
                     raise ParserException("Found new table %s while parsing table %s, aborting" % (tableName, currentTable))
+                if not self.selectsTable(line[1:]):
+                    skipping = True
+                    continue
                 currentTable = self.startTable(conf, line)
 
             elif line.find("COMMIT") == 0:
@@ -156,32 +235,72 @@ class IPTSaveFileParser(Parser):
 
             elif line[0:1] == ":":
                 policy, chainName = self.parsePolicy(currentTable, line)
-                self.addNewChain(chainName)
-                self.chainLines[chainName]['policy'] = policy
+                if self.selectsChain(chainName):
+                    self.addNewChain(chainName)
+                    self.chainLines[chainName]['policy'] = policy
+                    if policy != "-":
+                        self.chainLines[chainName]['policyCounters'] = self.parsePolicyCounters(line)
 
             elif line[0:2] == "-A":
-                self.addRule(currentTable, line)
+                if self.chainFilter is None or self.chainFilter == self.getRuleChain(line):
+                    self.addRule(currentTable, line, counters)
             else:
                 raise Exception("While parsing table %s found illegal line: %s" % (currentTable.getName()))
 
         return conf
 
-    def addRule(self, table, line):
-        parser = Rule(line)
-        targetChain = parser.getProperty("-A")
-        if targetChain is None:
+    def addRule(self, table, line, counters=None):
+        parts = line.split()
+        if len(parts) < 2 or parts[0] != "-A":
             raise ParserException("Can't find chain name to append to in line '%s'" % line)
 
+        targetChain = parts[1]
         if not table.canContainChain(targetChain):
             raise ParserException("Chain %s is not valid for table %s" % (targetChain, table.getName()))
 
         # Don't use the "-A" portion of the rule
-        parts = line.split()
         newline = " ".join(parts[2:])
 
         # Create a new chain or append a new line to an existing one
         self.addNewChain(targetChain)
-        self.chainLines[targetChain]['rules'].append(newline)
+        chainLines = self.chainLines[targetChain]
+        chainLines['rules'].append(newline)
+
+        if counters is not None:
+            if chainLines['counters'] is None:
+                # rules read before without counters count as 0
+                chainLines['counters'] = array('L', [0] * (2 * (len(chainLines['rules']) - 1)))
+            chainLines['counters'].extend(counters)
+        elif chainLines['counters'] is not None:
+            chainLines['counters'].extend((0, 0))
+
+    def parseCounters(self, text):
+        """Return the (packets, bytes) of a '[packets:bytes]' counters field, or None"""
+
+        result = None
+        if text.startswith("[") and text.endswith("]"):
+            parts = text[1:-1].split(":")
+            if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+                result = (int(parts[0]), int(parts[1]))
+
+        return result
+
+    def parsePolicyCounters(self, line):
+        parts = line.split()
+        result = None
+        if len(parts) > 2:
+            result = self.parseCounters(parts[2])
+
+        return result
+
+    def getRuleChain(self, line):
+        """The chain name of an '-A CHAIN ...' line, without splitting the whole line"""
+
+        end = line.find(" ", 3)
+        if end == -1:
+            end = len(line)
+
+        return line[3:end]
 
     def parsePolicy(self, table, line):
         parts = line.split()
@@ -223,33 +342,55 @@ class ConfigParser(Parser):
             if not os.path.isfile(os.path.join(self.rootDir, item)):
                 tableNames.append(item)
 
+        chainNames = None
+        if self.chainFilter is not None:
+            chainNames = [self.chainFilter]
+
         for tableName in tableNames:
-            self.resetChainLines()
-            if tableName is not None:
+            if tableName is not None and self.selectsTable(tableName):
                 table = self.parseTable(tableName, conf)
-                chainPolicies = self.parseTableProps(table)
+                self.parseChains(table, chainNames)
 
-                tableRoot = os.path.join(self.rootDir, tableName)
-                files = [f for f in os.listdir(tableRoot) if f.endswith(".src") and os.path.isfile(os.path.join(tableRoot, f))]
+        return conf
 
-                for chainFile in files:
-                    chainName = chainFile[0:-4]
-                    contentReader = FileReader(os.path.join(tableRoot, chainFile))
-                    lines = contentReader.getLines(noComments=True)
+    def parseChains(self, table, chainNames=None):
+        """
+        Parse the .src files of table, or only the ones of chainNames, and
+        add or replace the corresponding chains in table
+        """
 
-                    self.addNewChain(chainName)
-                    self.chainLines[chainName]['rules'] = lines
+        self.resetChainLines()
+        (chainPolicies, unorderedChains) = self.parseTableProps(table)
+
+        tableRoot = os.path.join(self.rootDir, table.getName())
+        if chainNames is None:
+            files = [f for f in os.listdir(tableRoot) if f.endswith(self.chainFileExt) and os.path.isfile(os.path.join(tableRoot, f))]
+        else:
+            # don't list big table folders when the chains are known
+            files = [n + self.chainFileExt for n in chainNames if os.path.isfile(os.path.join(tableRoot, n + self.chainFileExt))]
 
-                    # Add the chain policy
-                    policy = "-"
-                    if chainName in chainPolicies.keys():
-                        policy = chainPolicies[chainName]
+        for chainFile in files:
+            chainName = chainFile[0:-4]
+            if chainNames is not None and chainName not in chainNames:
+                continue
 
-                    self.chainLines[chainName]['policy'] = policy
+            contentReader = FileReader(os.path.join(tableRoot, chainFile))
+            lines = contentReader.getLines(noComments=True)
 
-                self.parseTableChains(table)
+            self.addNewChain(chainName)
+            self.chainLines[chainName]['rules'] = lines
+            self.chainLines[chainName]['source'] = contentReader.fileName
+            self.chainLines[chainName]['lineNumbers'] = contentReader.getLineNumbers(noComments=True)
 
-        return conf
+            # Add the chain policy
+            policy = "-"
+            if chainName in chainPolicies.keys():
+                policy = chainPolicies[chainName]
+
+            self.chainLines[chainName]['policy'] = policy
+            self.chainLines[chainName]['unordered'] = chainName in unorderedChains
+
+        self.parseTableChains(table)
 
     def parseTable(self, name, ruleset):
         table = Table(name)
@@ -265,19 +406,97 @@ class ConfigParser(Parser):
         return table
 
     def parseTableProps(self, table):
+        """Return the chain policies of table, and the names of its unordered chains"""
+
         filename = os.path.join(self.rootDir, "%s%s" % (table.getName(), self.tablePropsFileExt))
         policies = {}
+        unordered = []
         try:
             parser = FileReader(filename)
             for line in parser.getLines(noComments=True):
+                # ":CHAIN POLICY", optionally followed by the [packets:bytes] counters
+                # and by the unordered marker
                 parts = line.split()
-                if len(parts) == 2:
+                options = parts[2:]
+                if len(options) > 0 and options[0].startswith("["):
+                    options = options[1:]
+
+                if len(parts) >= 2 and len([o for o in options if o != UNORDERED_MARKER]) == 0:
                     policy = parts[1]
                     chainName = parts[0].strip(':')
                     policies[chainName] = policy
+                    if UNORDERED_MARKER in options:
+                        unordered.append(chainName)
 
         except ConfFileException, e:
             pass
             #print "Can't parse table props config file %s: %s" % (filename, e.message)
 
-        return policies
+        return policies, unordered
+
+class PackedParser(Parser):
+    """
+    Build a Ruleset from a file compiled by 'bbfwmgr build'. The file stays
+    memory mapped: chains are built from its index, and their rules are only
+    read from the map, and tokenized, when they are inspected.
+    """
+
+    def __init__(self, fileName, baseRuleset=None):
+        Parser.__init__(self)
+        self.fileName = fileName
+        self.baseRuleset = baseRuleset
+
+    def parse(self):
+        conf = self.baseRuleset
+        if conf is None:
+            conf = Ruleset("Packed ruleset")
+
+        packed = PackedConfig(self.fileName)
+        for tableName in packed.getTableNames():
+            if tableName not in TABLES:
+                raise ParserException("Table %s is not a valid iptables table" % tableName)
+            if not self.selectsTable(tableName):
+                continue
+
+            table = conf.getTable(tableName)
+            if table is None:
+                table = Table(tableName)
+                conf.add(table)
+
+            parents = []
+            for chainName, policy, parentName, sourceName, firstRule, count, flags in packed.getChains(tableName):
+                if not self.selectsChain(chainName):
+                    continue
+
+                chain = Chain(chainName, table, policy=policy)
+                chain.setRules(packed.getRules(firstRule, count))
+                chain.setUnordered((flags & CHAIN_UNORDERED) != 0)
+                if len(sourceName) > 0:
+                    chain.setSource(sourceName, packed.getLineNumbers(firstRule, count))
+                if len(parentName) > 0:
+                    parents.append( (parentName, chainName) )
+
+                # the stored signatures make the comparison with the base chain cheap
+                currentChain = table.getChain(chainName)
+                if currentChain is not None:
+                    if getChainSignature(currentChain) == getChainSignature(chain):
+                        if chain.source is not None:
+                            currentChain.setSource(*chain.source)
+                        currentChain.setUnordered(chain.isUnordered())
+                        log(71, "The new chain parsed for %s/%s is identical to the one already in the table, ignored" % (tableName, chainName))
+                    else:
+                        table.removeChain(currentChain)
+                        table.appendChain(chain)
+                        log(71, "The new chain parsed for %s/%s is different from the one already in the table, replaced" % (tableName, chainName))
+                else:
+                    table.appendChain(chain)
+
+            for parent, child in parents:
+                p = table.getChain(parent)
+                c = table.getChain(child)
+                if p is not None:
+                    c.setParent(p)
+                else:
+                    log(71, "While parsing table %s skipped parent/child relationship with a chain not selected: %s -> %s" % (tableName, child, parent))
+
+        return conf
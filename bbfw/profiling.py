@@ -0,0 +1,232 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+
+
+import os, sys, gc, cProfile, pstats
+from StringIO import StringIO
+
+
+def getModuleGroup(fileName):
+    """The bbfw module a source file belongs to, 'operations', or 'other' for the standard library and builtins"""
+
+    result = "other"
+    if fileName is not None:
+        (folder, name) = os.path.split(fileName)
+        folder = os.path.basename(folder)
+        if folder == "bbfw":
+            result = os.path.splitext(name)[0]
+        elif folder == "operations":
+            result = "operations"
+
+    return result
+
+def getTypeGroup(klass):
+    """The bbfw module a class is defined in, or the name of a type defined elsewhere"""
+
+    module = getattr(klass, "__module__", None) or ""
+    name = module.split(".")[-1]
+    result = klass.__name__
+    if module.startswith("bbfw.") or (module in sys.modules and getModuleGroup(getattr(sys.modules[module], "__file__", None)) != "other"):
+        result = name
+
+    return result
+
+def formatGroups(groups, columns, limit=None):
+    """groups maps a name to a tuple of numbers, sorted by the first one"""
+
+    lines = []
+    items = sorted(groups.items(), key=lambda item: item[1][0], reverse=True)
+    if limit is not None:
+        items = items[0:limit]
+
+    for name, values in items:
+        lines.append("  ".join([column % value for column, value in zip(columns, values)] + [name]))
+
+    return lines
+
+
+class OperationTracer:
+    """
+    Call a function when an operation returns, while its local variables
+    (the rulesets it built) are still alive.
+    """
+
+    def __init__(self, code, callback):
+        self.code = code
+        self.callback = callback
+
+    def install(self):
+        sys.settrace(self.trace)
+
+    def uninstall(self):
+        sys.settrace(None)
+
+    def trace(self, frame, event, arg):
+        result = None
+        if event == 'call' and frame.f_code is self.code:
+            result = self.traceOperation
+
+        return result
+
+    def traceOperation(self, frame, event, arg):
+        if event == 'return':
+            self.callback()
+
+        return self.traceOperation
+
+
+class CpuProfiler:
+    """Run an operation under cProfile, save the pstats to fileName and summarize them by bbfw module"""
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.profile = cProfile.Profile()
+
+    def install(self):
+        self.profile.enable()
+
+    def uninstall(self):
+        self.profile.disable()
+        self.profile.dump_stats(self.fileName)
+
+    def report(self, limit=20):
+        stats = pstats.Stats(self.fileName)
+
+        # module -> (self seconds, calls)
+        groups = {}
+        for key, value in stats.stats.items():
+            (fileName, line, function) = key
+            (primitiveCalls, calls, selfTime, cumulative, callers) = value
+            group = getModuleGroup(fileName if fileName != "~" else None)
+            (total, count) = groups.get(group, (0.0, 0))
+            groups[group] = (total + selfTime, count + calls)
+
+        lines = ["CPU profile saved to %s, %.3f seconds" % (self.fileName, stats.total_tt), "%10s %12s  %s" % ("self s", "calls", "module")]
+        lines.extend(formatGroups(groups, ["%10.3f", "%12d"]))
+
+        output = StringIO()
+        stats.stream = output
+        stats.sort_stats("tottime").print_stats(limit)
+        lines.append(output.getvalue().strip())
+
+        return "\n".join(lines)
+
+
+class MemoryProfiler:
+    """
+    Report what an operation keeps in memory when it returns, by bbfw
+    module. With tracemalloc (Python 3, or a patched Python 2) allocations
+    are traced by source line; otherwise the objects tracked by the garbage
+    collector are counted by the module defining their class.
+    """
+
+    def __init__(self):
+        self.tracemalloc = None
+        self.baseline = None
+        self.result = None
+
+    def install(self):
+        try:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            tracemalloc.start(10)
+        except ImportError:
+            self.baseline = self.census()
+
+    def uninstall(self):
+        if self.result is None:
+            self.snapshot()
+
+        if self.tracemalloc is not None:
+            self.tracemalloc.stop()
+
+    def snapshot(self):
+        if self.tracemalloc is not None:
+            self.result = (self.tracemalloc.take_snapshot(), self.tracemalloc.get_traced_memory())
+        else:
+            self.result = self.census()
+
+    def census(self):
+        """type group -> (bytes, objects) of the objects tracked by the garbage collector"""
+
+        result = {}
+        for o in gc.get_objects():
+            group = getTypeGroup(type(o))
+            (size, count) = result.get(group, (0, 0))
+            result[group] = (size + sys.getsizeof(o), count + 1)
+
+        return result
+
+    def getPeakRss(self):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def report(self, limit=20):
+        lines = ["Memory profile, peak RSS %s KB" % self.getPeakRss()]
+
+        if self.tracemalloc is not None:
+            (snapshot, traced) = self.result
+            lines.append("Traced memory %s KB, peak %s KB" % (traced[0] / 1024, traced[1] / 1024))
+
+            groups = {}
+            for stat in snapshot.statistics('filename'):
+                group = getModuleGroup(stat.traceback[0].filename)
+                (size, count) = groups.get(group, (0, 0))
+                groups[group] = (size + stat.size / 1024, count + stat.count)
+
+            lines.append("%10s %12s  %s" % ("KB", "blocks", "module"))
+            lines.extend(formatGroups(groups, ["%10d", "%12d"]))
+
+            lines.append("Top allocations:")
+            for stat in snapshot.statistics('lineno')[0:limit]:
+                frame = stat.traceback[0]
+                lines.append("%10d %12d  %s:%s" % (stat.size / 1024, stat.count, frame.filename, frame.lineno))
+        else:
+            groups = {}
+            for group, (size, count) in self.result.items():
+                (baseSize, baseCount) = self.baseline.get(group, (0, 0))
+                if count > baseCount:
+                    groups[group] = ((size - baseSize) / 1024, count - baseCount)
+
+            lines.append("Objects added by the operation, by bbfw module or type (tracemalloc is not available, shallow sizes):")
+            lines.append("%10s %12s  %s" % ("KB", "objects", "module"))
+            lines.extend(formatGroups(groups, ["%10d", "%12d"], limit))
+
+        return "\n".join(lines)
+
+def getProfilers(cpuFile, memory, operation):
+    """The profilers to install around the operation function, in order"""
+
+    result = []
+    if memory:
+        profiler = MemoryProfiler()
+        result.append(profiler)
+        result.append(OperationTracer(operation.func_code, profiler.snapshot))
+
+    if cpuFile is not None:
+        result.append(CpuProfiler(cpuFile))
+
+    return result
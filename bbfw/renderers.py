@@ -23,9 +23,13 @@
 
 
 
-from elements import TABLES, TABLE_CHAINS
+from elements import TABLES, TABLE_CHAINS, UNORDERED_MARKER, multisetDiff
 from logger import log
-import os
+from array import array
+import os, hashlib
+
+# Size of the chunks written by Renderer.renderTo
+CHUNK_SIZE = 65536
 
 class Renderer:
     def __init__(self, config):
@@ -40,19 +44,88 @@ class Renderer:
     def renderLines(self, table=None, chain=None):
         pass
 
+    def iterLines(self, table=None, chain=None):
+        for line in self.renderLines(table, chain):
+            yield line
+
+    def renderTo(self, sink, table=None, chain=None, chunkSize=CHUNK_SIZE):
+        """Write the same text as render() to the file-like sink, in chunks of about chunkSize bytes"""
+
+        buffer = []
+        size = 0
+        first = True
+
+        for line in self.iterLines(table, chain):
+            if not first:
+                buffer.append("\n")
+                size += 1
+
+            first = False
+            buffer.append(line)
+            size += len(line)
+
+            if size >= chunkSize:
+                sink.write("".join(buffer))
+                buffer = []
+                size = 0
+
+        if len(buffer) > 0:
+            sink.write("".join(buffer))
+
 class RulesetSaver(Renderer):
-    def __init__(self, conf, folderName):
+    """
+    Save a ruleset as a configuration folder: one folder per table with a
+    .src file per chain, and a .props file per table with the chain policies.
+    In incremental mode the folder may already exist: files whose content did
+    not change are left untouched and chain files no longer in the ruleset
+    are removed. Files are always written to a temporary file first and
+    renamed into place.
+    """
+
+    def __init__(self, conf, folderName, incremental=False, jobs=None):
         Renderer.__init__(self, conf)
         self.folderName = folderName
+        self.incremental = incremental
+        self.jobs = jobs
+        if self.jobs is None:
+            # multiprocessing and tempfile are only imported by export, they
+            # take a good part of the startup time of the other operations
+            import multiprocessing
+            self.jobs = multiprocessing.cpu_count()
 
     def renderLines(self, table=None, chain=None):
         result = []
-        os.makedirs(self.folderName)
 
+        if not self.incremental or not os.path.isdir(self.folderName):
+            os.makedirs(self.folderName)
+
+        files = {}
         for name, table in self.tables.items():
-            os.makedirs(self.getFolderName(name))
-            self.renderTable(table, name)
-            result.append( "Table %s saved." % name )
+            tableFolderName = self.getFolderName(name)
+            if not os.path.isdir(tableFolderName):
+                os.makedirs(tableFolderName)
+
+            files[name] = self.renderTable(table, name)
+
+        jobs = []
+        for name in files.keys():
+            jobs.extend(files[name].items())
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(max(1, self.jobs))
+        try:
+            written = dict(zip([path for path, content in jobs], pool.map(writeFileIfChanged, jobs)))
+        finally:
+            pool.close()
+
+        for name in sorted(files.keys()):
+            paths = files[name].keys()
+            count = len([p for p in paths if written[p]])
+            removed = 0
+            if self.incremental:
+                removed = self.removeStaleChains(name, paths)
+
+            result.append( "Table %s saved: %s files written, %s unchanged, %s stale chains removed." % (name, count, len(paths) - count, removed) )
 
         return result
 
@@ -60,47 +133,113 @@ class RulesetSaver(Renderer):
         return os.path.join(self.folderName, name)
 
     def renderTable(self, table, name):
+        """Return a dict with the content of each file of the table, by path"""
+
         tableFolderName = self.getFolderName(name)
+        files = {}
 
         # Chain policies
-        policies = {}
-        #for chainName in table.getBuiltinChains():
-        for chainName in table.getBuiltinChains():
-            chain = table.getChain(chainName)
-            if chain is not None:
-                self.renderChain(tableFolderName, policies, chain)
+        policies = []
+        for chain in table.chains():
+            path, content = self.renderChain(tableFolderName, policies, chain)
+            files[path] = content
+
+        path, content = self.renderTableProps(table, policies)
+        files[path] = content
 
-        self.renderTableProps(table, policies)
+        return files
 
     def renderChain(self, folderName, policies, chain):
         chainFileName = os.path.join(folderName, "%s.src" % chain.getName())
-        file = open(chainFileName, "w")
+        lines = []
         for rule in chain.getRules():
-            file.write( "%s\n" % rule.toStr(True) )
-
-        file.close()
+            lines.append( "%s\n" % rule.toStr(True) )
 
         # append this chain's policy to the table props
-        policies[chain.getName()] = chain.getPolicy()
+        policies.append( (chain.getName(), chain.getPolicy(), chain.isUnordered()) )
 
-#        for child in chain.getChildren():
-#            self.renderChain(folderName, policies, child)
+        return chainFileName, "".join(lines)
 
     def renderTableProps(self, table, policies):
         tableFileName = os.path.join(self.folderName, "%s.props" % table.getName())
-        file = open(tableFileName, "w")
-        for name, policy in policies.items():
-            file.write(":%s %s [0:0]\n" % (name, policy) )
-
-        file.close()
+        lines = []
+        for name, policy, unordered in policies:
+            marker = ""
+            if unordered:
+                marker = " %s" % UNORDERED_MARKER
+
+            lines.append(":%s %s [0:0]%s\n" % (name, policy, marker) )
+
+        return tableFileName, "".join(lines)
+
+    def removeStaleChains(self, name, paths):
+        removed = 0
+        folderName = self.getFolderName(name)
+        for f in os.listdir(folderName):
+            path = os.path.join(folderName, f)
+            if f.endswith(".src") and path not in paths and os.path.isfile(path):
+                os.remove(path)
+                removed += 1
+
+        return removed
+
+def writeFileIfChanged(job):
+    """
+    Atomically replace the file at path with content, unless it already has
+    that content. Return True if the file has been written
+    """
+
+    (path, content) = job
+    result = True
+
+    if os.path.isfile(path):
+        data = open(path, 'r')
+        current = hashlib.sha1(data.read()).digest()
+        data.close()
+
+        if current == hashlib.sha1(content).digest():
+            result = False
+
+    if result:
+        import tempfile
+        (fd, tmpName) = tempfile.mkstemp(prefix=".%s." % os.path.basename(path), dir=os.path.dirname(path))
+        try:
+            f = os.fdopen(fd, 'w')
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            os.chmod(tmpName, 0644)
+            os.rename(tmpName, path)
+        except:
+            os.remove(tmpName)
+            raise
+
+    return result
 
 class FileRenderer(Renderer):
+    """
+    Render a ruleset in the format used by iptables-save.
+    While rendering, the chain and rule index of each output line are
+    recorded, see getLineOrigin() and getLineSource().
+    """
+
     def __init__(self, config):
         Renderer.__init__(self, config)
+        self.resetOrigins()
 
     def renderLines(self, table=None, chain=None):
-        buffer = []
-        buffer.append( self.getHeader()  )
+        return list(self.iterLines(table, chain))
+
+    def iterLines(self, table=None, chain=None):
+        self.resetOrigins()
+
+        for line, origin in self.iterItems(table, chain):
+            self.addOrigin(line, origin)
+            yield line
+
+    def iterItems(self, table=None, chain=None):
+        yield (self.getHeader(), None)
 
         tables = self.tables.keys()
         if table is not None:
@@ -108,12 +247,56 @@ class FileRenderer(Renderer):
 
         for name in tables:
             if self.tables.has_key(name):
-                lines = self.renderTable(self.tables[name], chain)
-                buffer.extend(lines)
+                for item in self.iterTable(self.tables[name], chain):
+                    yield item
 
-        buffer.append( self.getFooter() )
+        yield (self.getFooter(), None)
 
-        return buffer
+    def resetOrigins(self):
+        self.originChains = []
+        self.originRules = array('l')
+
+    def addOrigin(self, line, origin):
+        chain = None
+        index = -1
+        if origin is not None:
+            (chain, index) = origin
+
+        # a rendered item can span several lines
+        for i in range(0, line.count("\n") + 1):
+            self.originChains.append(chain)
+            self.originRules.append(index)
+
+    def getLineOrigin(self, lineNumber):
+        """Return the (chain, rule index) rendered at lineNumber (1 based), or None if it is not a rule"""
+
+        result = None
+        index = lineNumber - 1
+        if index >= 0 and index < len(self.originChains) and self.originChains[index] is not None:
+            result = (self.originChains[index], self.originRules[index])
+
+        return result
+
+    def getLineSource(self, lineNumber):
+        """
+        Return (table, chain, rule index, file name, file line) for the rule
+        rendered at lineNumber (1 based), or None if it is not a rule. File
+        name and line are None when the rule wasn't read from a config folder.
+        """
+
+        result = None
+        origin = self.getLineOrigin(lineNumber)
+        if origin is not None:
+            (chain, index) = origin
+            fileName = None
+            fileLine = None
+            source = chain.getRuleSource(index)
+            if source is not None:
+                (fileName, fileLine) = source
+
+            result = (chain.getRoot().getName(), chain.getName(), index, fileName, fileLine)
+
+        return result
 
     def getHeader(self):
         return "############\n\n"
@@ -134,24 +317,29 @@ class FileRenderer(Renderer):
         return "\nCOMMIT\n########\n# End of the %s table\n########\n\n" % (table.name)
 
     def renderTable(self, table, chainName=None, renderEmpty=True):
-        buffer = []
-        body = []
+        return [line for line, origin in self.iterTable(table, chainName, renderEmpty)]
 
-        for chainObj in table.chains(chainName):
-            chainLines = self.renderChain(chainObj)
-            if renderEmpty or len(chainLines) > 0:
-                body.extend(chainLines)
+    def iterTable(self, table, chainName=None, renderEmpty=True):
+        if not renderEmpty:
+            # we only know whether the table is empty once its chains are rendered
+            body = []
+            for chainObj in table.chains(chainName):
+                body.extend(self.iterChain(chainObj))
 
-        if renderEmpty or len(body) > 0:
-            if chainName is None:
-                buffer.append( self.getTableHeader(table))
-                buffer.extend(self.renderPolicies(table))
-            buffer.extend(body)
+            if len(body) == 0:
+                return
 
-            if chainName is None:
-                buffer.append( self.getTableFooter(table))
+        if chainName is None:
+            yield (self.getTableHeader(table), None)
+            for line in self.renderPolicies(table):
+                yield (line, None)
 
-        return buffer
+        for chainObj in table.chains(chainName):
+            for item in self.iterChain(chainObj):
+                yield item
+
+        if chainName is None:
+            yield (self.getTableFooter(table), None)
 
     def renderPolicies(self, table):
         buffer = []
@@ -162,21 +350,72 @@ class FileRenderer(Renderer):
         return buffer
 
     def renderChain(self, chain):
-        buffer = []
+        return [line for line, origin in self.iterChain(chain)]
 
+    def iterChain(self, chain):
         if len(chain) > 0:
-            buffer.append(self.getChainHeader(chain))
+            yield (self.getChainHeader(chain), None)
 
+            index = 0
             for row in chain.getRules():
-                buffer.append("-A %s %s" % (chain.getName(), row.toStr()))
+                yield ("-A %s %s" % (chain.getName(), row.toStr()), (chain, index))
+                index += 1
+
+            yield (self.getChainFooter(chain), None)
+
+class ChainDeltaRenderer(FileRenderer):
+    """
+    Render a ChainDelta as a script for 'iptables-restore --noflush':
+    replaced chains are created or flushed and filled again, deleted rules
+    are removed with -D, deleted chains are flushed and removed. Chains not
+    in the delta are not touched.
+    """
+
+    def __init__(self, delta):
+        self.delta = delta
+        self.resetOrigins()
+
+    def iterItems(self, table=None, chain=None):
+        for tableName in self.delta.getTableNames():
+            builtins = TABLE_CHAINS[tableName]
+            replaced = self.delta.getReplaced(tableName)
+            deletedRules = self.delta.getDeletedRules(tableName)
+            deleted = self.delta.getDeleted(tableName)
+
+            if len(replaced) == 0 and len(deletedRules) == 0 and len(deleted) == 0:
+                continue
 
-            buffer.append(self.getChainFooter(chain))
+            yield ("*%s" % tableName, None)
 
-#        for child in chain.getChildren():
-#            lines = self.renderChain(child)
-#            buffer.extend(lines)
+            # with --noflush, declaring an existing user chain flushes it
+            for chainObj in replaced:
+                if chainObj.getName() not in builtins:
+                    yield (":%s - [0:0]" % chainObj.getName(), None)
+                elif chainObj.getPolicy() != "-":
+                    yield (":%s %s [0:0]" % (chainObj.getName(), chainObj.getPolicy()), None)
 
-        return buffer
+            for chainObj in replaced:
+                if chainObj.getName() in builtins:
+                    yield ("-F %s" % chainObj.getName(), None)
+
+            for chainObj in replaced:
+                for item in self.iterChain(chainObj):
+                    yield item
+
+            # jumps must be gone before the chains they point to are removed
+            for chainObj, index in deletedRules:
+                yield ("-D %s %s" % (chainObj.getName(), chainObj.getRules()[index].toStr()), (chainObj, index))
+
+            for chainName in deleted:
+                yield ("-F %s" % chainName, None)
+
+            for chainName in deleted:
+                yield ("-X %s" % chainName, None)
+
+            yield ("COMMIT", None)
+
+        # iptables-restore wants the last line to be terminated
+        yield ("", None)
 
 class SummaryRenderer(Renderer):
     def __init__(self, config):
@@ -186,32 +425,46 @@ class SummaryRenderer(Renderer):
         pass
 
     def renderWithSeparators(self, separators, name):
-        line = ""
-        for last, sep in separators:
-            fragment = ""
-            for i in range(0, sep + 3):
-                fragment = fragment + " "
+        line = "".join([self.renderSeparator(last, sep) for last, sep in separators])
+
+        return self.renderAfterSeparators(line, separators, name)
 
-            line = line + fragment
+    def renderSeparator(self, last, sep):
+        fragment = " " * (sep + 3)
+        if not last:
+            fragment = fragment + "|"
 
-            if not last:
-                line = line + "|"
+        return fragment
 
+    def renderAfterSeparators(self, line, separators, name):
         sep = ""
         if len(separators) > 0:
             (last, s) = separators[len(separators) - 1]
             if last:
                 sep = sep + "+"
 
-        line = line + "%s-->%s" % (sep, name)
-
-        return line
+        return line + "%s-->%s" % (sep, name)
 
 class RulesetSummaryRenderer(SummaryRenderer):
-    def __init__(self, config):
+    def __init__(self, config, annotations=None):
         SummaryRenderer.__init__(self, config)
 
+        # table -> chain -> text shown after the chain, the table's own is under None
+        self.annotations = annotations
+
+    def annotate(self, tableName, chainName, label):
+        result = label
+        if self.annotations is not None:
+            note = self.annotations.get(tableName, {}).get(chainName)
+            if note is not None:
+                result = "%s %s" % (label, note)
+
+        return result
+
     def renderLines(self, table=None, chain=None):
+        return list(self.iterLines(table, chain))
+
+    def iterLines(self, table=None, chain=None):
         tables = self.tables
         if table is not None:
             tables = [table]
@@ -219,60 +472,125 @@ class RulesetSummaryRenderer(SummaryRenderer):
         return self.renderTables(tables, chain)
 
     def renderTables(self, tables, chain=None):
-        buffer = []
-
         for table in tables:
-            buffer.extend( self.renderTable(table, chain))
-
-        return buffer
+            for line in self.renderTable(table, chain):
+                yield line
 
     def renderTable(self, tableName, chainName):
-        buffer = []
         separators = []
-        index = 0
 
         table = self.conf.getTable(tableName)
-        empty = table.isEmpty()
 
         if table.isEmpty():
-            buffer.append( self.renderWithSeparators(separators, "*%s is empty" % tableName) )
+            yield self.renderWithSeparators(separators, "*%s is empty" % tableName)
         else:
-            buffer.append( self.renderWithSeparators(separators, "*%s" % tableName) )
+            yield self.renderWithSeparators(separators, self.annotate(tableName, None, "*%s" % tableName))
 
-            tree = table.getChainsTree()
             if chainName is not None:
+                tree = {}
                 chain = table.getChain(chainName)
                 if chain is not None:
                     tree = { ("%s" % chainName): {}}
+            else:
+                tree = table.getChainsTree()
+
+            for line in self.renderSummaryChain(tableName, tree, separators, False):
+                yield line
+
+    def renderSummaryChain(self, parentName, tree, separators, last):
+        """
+        Yield the lines of tree, walking it without recursion. A chain
+        jumping back to one of the chains above it is marked as a loop, and
+        a chain already expanded elsewhere isn't expanded again.
+        """
+
+        tableName = parentName
+        expanded = set()
+        path = []
+        # (chain name, subtree, child names, index of the next child)
+        stack = []
+        # the rendered separators, prefixes[i] has the first i of them
+        prefixes = ["".join([self.renderSeparator(l, sep) for l, sep in separators])]
+
+        def pushSeparator(separator):
+            separators.append(separator)
+            prefixes.append(prefixes[-1] + self.renderSeparator(*separator))
+
+        def popSeparator():
+            separators.pop()
+            prefixes.pop()
+
+        pushSeparator((last, len(parentName) / 2))
+        stack.append( (parentName, tree, tree.keys(), 0) )
+
+        while len(stack) > 0:
+            (name, node, children, index) = stack[-1]
+
+            if index == len(children):
+                stack.pop()
+                popSeparator()
+                if len(stack) > 0:
+                    path.pop()
+                continue
 
-            self.renderSummaryChain(buffer, tableName, tree, [], False)
-
-        return buffer
-
-    def renderSummaryChain(self, buffer, parentName, tree, separators, last):
-        separators.append((last, len(parentName) / 2))
-
-        index = 0
-        children = tree.keys()
-        for child in children:
-            lastOne = False
-            if index == len(children) - 1:
-                lastOne = True
-                separators.pop()
-                separators.append((lastOne, len(parentName) / 2))
+            stack[-1] = (name, node, children, index + 1)
+            child = children[index]
+            subtree = node[child]
 
-            buffer.append( self.renderWithSeparators(separators, child))
-            self.renderSummaryChain(buffer, child, tree[child], separators, lastOne)
-            index += 1
+            lastOne = index == len(children) - 1
+            if lastOne:
+                popSeparator()
+                pushSeparator((lastOne, len(name) / 2))
 
-        separators.pop()
+            if child in path:
+                yield self.renderAfterSeparators(prefixes[-1], separators, "%s (loop)" % child)
+            elif child in expanded and len(subtree) > 0:
+                yield self.renderAfterSeparators(prefixes[-1], separators, "%s (see above)" % child)
+            else:
+                yield self.renderAfterSeparators(prefixes[-1], separators, self.annotate(tableName, child, child))
+                expanded.add(child)
+                path.append(child)
+                pushSeparator((lastOne, len(child) / 2))
+                stack.append( (child, subtree, subtree.keys(), 0) )
 
 class RulesetDiffRenderer(SummaryRenderer):
-    def __init__(self, thisRuleset, otherRuleset, table=None, chain=None):
+    """
+    Render the differences between two rulesets. When a RulesetComparator
+    of the two rulesets is given, its results are used instead of comparing
+    the chains again. Unordered chains (or all the chains, when unordered is
+    set) only show the rules added or removed.
+    """
+
+    def __init__(self, thisRuleset, otherRuleset, table=None, chain=None, comparator=None, unordered=False):
         self.thisRuleset = thisRuleset
         self.otherRuleset = otherRuleset
         self.table = table
         self.chain = chain
+        self.comparator = comparator
+        self.unordered = unordered
+
+    def isUnordered(self, thisChain, otherChain):
+        return self.unordered or thisChain.isUnordered() or otherChain.isUnordered()
+
+    def itemEquals(self, tableName, this, that):
+        result = False
+        if self.comparator is None:
+            result = this.equals(that)
+        elif self.chain is not None:
+            result = self.comparator.chainEquals(tableName, self.chain)
+        else:
+            result = self.comparator.tableEquals(tableName)
+
+        return result
+
+    def chainEquals(self, thisChain, otherChain):
+        result = False
+        if self.comparator is None:
+            result = thisChain.equals(otherChain, self.isUnordered(thisChain, otherChain))
+        else:
+            result = self.comparator.chainEquals(thisChain.getRoot().getName(), thisChain.getName())
+
+        return result
 
     def renderLines(self, table=None, chain=None):
         buffer = []
@@ -312,7 +630,7 @@ class RulesetDiffRenderer(SummaryRenderer):
                 that = that.getChain(self.chain)
 
             if this is not None and that is not None:
-                result = this.equals(that)
+                result = self.itemEquals(tableName, this, that)
                 if not result:
                     buffer.append( (order, tableName) )
                     if self.chain is None:
@@ -431,6 +749,18 @@ class RulesetDiffRenderer(SummaryRenderer):
 
         return buffer
 
+    def renderChainRulesMultisetDiff(self, thisChain, otherChain, order):
+        buffer = []
+        (missing, added) = multisetDiff(thisChain.getRules(), otherChain.getRules())
+
+        for rule in missing:
+            buffer.append( (order,  " < %s" % rule.toStr()  )  )
+
+        for rule in added:
+            buffer.append( (order,  " > %s" % rule.toStr()  )  )
+
+        return buffer
+
     def renderPolicyDiff(self, thisChain, otherChain, order):
         buffer = []
         lastChain = False
@@ -457,7 +787,9 @@ class RulesetDiffRenderer(SummaryRenderer):
         policyBuffer = self.renderPolicyDiff(thisChain, otherChain, order + 1)
 
         # Check rules
-        if len(thisChain) != len(otherChain):
+        if self.isUnordered(thisChain, otherChain):
+            ruleExistanceBuffer = self.renderChainRulesMultisetDiff( thisChain, otherChain, order + 1 )
+        elif len(thisChain) != len(otherChain):
             ruleExistanceBuffer = self.renderChainRulesDiff( thisChain, otherChain, order + 1  )
         else:
             ruleExistanceBuffer = self.renderChainRulesCompare( thisChain, otherChain, order + 1 )
@@ -514,7 +846,7 @@ class RulesetDiffRenderer(SummaryRenderer):
                 continue
 
             elif thisChild is not None and otherChild is not None:
-                if not thisChild.equals(otherChild):
+                if not self.chainEquals(thisChild, otherChild):
                     buffer.extend( self.renderChainDiff(thisChild, otherChild, order + 1) )
             else:
                 buffer.append( (order, thisItem.getName()) )
@@ -535,3 +867,128 @@ class RulesetDiffRenderer(SummaryRenderer):
         buffer.append( (order, "  > %s" % elemText) )
 
         return buffer
+
+class SimulationRenderer(Renderer):
+    """Render the rule hit histogram of a simulation and, optionally, the verdict differences with another one"""
+
+    def __init__(self, packets, result, name, baseResult=None, baseName=None):
+        self.packets = packets
+        self.result = result
+        self.name = name
+        self.baseResult = baseResult
+        self.baseName = baseName
+
+    def renderLines(self, table=None, chain=None):
+        buffer = []
+        result = self.result
+
+        buffer.append("Simulated %s packets through %s/%s of %s" % (len(self.packets), result.tableName, result.chainName, self.name))
+        buffer.extend(self.renderVerdicts(result))
+        buffer.append("Rule hits:")
+        buffer.extend(self.renderHits(result))
+
+        if len(result.unsupported) > 0:
+            buffer.append("Rules with matches that can't be simulated (never matched):")
+            for key in sorted(result.unsupported.keys()):
+                (chainName, index) = key
+                buffer.append("  %s #%s: %s" % (chainName, index + 1, result.unsupported[key]))
+
+        if self.baseResult is not None:
+            buffer.extend(self.renderDiff(self.baseResult, result))
+
+        return buffer
+
+    def renderVerdicts(self, result):
+        buffer = ["Verdicts:"]
+        counts = result.getVerdictCounts()
+        for verdict in sorted(counts.keys()):
+            buffer.append("  %s: %s" % (verdict, counts[verdict]))
+
+        return buffer
+
+    def renderHits(self, result):
+        buffer = []
+        for key in sorted(result.hits.keys()):
+            (chainName, index) = key
+            buffer.append("  %10s  %s #%s" % (result.hits[key], chainName, index + 1))
+
+        if len(buffer) == 0:
+            buffer.append("  no rule matched")
+
+        return buffer
+
+    def renderDiff(self, thisResult, otherResult):
+        from simulator import compareVerdicts
+
+        indices = compareVerdicts(thisResult, otherResult)
+        buffer = ["Compare verdicts of %s (<) and %s (>)" % (self.baseName, self.name)]
+
+        if len(indices) == 0:
+            buffer.append("  No difference.")
+        else:
+            buffer.append("  %s packets have a different verdict:" % len(indices))
+            for index in indices:
+                buffer.append("  < %-8s > %-8s %s" % (thisResult.verdicts[index], otherResult.verdicts[index], self.packets.lines[index]))
+
+        return buffer
+
+class FleetRenderer(Renderer):
+    """Render the drift of every host compared by a FleetComparator, and a report aggregated over the fleet"""
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+
+    def renderHost(self, host):
+        drift = self.fleet.getDrift(host)
+        buffer = []
+
+        if len(drift) == 0:
+            buffer.append("Host %s matches %s" % (host, self.fleet.config.getName()))
+        else:
+            buffer.append("Host %s differs from %s in %s chains:" % (host, self.fleet.config.getName(), len(drift)))
+            for kind, tableName, chainName in drift:
+                buffer.append("  %-8s %s/%s" % (kind, tableName, chainName))
+
+        return buffer
+
+    def renderLines(self, table=None, chain=None):
+        from fleet import DRIFT_KINDS
+
+        fleet = self.fleet
+        hosts = fleet.getHostNames()
+        errors = fleet.getErrors()
+
+        # (table, chain) -> drift kind -> number of hosts
+        chainDrift = {}
+        hostDrift = []
+        for host in hosts:
+            drift = fleet.getDrift(host)
+            if len(drift) > 0:
+                hostDrift.append( (host, drift) )
+
+            for kind, tableName, chainName in drift:
+                counts = chainDrift.setdefault((tableName, chainName), {})
+                counts[kind] = counts.get(kind, 0) + 1
+
+        buffer = []
+        buffer.append("Compared %s hosts with %s: %s match, %s differ, %s could not be read" % (len(hosts) + len(errors), fleet.config.getName(), len(hosts) - len(hostDrift), len(hostDrift), len(errors)))
+        buffer.append("Compared %s distinct chains out of %s chains found in the dumps" % (fleet.getUniqueChainCount(), fleet.chainCount))
+
+        if len(chainDrift) > 0:
+            buffer.append("Drift by chain:")
+            keys = sorted(chainDrift.keys(), key=lambda k: (-sum(chainDrift[k].values()), k))
+            for key in keys:
+                counts = chainDrift[key]
+                details = ", ".join(["%s on %s hosts" % (kind, counts[kind]) for kind in DRIFT_KINDS if kind in counts])
+                buffer.append("  %s/%s: %s" % (key[0], key[1], details))
+
+            buffer.append("Drift by host:")
+            for host, drift in hostDrift:
+                buffer.append("  %s: %s chains (%s)" % (host, len(drift), ", ".join(["%s/%s" % (t, c) for kind, t, c in drift])))
+
+        if len(errors) > 0:
+            buffer.append("Dumps that could not be read:")
+            for host in sorted(errors.keys()):
+                buffer.append("  %s: %s" % (host, errors[host]))
+
+        return buffer
@@ -0,0 +1,268 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import os, mmap, struct, hashlib, fcntl
+from logger import log
+from defaults import DEFAULT_RING, DEFAULT_RECORDS
+
+# Layout of a counter ring file:
+#   header          magic, version, record size, capacity, next slot and
+#                   number of records ever written, in HEADER_SIZE bytes
+#   records         capacity fixed size records: rule signature, sample
+#                   time, packets and bytes. Each sample of the counters
+#                   writes one record per rule in the next slots, wrapping
+#                   around, so the file never grows and the oldest samples
+#                   are overwritten first
+# The header is updated after the records of a sample, under an exclusive
+# lock; readers take a shared lock.
+
+MAGIC = "BBFWRING"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQQ")
+HEADER_SIZE = 64
+RECORD = struct.Struct("<QdQQ")
+
+
+class SamplingException(Exception):
+    pass
+
+
+def getRuleSignature(tableName, chainName, text, occurrence=0):
+    """
+    A 64 bit digest of a rule and of the chain it is in. It doesn't depend on
+    the position of the rule, so the samples of a rule still add up after
+    its chain is reordered. Identical rules in a chain are told apart by
+    their occurrence.
+    """
+
+    digest = hashlib.sha1("%s %s %s" % (tableName, chainName, text))
+    if occurrence > 0:
+        digest.update(" %d" % occurrence)
+
+    return struct.unpack("<Q", digest.digest()[0:8])[0]
+
+class RuleScanner:
+    """
+    Read the rules and their counters from the lines of 'iptables-save -c',
+    without parsing them. The signatures of the rules seen in the previous
+    scan are reused, so repeated scans of a mostly unchanged ruleset only
+    hash the new rules.
+    """
+
+    def __init__(self):
+        self.signatures = {}
+
+    def scan(self, lines):
+        """Return a list of (signature, table, chain, position, text, packets, bytes)"""
+
+        result = []
+        signatures = {}
+        positions = {}
+        occurrences = {}
+        tableName = None
+
+        for line in lines:
+            line = line.strip()
+            if len(line) < 1 or line[0] == "#":
+                continue
+
+            if line[0] == "*":
+                tableName = line[1:]
+                positions = {}
+                occurrences = {}
+                continue
+
+            packets = None
+            byteCount = None
+            if line[0] == "[":
+                end = line.find("] ")
+                if end == -1:
+                    raise SamplingException("Can't find the end of the counters in line '%s'" % line)
+                counters = line[1:end].split(":")
+                packets = int(counters[0])
+                byteCount = int(counters[1])
+                line = line[end + 2:]
+
+            if line[0:3] != "-A ":
+                continue
+
+            parts = line.split(" ", 2)
+            chainName = parts[1]
+            text = ""
+            if len(parts) > 2:
+                text = parts[2]
+
+            position = positions.get(chainName, 0)
+            positions[chainName] = position + 1
+
+            key = (tableName, chainName, text)
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+
+            key = (tableName, chainName, text, occurrence)
+            signature = self.signatures.get(key)
+            if signature is None:
+                signature = getRuleSignature(*key)
+            signatures[key] = signature
+
+            result.append( (signature, tableName, chainName, position, text, packets, byteCount) )
+
+        # only remember the rules still loaded
+        self.signatures = signatures
+
+        return result
+
+class CounterRing:
+    """A fixed size, memory mapped ring of rule counter samples"""
+
+    def __init__(self, fileName=DEFAULT_RING, records=DEFAULT_RECORDS, create=True):
+        self.fileName = fileName
+        self.file = None
+        self.map = None
+
+        if not os.path.exists(fileName) or os.path.getsize(fileName) == 0:
+            if not create:
+                raise SamplingException("There are no counter samples in %s" % fileName)
+            self.createFile(records)
+
+        self.file = open(fileName, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+        (magic, version, recordSize, capacity, nextSlot, written) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or recordSize != RECORD.size:
+            self.close()
+            raise SamplingException("%s is not a bbfw counter ring" % fileName)
+        if len(self.map) < HEADER_SIZE + capacity * RECORD.size:
+            self.close()
+            raise SamplingException("%s is truncated" % fileName)
+
+        self.capacity = capacity
+
+    def createFile(self, records):
+        folder = os.path.dirname(self.fileName)
+        if len(folder) > 0 and not os.path.isdir(folder):
+            os.makedirs(folder, 0700)
+
+        f = open(self.fileName, 'wb')
+        try:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, records, 0, 0))
+            f.truncate(HEADER_SIZE + records * RECORD.size)
+        finally:
+            f.close()
+
+        log(50, "Created counter ring %s for %s records" % (self.fileName, records))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def getHeader(self):
+        """Return (next slot, records written)"""
+
+        return HEADER.unpack_from(self.map, 0)[4:6]
+
+    def append(self, samples, timestamp):
+        """Write a record for each (signature, packets, bytes) of samples, in constant time per record"""
+
+        if len(samples) > self.capacity / 2:
+            log(20, "%s records per sample don't leave room for two samples in %s, rates can't be computed" % (len(samples), self.fileName))
+
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        try:
+            (nextSlot, written) = self.getHeader()
+
+            for signature, packets, byteCount in samples:
+                RECORD.pack_into(self.map, HEADER_SIZE + nextSlot * RECORD.size, signature, timestamp, packets, byteCount)
+                nextSlot += 1
+                if nextSlot == self.capacity:
+                    nextSlot = 0
+
+            HEADER.pack_into(self.map, 0, MAGIC, VERSION, RECORD.size, self.capacity, nextSlot, written + len(samples))
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def getRates(self, windows):
+        """
+        Return signature -> [(packets per second, bytes per second)], one
+        pair for each window (in seconds), ending at the last sample.
+        A counter smaller than the previous one was reset, its new value is
+        counted as the increase. Rules with less than two samples in a window
+        get no rate for it.
+        """
+
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_SH)
+        try:
+            (nextSlot, written) = self.getHeader()
+            count = min(written, self.capacity)
+            first = (nextSlot - count) % self.capacity
+
+            state = {}
+            if count > 0:
+                last = (nextSlot - 1) % self.capacity
+                latest = RECORD.unpack_from(self.map, HEADER_SIZE + last * RECORD.size)[1]
+                starts = [latest - window for window in windows]
+
+                # signature -> [time, packets, bytes] of the last record, then
+                # [first time, packets, bytes] of the increase in each window
+                for i in xrange(0, count):
+                    slot = (first + i) % self.capacity
+                    (signature, timestamp, packets, byteCount) = RECORD.unpack_from(self.map, HEADER_SIZE + slot * RECORD.size)
+
+                    previous = state.get(signature)
+                    if previous is None:
+                        state[signature] = [timestamp, packets, byteCount] + [None, 0, 0] * len(windows)
+                        continue
+
+                    packetIncrease = packets - previous[1] if packets >= previous[1] else packets
+                    byteIncrease = byteCount - previous[2] if byteCount >= previous[2] else byteCount
+
+                    for w in range(0, len(windows)):
+                        if previous[0] >= starts[w]:
+                            offset = 3 + 3 * w
+                            if previous[offset] is None:
+                                previous[offset] = previous[0]
+                            previous[offset + 1] += packetIncrease
+                            previous[offset + 2] += byteIncrease
+
+                    previous[0:3] = [timestamp, packets, byteCount]
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+        result = {}
+        for signature, values in state.items():
+            rates = []
+            for w in range(0, len(windows)):
+                offset = 3 + 3 * w
+                rate = None
+                if values[offset] is not None and values[0] > values[offset]:
+                    elapsed = values[0] - values[offset]
+                    rate = (values[offset + 1] / elapsed, values[offset + 2] / elapsed)
+                rates.append(rate)
+            result[signature] = rates
+
+        return result
@@ -0,0 +1,569 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+from array import array
+from elements import STANDARD_TARGETS, DEFAULT_POLICY
+from addresses import parseNetwork, AddressException, IPV4
+from logger import log
+
+# Targets that end the traversal of a packet. Anything not listed here and not
+# a user chain (LOG, MARK, CONNMARK, ...) lets the packet continue to the next rule.
+TERMINAL_TARGETS = ['ACCEPT', 'DROP', 'REJECT', 'QUEUE', 'NFQUEUE', 'DNAT', 'SNAT', 'MASQUERADE', 'REDIRECT', 'NETMAP', 'SAME', 'TPROXY']
+
+# Verdict reported for the packets accepted by a NAT style target
+TARGET_VERDICTS = { 'REJECT': 'DROP', 'DNAT': 'ACCEPT', 'SNAT': 'ACCEPT', 'MASQUERADE': 'ACCEPT', 'REDIRECT': 'ACCEPT',
+                    'NETMAP': 'ACCEPT', 'SAME': 'ACCEPT', 'TPROXY': 'ACCEPT', 'NFQUEUE': 'QUEUE' }
+
+PROTOCOLS = { 'all': 0, 'icmp': 1, 'tcp': 6, 'udp': 17, 'gre': 47, 'esp': 50, 'ah': 51, 'sctp': 132 }
+
+# Rule options that do not affect whether a packet matches
+NEUTRAL_OPTIONS = ['-j', '-g', '-m', '--comment', '-c']
+
+# Match options the simulator compiles, all of them take a value
+VALUE_OPTIONS = ['-s', '-d', '-p', '--sport', '--sports', '--dport', '--dports', '-i', '-o']
+
+# How many nested jumps we follow before giving up
+MAX_JUMP_DEPTH = 64
+
+ANY = -1
+
+
+class SimulatorException(Exception):
+    pass
+
+
+def parseAddress(value):
+    """Return the (network, mask) pair of an IPv4 address in address[/prefix|/mask] form"""
+
+    try:
+        (family, network, mask) = parseNetwork(value)
+    except AddressException:
+        family = None
+
+    if family != IPV4:
+        raise SimulatorException("Invalid IPv4 address %s" % value)
+
+    return network, mask
+
+def parseProtocol(value):
+    result = 0
+    if value is not None and value != "-":
+        name = value.lower()
+        if name in PROTOCOLS.keys():
+            result = PROTOCOLS[name]
+        elif name.isdigit():
+            result = int(name)
+        else:
+            raise SimulatorException("Unknown protocol %s" % value)
+
+    return result
+
+def parsePorts(value):
+    """Return a list of (low, high) port ranges from a 'port', 'low:high' or 'p1,p2:p3' spec"""
+
+    result = []
+    try:
+        for part in value.split(","):
+            if part.find(":") != -1:
+                low, high = part.split(":", 1)
+                if len(low) == 0:
+                    low = "0"
+                if len(high) == 0:
+                    high = "65535"
+                result.append( (int(low), int(high)) )
+            else:
+                result.append( (int(part), int(part)) )
+    except ValueError:
+        # service names
+        raise SimulatorException("Invalid ports %s" % value)
+
+    return result
+
+def getIndices(bits):
+    """The indices of the packets in a bitset, in order"""
+
+    result = []
+    text = bin(bits)[:1:-1]
+    index = text.find("1")
+    while index != -1:
+        result.append(index)
+        index = text.find("1", index + 1)
+
+    return result
+
+def countBits(bits):
+    return bin(bits).count("1")
+
+def interfaceMatches(spec, name):
+    result = False
+    if name is not None:
+        if spec.endswith("+"):
+            result = name.startswith(spec[0:-1])
+        else:
+            result = name == spec
+
+    return result
+
+def portMatches(ranges, port):
+    result = False
+    if port != ANY:
+        for low, high in ranges:
+            if low <= port <= high:
+                result = True
+                break
+
+    return result
+
+
+class CompiledChain:
+    """
+    A chain compiled into per column arrays, one entry per rule.
+    Numeric match columns use ANY (or a zero mask) to mean 'not specified'
+    """
+
+    def __init__(self, chain):
+        self.name = chain.getName()
+        self.policy = chain.getPolicy()
+
+        self.srcNet = array('L')
+        self.srcMask = array('L')
+        self.srcInv = array('b')
+        self.dstNet = array('L')
+        self.dstMask = array('L')
+        self.dstInv = array('b')
+        self.proto = array('l')
+        self.protoInv = array('b')
+        self.sports = []
+        self.sportInv = array('b')
+        self.dports = []
+        self.dportInv = array('b')
+        self.iif = []
+        self.iifInv = array('b')
+        self.oif = []
+        self.oifInv = array('b')
+        self.targets = []
+        self.gotos = array('b')
+        self.supported = array('b')
+        self.lines = []
+
+        for rule in chain.getRules():
+            self.compileRule(rule)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def compileRule(self, rule):
+        srcNet, srcMask, srcInv = 0, 0, 0
+        dstNet, dstMask, dstInv = 0, 0, 0
+        proto, protoInv = 0, 0
+        sports, sportInv = None, 0
+        dports, dportInv = None, 0
+        iif, iifInv = None, 0
+        oif, oifInv = None, 0
+        supported = 1
+        negate = 0
+
+        for prop in rule.properties:
+            name = prop.name
+            value = prop.value
+
+            if name == "!":
+                # "! -s x" negates the option that follows, "-s ! x" is parsed as "!" with value x
+                if value is None:
+                    negate = 1
+                    continue
+                else:
+                    log(71, "Old style negation in rule '%s' is not simulated" % rule.toStr())
+                    supported = 0
+
+            elif name in VALUE_OPTIONS and value is None:
+                # the option of an old style negation, "-s ! x" leaves -s without a value
+                log(71, "Option %s without a value in rule '%s' is not simulated" % (name, rule.toStr()))
+                supported = 0
+
+            elif name == "-s":
+                try:
+                    srcNet, srcMask = parseAddress(value)
+                    srcInv = negate
+                except SimulatorException:
+                    # address lists, host names and IPv6 networks are not simulated
+                    log(71, "Source %s in rule '%s' is not simulated" % (value, rule.toStr()))
+                    supported = 0
+            elif name == "-d":
+                try:
+                    dstNet, dstMask = parseAddress(value)
+                    dstInv = negate
+                except SimulatorException:
+                    log(71, "Destination %s in rule '%s' is not simulated" % (value, rule.toStr()))
+                    supported = 0
+            elif name == "-p":
+                try:
+                    proto = parseProtocol(value)
+                    protoInv = negate
+                except SimulatorException:
+                    log(71, "Protocol %s in rule '%s' is not simulated" % (value, rule.toStr()))
+                    supported = 0
+            elif name in ["--sport", "--sports"]:
+                try:
+                    sports = parsePorts(value)
+                    sportInv = negate
+                except SimulatorException:
+                    log(71, "Source ports %s in rule '%s' are not simulated" % (value, rule.toStr()))
+                    supported = 0
+            elif name in ["--dport", "--dports"]:
+                try:
+                    dports = parsePorts(value)
+                    dportInv = negate
+                except SimulatorException:
+                    log(71, "Destination ports %s in rule '%s' are not simulated" % (value, rule.toStr()))
+                    supported = 0
+            elif name == "-i":
+                iif = value
+                iifInv = negate
+            elif name == "-o":
+                oif = value
+                oifInv = negate
+            elif name in NEUTRAL_OPTIONS or self.isTargetOption(rule, name):
+                pass
+            else:
+                # state, conntrack, limit, mark, ... can't be decided from a flow tuple
+                supported = 0
+
+            negate = 0
+
+        target = rule.getTarget()
+        goto = 0
+        if rule.getProperty("-j") is None and target is not None:
+            goto = 1
+
+        self.srcNet.append(srcNet)
+        self.srcMask.append(srcMask)
+        self.srcInv.append(srcInv)
+        self.dstNet.append(dstNet)
+        self.dstMask.append(dstMask)
+        self.dstInv.append(dstInv)
+        self.proto.append(proto)
+        self.protoInv.append(protoInv)
+        self.sports.append(sports)
+        self.sportInv.append(sportInv)
+        self.dports.append(dports)
+        self.dportInv.append(dportInv)
+        self.iif.append(iif)
+        self.iifInv.append(iifInv)
+        self.oif.append(oif)
+        self.oifInv.append(oifInv)
+        self.targets.append(target)
+        self.gotos.append(goto)
+        self.supported.append(supported)
+        self.lines.append(rule.toStr())
+
+    def isTargetOption(self, rule, name):
+        """Options following the target (--to-destination, --log-prefix, ...) belong to the target"""
+
+        result = False
+        found = False
+        for prop in rule.properties:
+            if prop.name in ["-j", "-g"]:
+                found = True
+            elif found and prop.name == name:
+                result = True
+                break
+
+        return result
+
+    def match(self, index, packets, candidates):
+        """
+        Return the bitset of the candidate packets matched by rule #index.
+        Each condition selects a whole column of the batch at once, see
+        PacketBatch.select, and the selections are intersected.
+        """
+
+        result = 0
+        if self.supported[index]:
+            result = candidates
+
+        mask = self.srcMask[index]
+        if mask != 0 and result != 0:
+            net = self.srcNet[index]
+            bits = packets.select(("-s", net, mask), packets.src, lambda v: (v & mask) == net)
+            result = self.intersect(result, bits, self.srcInv[index])
+
+        mask = self.dstMask[index]
+        if mask != 0 and result != 0:
+            net = self.dstNet[index]
+            bits = packets.select(("-d", net, mask), packets.dst, lambda v: (v & mask) == net)
+            result = self.intersect(result, bits, self.dstInv[index])
+
+        proto = self.proto[index]
+        if proto != 0 and result != 0:
+            bits = packets.select(("-p", proto), packets.proto, lambda v: v == proto)
+            result = self.intersect(result, bits, self.protoInv[index])
+
+        ranges = self.sports[index]
+        if ranges is not None and result != 0:
+            bits = packets.select(("--sport", tuple(ranges)), packets.sport, lambda v: portMatches(ranges, v))
+            result = self.intersect(result, bits, self.sportInv[index])
+
+        ranges = self.dports[index]
+        if ranges is not None and result != 0:
+            bits = packets.select(("--dport", tuple(ranges)), packets.dport, lambda v: portMatches(ranges, v))
+            result = self.intersect(result, bits, self.dportInv[index])
+
+        spec = self.iif[index]
+        if spec is not None and result != 0:
+            bits = packets.select(("-i", spec), packets.iif, lambda v: interfaceMatches(spec, v))
+            result = self.intersect(result, bits, self.iifInv[index])
+
+        spec = self.oif[index]
+        if spec is not None and result != 0:
+            bits = packets.select(("-o", spec), packets.oif, lambda v: interfaceMatches(spec, v))
+            result = self.intersect(result, bits, self.oifInv[index])
+
+        return result
+
+    def intersect(self, candidates, bits, inv):
+        result = candidates & bits
+        if inv:
+            result = candidates & ~bits
+
+        return result
+
+
+class PacketBatch:
+    """
+    A batch of flow tuples stored as columns. Sets of packets are bitsets,
+    bit #i for packet #i, so that they are combined a whole batch at a time.
+    """
+
+    def __init__(self):
+        self.src = array('L')
+        self.dst = array('L')
+        self.proto = array('l')
+        self.sport = array('l')
+        self.dport = array('l')
+        self.iif = []
+        self.oif = []
+        self.lines = []
+        self.selections = {}
+
+    def __len__(self):
+        return len(self.lines)
+
+    def getAll(self):
+        """The bitset of all the packets"""
+
+        return (1 << len(self)) - 1
+
+    def select(self, key, column, test):
+        """
+        Return the bitset of the packets whose value in column passes test.
+        Rules often share a condition, so the result is kept under key.
+        """
+
+        result = self.selections.get(key)
+        if result is None:
+            flags = ["1" if test(value) else "0" for value in reversed(column)]
+            result = int("0" + "".join(flags), 2)
+            self.selections[key] = result
+
+        return result
+
+    def append(self, line):
+        """
+        Add a flow in the form: src dst [proto [sport [dport [in-interface [out-interface]]]]]
+        Use '-' for a field that is not known
+        """
+
+        parts = line.split()
+        if len(parts) < 2:
+            raise SimulatorException("Invalid flow '%s': source and destination are required" % line)
+
+        while len(parts) < 7:
+            parts.append("-")
+
+        self.src.append(parseAddress(parts[0])[0])
+        self.dst.append(parseAddress(parts[1])[0])
+        self.proto.append(parseProtocol(parts[2]))
+        self.sport.append(self.parsePort(parts[3]))
+        self.dport.append(self.parsePort(parts[4]))
+        self.iif.append(self.parseInterface(parts[5]))
+        self.oif.append(self.parseInterface(parts[6]))
+        self.lines.append(line)
+        self.selections = {}
+
+    def parsePort(self, value):
+        result = ANY
+        if value != "-":
+            result = int(value)
+
+        return result
+
+    def parseInterface(self, value):
+        result = None
+        if value != "-":
+            result = value
+
+        return result
+
+
+class SimulationResult:
+    def __init__(self, tableName, chainName, size):
+        self.tableName = tableName
+        self.chainName = chainName
+        self.verdicts = [None] * size
+        self.hits = {}
+        self.unsupported = {}
+
+    def addHits(self, chainName, index, count):
+        key = (chainName, index)
+        if key not in self.hits:
+            self.hits[key] = 0
+
+        self.hits[key] += count
+
+    def getVerdictCounts(self):
+        result = {}
+        for verdict in self.verdicts:
+            if verdict not in result:
+                result[verdict] = 0
+            result[verdict] += 1
+
+        return result
+
+
+class Simulator:
+    """
+    Replay batches of packets against a table of a Ruleset.
+    Each chain is compiled once; each rule is then evaluated against all the
+    packets of the batch that are still traversing its chain.
+    """
+
+    def __init__(self, ruleset, tableName='filter'):
+        self.table = ruleset.getTable(tableName)
+        if self.table is None:
+            raise SimulatorException("Table %s not found in %s" % (tableName, ruleset.getName()))
+
+        self.compiled = {}
+        for chain in self.table.chains():
+            self.compiled[chain.getName()] = CompiledChain(chain)
+
+    def getChain(self, name):
+        result = None
+        if name in self.compiled:
+            result = self.compiled[name]
+
+        return result
+
+    def run(self, packets, chainName='INPUT'):
+        chain = self.getChain(chainName)
+        if chain is None:
+            raise SimulatorException("Chain %s/%s not found" % (self.table.getName(), chainName))
+
+        result = SimulationResult(self.table.getName(), chainName, len(packets))
+        returned = self.runChain(chain, packets, packets.getAll(), result, 0)
+
+        policy = chain.policy
+        if policy == "-":
+            policy = DEFAULT_POLICY
+
+        for p in getIndices(returned):
+            result.verdicts[p] = policy
+
+        return result
+
+    def runChain(self, chain, packets, pending, result, depth):
+        """Evaluate the pending packets (a bitset) through chain, return the ones falling through or RETURNing"""
+
+        if depth > MAX_JUMP_DEPTH:
+            raise SimulatorException("Too many nested jumps while evaluating chain %s, loop?" % chain.name)
+
+        returned = 0
+
+        for index in range(0, len(chain)):
+            if pending == 0:
+                break
+
+            if not chain.supported[index]:
+                result.unsupported[(chain.name, index)] = chain.lines[index]
+
+            matched = chain.match(index, packets, pending)
+            if matched == 0:
+                continue
+
+            result.addHits(chain.name, index, countBits(matched))
+            target = chain.targets[index]
+
+            if target is None:
+                # no target, the packets go on with the next rule
+                pass
+
+            elif target == 'RETURN':
+                pending &= ~matched
+                returned |= matched
+
+            elif target in TERMINAL_TARGETS or target in STANDARD_TARGETS:
+                pending &= ~matched
+                verdict = target
+                if target in TARGET_VERDICTS:
+                    verdict = TARGET_VERDICTS[target]
+
+                for p in getIndices(matched):
+                    result.verdicts[p] = verdict
+
+            elif target in self.compiled:
+                pending &= ~matched
+                back = self.runChain(self.compiled[target], packets, matched, result, depth + 1)
+                if chain.gotos[index]:
+                    # a goto does not come back here: RETURN goes to our caller
+                    returned |= back
+                else:
+                    pending |= back
+
+            else:
+                # Non terminating target (LOG, MARK, ...): continue with the next rule
+                pass
+
+        returned |= pending
+
+        return returned
+
+
+def readPackets(lines):
+    packets = PacketBatch()
+    for line in lines:
+        line = line.strip()
+        if len(line) > 0 and not line.startswith("#"):
+            packets.append(line)
+
+    return packets
+
+def compareVerdicts(thisResult, otherResult):
+    """Return the indices of the packets whose verdict differs between 2 simulations"""
+
+    result = []
+    for index in range(0, len(thisResult.verdicts)):
+        if thisResult.verdicts[index] != otherResult.verdicts[index]:
+            result.append(index)
+
+    return result
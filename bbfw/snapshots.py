@@ -0,0 +1,257 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+
+
+import os, time, zlib, hashlib, fcntl
+from logger import log
+from defaults import DEFAULT_SNAPSHOTS, DEFAULT_KEEP
+
+# bbfwmgr imports this module for its defaults: the parser and tempfile are
+# only imported when a snapshot is loaded or saved
+
+# Layout of a snapshot store:
+#   blobs/XX/HASH   the policy and rules of a chain, zlib compressed. HASH is
+#                   the sha1 of the uncompressed content, so a chain that
+#                   didn't change is stored once for all the snapshots
+#   snapshots/ID    one manifest per snapshot: 'time', 'note', then a '*table'
+#                   line followed by 'CHAIN HASH' lines for each table
+#   lock            serializes saves and evictions
+# A manifest is written after all its blobs, so a snapshot is never partial.
+
+
+
+class SnapshotException(Exception):
+    pass
+
+
+def getChainBlob(chain):
+    lines = [chain.getPolicy()]
+    for rule in chain.getRules():
+        lines.append(rule.toStr())
+
+    return "\n".join(lines)
+
+def writeFileAtomically(path, content, mode=None):
+    import tempfile
+    (fd, tmpName) = tempfile.mkstemp(prefix=".%s." % os.path.basename(path), dir=os.path.dirname(path))
+    try:
+        if mode is not None:
+            os.fchmod(fd, mode)
+        f = os.fdopen(fd, 'wb')
+        f.write(content)
+        f.close()
+        os.rename(tmpName, path)
+    except:
+        os.remove(tmpName)
+        raise
+
+class SnapshotStore:
+    """A history of rulesets, stored as content addressed chains"""
+
+    def __init__(self, rootDir=DEFAULT_SNAPSHOTS):
+        self.rootDir = rootDir
+        self.blobDir = os.path.join(rootDir, "blobs")
+        self.manifestDir = os.path.join(rootDir, "snapshots")
+
+    def lock(self):
+        for folder in [self.blobDir, self.manifestDir]:
+            if not os.path.isdir(folder):
+                os.makedirs(folder, 0700)
+
+        lockFile = open(os.path.join(self.rootDir, "lock"), 'a')
+        fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX)
+
+        return lockFile
+
+    def unlock(self, lockFile):
+        fcntl.flock(lockFile.fileno(), fcntl.LOCK_UN)
+        lockFile.close()
+
+    def getBlobPath(self, blobHash):
+        return os.path.join(self.blobDir, blobHash[0:2], blobHash)
+
+    def getIds(self):
+        """The ids of the stored snapshots, oldest first"""
+
+        result = []
+        if os.path.isdir(self.manifestDir):
+            result = sorted([int(name) for name in os.listdir(self.manifestDir) if name.isdigit()])
+
+        return result
+
+    def getLatestId(self):
+        ids = self.getIds()
+        if len(ids) == 0:
+            raise SnapshotException("There are no snapshots in %s" % self.rootDir)
+
+        return ids[-1]
+
+    def save(self, ruleset, note=""):
+        """Store ruleset as a new snapshot and return its id"""
+
+        lockFile = self.lock()
+        try:
+            lines = ["time %d" % int(time.time()), "note %s" % note.replace("\n", " ")]
+            written = 0
+
+            for tableName in sorted(ruleset.getTables().keys()):
+                lines.append("*%s" % tableName)
+                for chain in ruleset.getTable(tableName).chains():
+                    blob = getChainBlob(chain)
+                    blobHash = hashlib.sha1(blob).hexdigest()
+                    path = self.getBlobPath(blobHash)
+
+                    if not os.path.exists(path):
+                        if not os.path.isdir(os.path.dirname(path)):
+                            os.mkdir(os.path.dirname(path), 0700)
+                        writeFileAtomically(path, zlib.compress(blob))
+                        written += 1
+
+                    lines.append("%s %s" % (chain.getName(), blobHash))
+
+            ids = self.getIds()
+            result = 1
+            if len(ids) > 0:
+                result = ids[-1] + 1
+
+            # don't pile up snapshots of a ruleset that didn't change
+            if len(ids) > 0 and self.readManifestLines(ids[-1])[2:] == lines[2:]:
+                result = ids[-1]
+                log(50, "The ruleset is the same as in snapshot %s, not saved again" % result)
+            else:
+                writeFileAtomically(os.path.join(self.manifestDir, "%d" % result), "\n".join(lines) + "\n")
+                log(50, "Saved snapshot %s, %s new chain blobs written" % (result, written))
+        finally:
+            self.unlock(lockFile)
+
+        return result
+
+    def readManifestLines(self, snapshotId):
+        path = os.path.join(self.manifestDir, "%d" % snapshotId)
+        if not os.path.isfile(path):
+            raise SnapshotException("Unknown snapshot %s" % snapshotId)
+
+        f = open(path, 'r')
+        result = f.read().splitlines()
+        f.close()
+
+        return result
+
+    def readManifest(self, snapshotId):
+        """Return (time, note, [(table, [(chain, hash), ...]), ...]) for a snapshot"""
+
+        created = 0
+        note = ""
+        tables = []
+
+        for line in self.readManifestLines(snapshotId):
+            if line.startswith("time "):
+                created = int(line[5:])
+            elif line.startswith("note "):
+                note = line[5:]
+            elif line.startswith("*"):
+                tables.append( (line[1:], []) )
+            elif len(line) > 0:
+                (chainName, blobHash) = line.split()
+                tables[-1][1].append( (chainName, blobHash) )
+
+        return created, note, tables
+
+    def list(self):
+        """Return (id, time, note, chain count) for each snapshot, oldest first"""
+
+        result = []
+        for snapshotId in self.getIds():
+            (created, note, tables) = self.readManifest(snapshotId)
+            chains = sum([len(chains) for tableName, chains in tables])
+            result.append( (snapshotId, created, note, chains) )
+
+        return result
+
+    def load(self, snapshotId):
+        (created, note, tables) = self.readManifest(snapshotId)
+
+        lines = []
+        for tableName, chains in tables:
+            lines.append("*%s" % tableName)
+            rules = []
+            for chainName, blobHash in chains:
+                f = open(self.getBlobPath(blobHash), 'rb')
+                blob = zlib.decompress(f.read()).split("\n")
+                f.close()
+
+                lines.append(":%s %s [0:0]" % (chainName, blob[0]))
+                rules.extend(["-A %s %s" % (chainName, rule) for rule in blob[1:]])
+
+            lines.extend(rules)
+            lines.append("COMMIT")
+
+        from parsers import IPTSaveFileParser
+        parser = IPTSaveFileParser(lines)
+        result = parser.parse()
+        result.name = "Snapshot %s (%s)" % (snapshotId, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created)))
+
+        return result
+
+    def evict(self, keep=DEFAULT_KEEP):
+        """Remove all but the keep most recent snapshots, and the chain blobs only they used"""
+
+        removed = 0
+
+        lockFile = self.lock()
+        try:
+            ids = self.getIds()
+            if len(ids) > keep:
+                for snapshotId in ids[0:len(ids) - keep]:
+                    os.remove(os.path.join(self.manifestDir, "%d" % snapshotId))
+                    removed += 1
+
+                used = set()
+                for snapshotId in self.getIds():
+                    for tableName, chains in self.readManifest(snapshotId)[2]:
+                        used.update([blobHash for chainName, blobHash in chains])
+
+                blobs = 0
+                for prefix in os.listdir(self.blobDir):
+                    for blobHash in os.listdir(os.path.join(self.blobDir, prefix)):
+                        if blobHash not in used:
+                            os.remove(os.path.join(self.blobDir, prefix, blobHash))
+                            blobs += 1
+
+                log(50, "Evicted %s snapshots and %s chain blobs" % (removed, blobs))
+        finally:
+            self.unlock(lockFile)
+
+        return removed
+
+def takeSnapshot(ruleset, rootDir, keep, note):
+    """Save ruleset in the store at rootDir and evict the snapshots beyond keep. Return the snapshot id"""
+
+    store = SnapshotStore(rootDir)
+    result = store.save(ruleset, note)
+    store.evict(keep)
+
+    return result
@@ -23,9 +23,10 @@
 
 
 
-import traceback, subprocess
-from elements import Rule, TABLE_CHAINS
-from renderers import FileRenderer
+import traceback, subprocess, threading, errno
+from elements import TABLE_CHAINS, Chain, ChainDelta
+from compare import RulesetComparator
+from renderers import FileRenderer, ChainDeltaRenderer
 from parsers import IPTSaveFileParser
 from logger import log
 
@@ -70,12 +71,48 @@ def purgeTableOLD(table, chain, recursive=True):
     else:
         print "No chains were deleted, configuration unchanged."
 
-def purgeTable(table, chain, recursive=True):
+def purgeTable(table, chain, recursive=False, dryRun=False, ruleset=None):
+    """
+    Remove a chain (or all the chains) from a table, or from all the tables.
+    Only the removed chains and the rules jumping to them are touched: the
+    changes are applied with a single 'iptables-restore --noflush' script.
+    """
+
+    if ruleset is None:
+        ruleset = getCurrentRuleset()
+
+    applyPurgeDelta(getPurgeDelta(ruleset, table, chain, recursive), dryRun)
+
+def applyPurgeDelta(delta, dryRun=False):
+    """Apply the changes computed by getPurgeDelta, or only list them"""
+
     deletions = 0
-    ruleset = getCurrentRuleset()
+    for tableName in delta.getTableNames():
+        deletions = deletions + len(delta.getDeleted(tableName))
+
+    if delta.isEmpty():
+        print "No chains were deleted, configuration unchanged."
+    elif dryRun:
+        print "The following changes would be applied:\n%s" % describeChainDelta(delta)
+    elif applyChainDelta(delta, True):
+        print "Removed %s chains, done." % deletions
+    else:
+        raise Exception("iptables-restore refused the changes, configuration unchanged")
+
+def getPurgeDelta(ruleset, table, chain, recursive=False):
+    """
+    Compute the changes that purge the specified chain (or all the chains)
+    of a table, or of all the tables: builtin chains are flushed and their
+    policy reset to ACCEPT, user chains are flushed and deleted, and the rules
+    jumping to them from the remaining chains are deleted first.
+    When recursive, the user chains only reachable from the purged ones are
+    purged too.
+    """
+
+    delta = ChainDelta()
     tables = ruleset.getTables()
 
-    tablesToPurge = tables.keys()
+    tablesToPurge = sorted(tables.keys())
 
     # If a table has been specified, only purge that one
     if table is not None:
@@ -84,21 +121,129 @@ def purgeTable(table, chain, recursive=True):
         else:
             raise Exception("Unknown table %s" % table)
 
+    found = False
     for tableToPurge in tablesToPurge:
+        tableObject = ruleset.getTable(tableToPurge)
+        chainNames = [c.getName() for c in tableObject.chains(chain)]
+        if chain is not None and len(chainNames) == 0:
+            # without -t, the chain is purged from the tables that have it
+            if table is not None:
+                raise Exception("Unknown chain %s in table %s specified for deletion, aborting" % (chain, tableToPurge))
+            continue
+
         log(50, "Now purging table %s" % tableToPurge)
+        found = True
 
-        tableObject = ruleset.getTable(tableToPurge)
-        for chainToDelete in tableObject.chains(chain):
-            log(21, "Now deleting chain %s" % chainToDelete)
-            deletions = deletions + purgeChain(tableObject, chainToDelete )
-            log(70, "Chain %s removed from table %s" % (chainToDelete, tableToPurge))
+        if recursive:
+            chainNames = getPurgeClosure(tableObject, chainNames)
 
-    if deletions > 0:
-        # Apply changes
-        loadRuleset(ruleset, True, True)
-        print "Removed %s chains, done." % deletions
-    else:
-        print "No chains were deleted, configuration unchanged."
+        builtins = TABLE_CHAINS[tableToPurge]
+        deleted = [name for name in chainNames if name not in builtins]
+
+        for chainName in chainNames:
+            if chainName in builtins:
+                log(80, "Chain %s is builtin, cannot remove it" % chainName)
+                delta.replace(tableToPurge, Chain(chainName, tableObject, policy="ACCEPT"))
+
+        for chainObj in tableObject.chains():
+            if chainObj.getName() in chainNames:
+                continue
+
+            index = 0
+            for rule in chainObj.getRules():
+                if rule.getTarget() in deleted:
+                    log(41, "Rule '%s' in chain %s references a purged chain, removed" % (rule, chainObj.getName()))
+                    delta.deleteRule(tableToPurge, chainObj, index)
+                index += 1
+
+        for chainName in deleted:
+            log(40, "Deleting chain %s/%s" % (tableToPurge, chainName))
+            delta.delete(tableToPurge, chainName)
+
+    if chain is not None and not found:
+        raise Exception("Unknown chain %s specified for deletion, aborting" % chain)
+
+    return delta
+
+def getPurgeClosure(table, chainNames):
+    """
+    Add to chainNames the user chains they jump to, directly or not, unless
+    a chain that is not purged jumps to them as well
+    """
+
+    result = list(chainNames)
+    builtins = TABLE_CHAINS[table.getName()]
+
+    added = True
+    while added:
+        added = False
+        for chainName in list(result):
+            for child in table.getChain(chainName).getChildrenNames():
+                if child in result or child in builtins or not table.hasChain(child):
+                    continue
+
+                referers = table.getChain(child).getReferers()
+                if len([r for r in referers if r not in result]) == 0:
+                    log(50, "Chain %s is only used by purged chains, purging it too" % child)
+                    result.append(child)
+                    added = True
+                else:
+                    log(50, "Chain %s is also used outside the purged chains, keeping it" % child)
+
+    return result
+
+def getRulesetDelta(current, target):
+    """
+    Compute the changes that turn the current ruleset into target: the
+    chains that differ are replaced, the user chains target doesn't have
+    are deleted, and the tables target doesn't have are purged.
+    """
+
+    delta = ChainDelta()
+    comparator = RulesetComparator(target, current)
+
+    for tableName in comparator.getTableNames():
+        targetTable = target.getTable(tableName)
+        currentTable = current.getTable(tableName)
+        builtins = TABLE_CHAINS[tableName]
+
+        if targetTable is None:
+            for chainObj in currentTable.chains():
+                if chainObj.getName() not in builtins:
+                    delta.delete(tableName, chainObj.getName())
+                elif len(chainObj.getRules()) > 0 or chainObj.getPolicy() not in ["ACCEPT", "-"]:
+                    delta.replace(tableName, Chain(chainObj.getName(), currentTable, policy="ACCEPT"))
+            continue
+
+        for chainObj in targetTable.chains():
+            # Rule.equals only checks that one rule's options are in the other:
+            # a live rule with extra matches must still be replaced
+            equal = comparator.chainEquals(tableName, chainObj.getName())
+            if equal:
+                currentChain = currentTable.getChain(chainObj.getName())
+                equal = currentChain.equals(chainObj, chainObj.isUnordered() or currentChain.isUnordered())
+
+            if not equal:
+                delta.replace(tableName, chainObj)
+
+        if currentTable is not None:
+            for chainObj in currentTable.chains():
+                if not targetTable.hasChain(chainObj.getName()) and chainObj.getName() not in builtins:
+                    delta.delete(tableName, chainObj.getName())
+
+    return delta
+
+def describeChainDelta(delta):
+    lines = []
+    for tableName in delta.getTableNames():
+        for chainObj in delta.getReplaced(tableName):
+            lines.append("  %s: flush chain %s, set policy %s" % (tableName, chainObj.getName(), chainObj.getPolicy()))
+        for chainObj, index in delta.getDeletedRules(tableName):
+            lines.append("  %s: delete rule -A %s %s" % (tableName, chainObj.getName(), chainObj.getRules()[index].toStr()))
+        for chainName in delta.getDeleted(tableName):
+            lines.append("  %s: delete chain %s" % (tableName, chainName))
+
+    return "\n".join(lines)
 
 def purgeChain(table, chainName):
     removed = 0
@@ -146,51 +291,174 @@ def purgeReferences(table, chainName, target):
 
     return refremoved
 
-def getCurrentRuleset():
-    iptp = subprocess.Popen(['iptables-save'],stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+def getCurrentLines(table=None, counters=False):
+    """The lines of 'iptables-save', with the counters of each rule if requested"""
+
+    command = ['iptables-save']
+    if counters:
+        command.append('-c')
+    if table is not None:
+        command.extend(['-t', table])
+
+    iptp = subprocess.Popen(command,stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
 
     (out, err) = iptp.communicate()
-    lines = out.split("\n")
+    return out.split("\n")
+
+def getCurrentRuleset(table=None, chain=None, counters=False):
+    """
+    Read the current netfilter configuration, or only the specified table and chain.
+    With counters, the packet and byte counters are read along in the same dump
+    """
+
+    lines = getCurrentLines(table, counters)
     parser = IPTSaveFileParser(lines)
+    parser.setFilter(table, chain)
     config = parser.parse()
     config.name = "Currently loaded ruleset"
 
     return config
 
+def readStream(stream, buffer):
+    for data in iter(lambda: stream.read(4096), ""):
+        buffer.append(data)
+
+    stream.close()
+
+def streamToProcess(process, renderer):
+    """
+    Render straight into the stdin of process, while reading its stdout
+    and stderr in separate threads. Return (stdout, stderr) like communicate()
+    """
+
+    outbuffer = []
+    errbuffer = []
+    readers = [ threading.Thread(target=readStream, args=(process.stdout, outbuffer)),
+                threading.Thread(target=readStream, args=(process.stderr, errbuffer)) ]
+
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+
+    try:
+        renderer.renderTo(process.stdin)
+        process.stdin.close()
+    except IOError, e:
+        # the process exited before reading all its input, its stderr will tell why
+        if e.errno != errno.EPIPE:
+            raise
+
+    for reader in readers:
+        reader.join()
+
+    process.wait()
+
+    return "".join(outbuffer), "".join(errbuffer)
+
 def loadRuleset(ruleset, quiet=False, wipe=False):
     fileRenderer = FileRenderer(ruleset)
-    string = fileRenderer.render()
-    iptp = subprocess.Popen(['iptables-restore'],stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-    (outmsg, errmsg) = iptp.communicate(string)
+    return restore(fileRenderer, [], quiet)
+
+def applyChainDelta(changes, quiet=False):
+    """
+    Apply the chain changes (see ChainDeltaRenderer) to netfilter, without
+    touching the other chains
+    """
+
+    renderer = ChainDeltaRenderer(changes)
+    return restore(renderer, ['--noflush'], quiet)
+
+def restore(renderer, options, quiet=False):
+    """
+    Stream the output of renderer into iptables-restore, return True on success.
+    On failure the config rule that caused it is always printed, and unless
+    quiet the whole output of iptables-restore too.
+    """
+
+    iptp = subprocess.Popen(['iptables-restore'] + options,stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+    (outmsg, errmsg) = streamToProcess(iptp, renderer)
 
     if iptp.returncode != 0:
-        oldLines = string.split("\n")
-        errlines = errmsg.split("\n")
-        errline = -1
-        configErrLine = "<can't determine line>"
-        configChain = "<can't determine chain>"
-        configTable = "<can't determine table>"
+        print "\nCould not load config.\n%s" % describeRestoreError(renderer, errmsg)
+        if not quiet:
+            print "iptables-restore output:\n%s" % errmsg.strip()
+
+    return iptp.returncode == 0
+
+def describeRestoreError(renderer, errmsg):
+    """Describe the config rule that made iptables-restore fail with errmsg"""
+
+    errlines = errmsg.split("\n")
+    errline = -1
+    configErrLine = "<can't determine line>"
+    configChain = "<can't determine chain>"
+    configTable = "<can't determine table>"
+    configSource = "<can't determine config file>"
+    try:
+        for line in errlines:
+            if line.find("Error occurred at line") == 0:
+                parts = line.split()
+                errline = int(parts[len(parts) - 1])
+
+                source = renderer.getLineSource(errline)
+                if source is not None:
+                    (configTable, configChain, index, fileName, fileLine) = source
+                    (chain, index) = renderer.getLineOrigin(errline)
+                    configErrLine = "-A %s %s" % (configChain, chain.getRules()[index].toStr())
+                    if fileName is not None:
+                        configSource = "%s:%s" % (fileName, fileLine)
+
+                break
+
+    except Exception,e:
+        traceback.print_exc()
+
+    return "Error occurred while loading the following rule (restore line# %s, chain %s in %s, from %s):\n-->  %s\nError is: %s" % (errline, configChain, configTable, configSource, configErrLine, errlines[0])
+
+class RestoreTest(threading.Thread):
+    """
+    Run 'iptables-restore --test' on the output of renderer in the
+    background, so that a ruleset can be validated while other work is done.
+    getResult() waits for the test and returns (valid, error description).
+    """
+
+    def __init__(self, renderer, options=[]):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.renderer = renderer
+        self.options = options
+        self.valid = False
+        self.error = None
+
+    def run(self):
         try:
-            for line in errlines:
-                if line.find("Error occurred at line") == 0:
-                    parts = line.split()
-                    errline = int(parts[len(parts) - 1])
+            iptp = subprocess.Popen(['iptables-restore', '--test'] + self.options,stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+            (outmsg, errmsg) = streamToProcess(iptp, self.renderer)
+            self.valid = iptp.returncode == 0
+            if not self.valid:
+                self.error = describeRestoreError(self.renderer, errmsg)
+        except Exception, e:
+            self.error = "Can't run iptables-restore --test: %s" % e
 
-                    lines = fileRenderer.renderLines()
-                    if len(oldLines) > errline:
-                        configErrLine = oldLines[errline - 1]
-                        rule = Rule(configErrLine)
-                        chain = ruleset.getChainFromRule(rule)
-                        configTable = chain.getRoot()
-                        configChain = chain.getName()
+    def getResult(self):
+        self.join()
+        return self.valid, self.error
 
-                    break
+def testRuleset(ruleset):
+    """Start validating ruleset with iptables-restore --test, return the running RestoreTest"""
 
-        except Exception,e:
-            traceback.print_exc()
+    result = RestoreTest(FileRenderer(ruleset))
+    result.start()
 
-        if not quiet:
-            print "\nCould not load config.\nError occurred while loading the following rule (config line# %s, chain %s in %s):\n-->  %s\nError is: %s" % (errline, configChain, configTable, configErrLine, errlines[0])
+    return result
+
+def testChainDelta(changes):
+    """Start validating the chain changes (see applyChainDelta), return the running RestoreTest"""
+
+    result = RestoreTest(ChainDeltaRenderer(changes), ['--noflush'])
+    result.start()
+
+    return result
 
 def mergeRulesetsOLD(master, slave, wipe=False):
     """
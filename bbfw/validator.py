@@ -0,0 +1,265 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+
+
+from elements import TABLE_CHAINS, TABLE_TARGETS, STANDARD_TARGETS, EXTENDED_TARGETS
+from logger import log
+
+CRITICAL = "Critical"
+WARNING = "Warning"
+INFO = "Info"
+SEVERITIES = [CRITICAL, WARNING, INFO]
+
+# Targets of iptables extensions that can be used in any table. Any other
+# target that is neither one of these, a table specific target nor a chain
+# is a jump to a missing chain
+EXTENSION_TARGETS = ['AUDIT', 'CHECKSUM', 'CT', 'HL', 'HMARK', 'IDLETIMER', 'LED', 'SYNPROXY', 'TEE', 'TRACE']
+
+
+class Finding:
+    """A problem found in a chain, or in one of its rules when index is not None"""
+
+    def __init__(self, severity, tableName, chainName, index, message):
+        self.severity = severity
+        self.tableName = tableName
+        self.chainName = chainName
+        self.index = index
+        self.message = message
+
+    def __str__(self):
+        location = "%s/%s" % (self.tableName, self.chainName)
+        if self.index is not None:
+            location = "%s rule #%s" % (location, self.index + 1)
+
+        return "%s: %s" % (location, self.message)
+
+def getFindingLines(findings, severities=SEVERITIES):
+    lines = []
+    for severity in severities:
+        for finding in findings[severity]:
+            lines.append("%-8s %s" % (severity, finding))
+
+    return lines
+
+def printFindings(findings, verbose=False):
+    """Print the Critical and Warning findings, the Info ones too if verbose. Return False if any is Critical"""
+
+    severities = [CRITICAL, WARNING]
+    if verbose:
+        severities.append(INFO)
+
+    lines = getFindingLines(findings, severities)
+    if len(lines) > 0:
+        print "\n".join(lines)
+
+    return len(findings[CRITICAL]) == 0
+
+
+class Validator:
+    """
+    Check the jump graph of every table of a ruleset. Each rule is looked
+    at once to build the graph; loops, reachability from the builtin chains
+    and unreferenced chains are then found with linear walks of the graph.
+    When base is given, ruleset is a config about to be loaded on top of it:
+    jumps are resolved against the chains of both, but only the chains of
+    the config are reported on.
+    """
+
+    def __init__(self, ruleset, base=None):
+        self.ruleset = ruleset
+        self.base = base
+        self.findings = {}
+        for severity in SEVERITIES:
+            self.findings[severity] = []
+
+        self.knownTargets = set(STANDARD_TARGETS + EXTENDED_TARGETS + EXTENSION_TARGETS)
+
+        # table specific target -> the tables it can be used in
+        self.tableTargets = {}
+        for tableName, chainTargets in TABLE_TARGETS.items():
+            for targets in chainTargets.values():
+                for target in targets:
+                    self.tableTargets.setdefault(target, set()).add(tableName)
+
+    def add(self, severity, tableName, chainName, index, message):
+        self.findings[severity].append(Finding(severity, tableName, chainName, index, message))
+
+    def getBaseTable(self, tableName):
+        result = None
+        if self.base is not None:
+            result = self.base.getTable(tableName)
+
+        return result
+
+    def getChains(self, table):
+        """The chains of table, followed by those of the base table it doesn't replace"""
+
+        result = list(table.chains())
+        baseTable = self.getBaseTable(table.getName())
+        if baseTable is not None:
+            result.extend([chain for chain in baseTable.chains() if not table.hasChain(chain.getName())])
+
+        return result
+
+    def validate(self):
+        tables = self.ruleset.getTables()
+
+        # chain name -> tables, to tell jumps to other tables from dangling jumps
+        chainTables = {}
+        for tableName, table in tables.items():
+            for chain in self.getChains(table):
+                chainTables.setdefault(chain.getName(), []).append(tableName)
+
+        for tableName in sorted(tables.keys()):
+            self.validateTable(tables[tableName], chainTables)
+
+        log(50, "Validation found %s" % ", ".join(["%s %s" % (len(self.findings[s]), s) for s in SEVERITIES]))
+
+        return self.findings
+
+    def validateTable(self, table, chainTables):
+        tableName = table.getName()
+        builtins = TABLE_CHAINS[tableName]
+        chains = self.getChains(table)
+        # the chains reported on, the others are only walked through
+        selected = set([chain.getName() for chain in table.chains()])
+        names = set([chain.getName() for chain in chains])
+
+        # chain -> [(child, rule index)] for the jumps to user chains
+        edges = {}
+        referenced = set()
+        # (chain, rule index, target) for the targets only valid in some builtin chains
+        restricted = []
+
+        for chain in chains:
+            chainName = chain.getName()
+            report = chainName in selected
+            children = []
+            edges[chainName] = children
+
+            index = 0
+            for rule in chain.getRules():
+                target = rule.getTarget()
+
+                if target is None or target is True or target in self.knownTargets:
+                    pass
+                elif target in names:
+                    if target in builtins:
+                        if report:
+                            self.add(CRITICAL, tableName, chainName, index, "jumps to builtin chain %s" % target)
+                    else:
+                        children.append( (target, index) )
+                        referenced.add(target)
+                elif not report:
+                    pass
+                elif target in self.tableTargets:
+                    if tableName in self.tableTargets[target]:
+                        restricted.append( (chainName, index, target) )
+                    else:
+                        self.add(WARNING, tableName, chainName, index, "target %s is meant for table %s" % (target, ", ".join(sorted(self.tableTargets[target]))))
+                elif target in chainTables:
+                    self.add(CRITICAL, tableName, chainName, index, "jumps to chain %s of table %s, rules can only jump to chains of their own table" % (target, ", ".join(chainTables[target])))
+                else:
+                    self.add(CRITICAL, tableName, chainName, index, "jumps to chain %s, that doesn't exist" % target)
+
+                index += 1
+
+            if report and chainName not in builtins and index == 0:
+                self.add(INFO, tableName, chainName, None, "user chain is empty")
+
+        for chainName in sorted(selected):
+            if chainName not in builtins and chainName not in referenced:
+                self.add(WARNING, tableName, chainName, None, "user chain is never jumped to")
+
+        roots = self.getRoots(tableName, edges)
+        chainTargets = TABLE_TARGETS.get(tableName, {})
+        for chainName, index, target in restricted:
+            forbidden = [root for root in sorted(roots.get(chainName, [])) if target not in chainTargets.get(root, [])]
+            if len(forbidden) > 0:
+                self.add(CRITICAL, tableName, chainName, index, "target %s is not allowed in builtin chain %s" % (target, ", ".join(forbidden)))
+
+        self.findLoops(tableName, edges, selected)
+
+    def getRoots(self, tableName, edges):
+        """Return chain -> the builtin chains it can be reached from"""
+
+        result = {}
+        for root in TABLE_CHAINS[tableName]:
+            if root not in edges:
+                continue
+
+            result.setdefault(root, set()).add(root)
+            pending = [root]
+            while len(pending) > 0:
+                chainName = pending.pop()
+                for child, index in edges[chainName]:
+                    reached = result.setdefault(child, set())
+                    if root not in reached:
+                        reached.add(root)
+                        pending.append(child)
+
+        return result
+
+    def findLoops(self, tableName, edges, selected):
+        """
+        Depth first walk of the jump graph, a jump back to a chain being walked
+        closes a loop. Only the loops going through a selected chain are reported
+        """
+
+        WALKING = 1
+        DONE = 2
+        state = {}
+
+        for start in sorted(edges.keys()):
+            if start in state:
+                continue
+
+            # (chain, index of the next jump to follow)
+            stack = [ (start, 0) ]
+            path = [start]
+            state[start] = WALKING
+
+            while len(stack) > 0:
+                (chainName, position) = stack[-1]
+                children = edges[chainName]
+
+                if position == len(children):
+                    stack.pop()
+                    path.pop()
+                    state[chainName] = DONE
+                    continue
+
+                stack[-1] = (chainName, position + 1)
+                (child, index) = children[position]
+
+                if state.get(child) == WALKING:
+                    loop = path[path.index(child):] + [child]
+                    if not selected.isdisjoint(loop):
+                        self.add(CRITICAL, tableName, chainName, index, "chains jump to each other in a loop: %s" % " -> ".join(loop))
+                elif child not in state:
+                    state[child] = WALKING
+                    stack.append( (child, 0) )
+                    path.append(child)
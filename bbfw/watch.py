@@ -0,0 +1,396 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import os, time, select, struct, ctypes, ctypes.util
+from elements import TABLES, TABLE_CHAINS, ChainDelta, Table
+from parsers import ConfigParser
+from util import getCurrentRuleset, applyChainDelta
+from logger import log
+
+# inotify events we're interested in
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class WatcherException(Exception):
+    pass
+
+
+class InotifyWatcher:
+    """Report changed files in a config folder and its table folders, using inotify"""
+
+    def __init__(self, rootDir):
+        self.rootDir = rootDir
+        self.watches = {}
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+
+        self.addWatch(rootDir)
+        for item in os.listdir(rootDir):
+            path = os.path.join(rootDir, item)
+            if os.path.isdir(path):
+                self.addWatch(path)
+
+    def addWatch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, path, INOTIFY_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "Can't watch %s" % path)
+
+        self.watches[wd] = path
+
+    def waitForChanges(self, timeout=None):
+        """Return the paths changed within timeout seconds (forever if None)"""
+
+        result = set()
+        (ready, w, x) = select.select([self.fd], [], [], timeout)
+        if len(ready) > 0:
+            data = os.read(self.fd, 65536)
+            offset = 0
+            while offset < len(data):
+                (wd, mask, cookie, length) = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip("\0")
+                offset += length
+
+                if wd not in self.watches:
+                    continue
+
+                path = os.path.join(self.watches[wd], name)
+                if mask & IN_ISDIR:
+                    # a new table folder: watch it, and report the files already in it
+                    if mask & (IN_CREATE | IN_MOVED_TO) and self.watches[wd] == self.rootDir:
+                        self.addWatch(path)
+                        for item in os.listdir(path):
+                            result.add(os.path.join(path, item))
+                else:
+                    result.add(path)
+
+        return result
+
+class PollingWatcher:
+    """Report changed files in a config folder and its table folders, comparing mtimes"""
+
+    def __init__(self, rootDir, interval=1.0):
+        self.rootDir = rootDir
+        self.interval = interval
+        self.state = self.scan()
+
+    def scan(self):
+        result = {}
+        for item in os.listdir(self.rootDir):
+            path = os.path.join(self.rootDir, item)
+            if os.path.isdir(path):
+                for f in os.listdir(path):
+                    self.addFile(result, os.path.join(path, f))
+            else:
+                self.addFile(result, path)
+
+        return result
+
+    def addFile(self, state, path):
+        try:
+            info = os.stat(path)
+            state[path] = (info.st_mtime, info.st_size)
+        except OSError:
+            pass
+
+    def getChanges(self):
+        """Return the paths changed since the last call"""
+
+        result = set()
+        state = self.scan()
+        for path in set(state.keys()) | set(self.state.keys()):
+            if state.get(path) != self.state.get(path):
+                result.add(path)
+
+        self.state = state
+
+        return result
+
+    def waitForChanges(self, timeout=None):
+        result = set()
+        start = time.time()
+
+        while len(result) == 0:
+            if timeout is not None and time.time() - start >= timeout:
+                break
+
+            delay = self.interval
+            if timeout is not None:
+                delay = min(delay, timeout)
+            time.sleep(delay)
+
+            result = self.getChanges()
+
+        return result
+
+def createWatcher(rootDir, polling=False, interval=1.0):
+    result = None
+    if not polling:
+        try:
+            result = InotifyWatcher(rootDir)
+        except (OSError, AttributeError), e:
+            log(40, "inotify not available (%s), polling %s for changes" % (e, rootDir))
+
+    if result is None:
+        result = PollingWatcher(rootDir, interval)
+
+    return result
+
+def waitForChanges(watcher, debounce):
+    """Wait for changes, then keep collecting them until nothing changes for debounce seconds"""
+
+    result = watcher.waitForChanges(None)
+    more = result
+    while len(more) > 0:
+        more = watcher.waitForChanges(debounce)
+        result = result | more
+
+    return result
+
+
+class ConfigWatcher:
+    """
+    Keep netfilter in sync with a config folder. The config and the live
+    ruleset are parsed once; then only the chain files that changed are parsed
+    again, and only the chains that differ from the live ones are applied.
+    """
+
+    def __init__(self, rootDir, watcher, debounce=0.5, quiet=False, live=None):
+        self.rootDir = os.path.normpath(rootDir)
+        self.watcher = watcher
+        self.debounce = debounce
+        self.quiet = quiet
+        self.parser = ConfigParser(self.rootDir)
+        self.config = self.parser.parse()
+        self.live = live
+        if self.live is None:
+            self.live = getCurrentRuleset()
+
+    def run(self):
+        self.report(self.syncAll())
+
+        while True:
+            paths = waitForChanges(self.watcher, self.debounce)
+            touched = self.getTouchedChains(paths)
+            if len(touched) > 0:
+                self.report(self.sync(touched))
+
+    def report(self, description):
+        if description is not None and not self.quiet:
+            print description
+
+    def syncAll(self):
+        """Apply every config chain that differs from the live one"""
+
+        return self.sync(self.getAllChains())
+
+    def getAllChains(self):
+        """All the config chains, as {table name: [chain names]}"""
+
+        result = {}
+        for name, table in self.config.getTables().items():
+            result[name] = [c.getName() for c in table.chains()]
+
+        return result
+
+    def refreshConfig(self):
+        """Parse again the config files changed since the last call, without applying them"""
+
+        touched = self.getTouchedChains(self.watcher.getChanges())
+        for tableName, chainNames in touched.items():
+            self.updateConfig(tableName, chainNames)
+
+    def getTouchedChains(self, paths):
+        """
+        Map changed paths to {table name: [chain names]}. A chain list of None
+        means the table props changed, and all its chains must be checked
+        """
+
+        result = {}
+        for path in paths:
+            relative = os.path.relpath(path, self.rootDir)
+            parts = relative.split(os.sep)
+
+            if len(parts) == 1 and parts[0].endswith(self.parser.tablePropsFileExt):
+                tableName = parts[0][0:-len(self.parser.tablePropsFileExt)]
+                if tableName in TABLES:
+                    result[tableName] = None
+
+            elif len(parts) == 2 and parts[1].endswith(self.parser.chainFileExt) and parts[0] in TABLES:
+                chainName = parts[1][0:-len(self.parser.chainFileExt)]
+                if parts[0] not in result:
+                    result[parts[0]] = []
+
+                if result[parts[0]] is not None:
+                    result[parts[0]].append(chainName)
+
+            else:
+                log(71, "Ignoring change to %s" % path)
+
+        return result
+
+    def updateConfig(self, tableName, chainNames):
+        """Parse again the chains of a table, return the names of the chains to check"""
+
+        tableRoot = os.path.join(self.rootDir, tableName)
+        if not os.path.isdir(tableRoot):
+            log(20, "Table folder %s has been removed, ignored" % tableRoot)
+            return []
+
+        table = self.config.getTable(tableName)
+        if table is None:
+            table = self.parser.parseTable(tableName, self.config)
+
+        if chainNames is None:
+            self.parser.parseChains(table)
+            chainNames = [c.getName() for c in table.chains()]
+        else:
+            present = []
+            for chainName in chainNames:
+                if os.path.isfile(os.path.join(tableRoot, chainName + self.parser.chainFileExt)):
+                    present.append(chainName)
+                else:
+                    chain = table.getChain(chainName)
+                    if chain is not None:
+                        table.removeChain(chain)
+
+            self.parser.parseChains(table, present)
+
+        return chainNames
+
+    def getDelta(self, tableName, chainNames):
+        delta = ChainDelta()
+        configTable = self.config.getTable(tableName)
+        liveTable = self.live.getTable(tableName)
+
+        replaced = {}
+        for chainName in chainNames:
+            chain = configTable.getChain(chainName)
+            liveChain = None
+            if liveTable is not None:
+                liveChain = liveTable.getChain(chainName)
+
+            if chain is not None:
+                if liveChain is None or not (chain.equals(liveChain) and liveChain.equals(chain)):
+                    delta.replace(tableName, chain)
+                    replaced[chainName] = chain
+
+            elif liveChain is not None:
+                if chainName in TABLE_CHAINS[tableName]:
+                    log(20, "Chain %s/%s is builtin, it can't be deleted" % (tableName, chainName))
+                else:
+                    referers = self.getLiveReferers(liveTable, chainName, replaced)
+                    if len(referers) > 0:
+                        log(20, "Chain %s/%s is still used in %s, not deleted" % (tableName, chainName, ",".join(referers)))
+                    else:
+                        delta.delete(tableName, chainName)
+
+        return delta
+
+    def getLiveReferers(self, liveTable, chainName, replaced):
+        """Chains that will still jump to chainName once the replaced chains are applied"""
+
+        result = []
+        for chain in liveTable.chains():
+            if chain.getName() in replaced:
+                chain = replaced[chain.getName()]
+
+            for rule in chain.getRules():
+                if rule.getTarget() == chainName:
+                    result.append(chain.getName())
+                    break
+
+        return result
+
+    def sync(self, touched):
+        """Apply the touched chains that differ from the live ones, return a description of the changes"""
+
+        return self.apply(self.getSyncDelta(touched))
+
+    def getSyncDelta(self, touched):
+        """Parse again the touched chains, return the ChainDelta that brings the live rules in line with them"""
+
+        result = ChainDelta()
+        for tableName, chainNames in touched.items():
+            chainNames = self.updateConfig(tableName, chainNames)
+            tableDelta = self.getDelta(tableName, chainNames)
+            for chain in tableDelta.getReplaced(tableName):
+                result.replace(tableName, chain)
+            for chainName in tableDelta.getDeleted(tableName):
+                result.delete(tableName, chainName)
+
+        return result
+
+    def apply(self, delta):
+        """Apply a delta from getSyncDelta, return a description of the changes"""
+
+        result = None
+        if delta.isEmpty():
+            log(40, "Config and current rules are identical, nothing to do")
+        elif applyChainDelta(delta, self.quiet):
+            self.updateLive(delta)
+            result = self.describe(delta)
+        else:
+            raise WatcherException("Could not load the changes in %s" % self.rootDir)
+
+        return result
+
+    def updateLive(self, delta):
+        for tableName in delta.getTableNames():
+            table = self.live.getTable(tableName)
+            if table is None:
+                table = Table(tableName)
+                self.live.add(table)
+
+            for chain in delta.getReplaced(tableName):
+                current = table.getChain(chain.getName())
+                if current is not None:
+                    table.removeChain(current)
+                table.appendChain(chain)
+
+            for chainName in delta.getDeleted(tableName):
+                current = table.getChain(chainName)
+                if current is not None:
+                    table.removeChain(current)
+
+    def describe(self, delta):
+        changes = []
+        for tableName in delta.getTableNames():
+            for chain in delta.getReplaced(tableName):
+                changes.append("%s/%s loaded" % (tableName, chain.getName()))
+            for chainName in delta.getDeleted(tableName):
+                changes.append("%s/%s deleted" % (tableName, chainName))
+
+        return "%s: %s" % (time.strftime("%Y-%m-%d %H:%M:%S"), ", ".join(changes))
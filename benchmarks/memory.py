@@ -0,0 +1,116 @@
+#!/usr/bin/python
+
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+import argparse, os, sys, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bbfw import elements, matchers
+from bbfw.parsers import IPTSaveFileParser
+
+# Target bytes per rule for the synthetic ruleset below
+TARGETS = { 'default': 1000, 'compact': 300 }
+
+def generateDump(rules, chains):
+    lines = ["*filter", ":INPUT DROP [0:0]", ":FORWARD ACCEPT [0:0]", ":OUTPUT ACCEPT [0:0]"]
+    for c in range(0, chains):
+        lines.append(":USER%s - [0:0]" % c)
+
+    for c in range(0, chains):
+        lines.append("-A INPUT -s 10.%s.0.0/16 -j USER%s" % (c % 256, c))
+
+    rnd = random.Random(rules)
+    for i in range(0, rules):
+        chain = "USER%s" % (i % chains)
+        lines.append("-A %s -s 10.%s.%s.%s/32 -p tcp -m tcp --dport %s -m comment --comment \"rule %s\" -j ACCEPT" %
+                     (chain, rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(1, 65535), i))
+
+    lines.append("COMMIT")
+
+    return lines
+
+def deepSize(obj, seen):
+    """Size of obj and everything it references, each object counted once"""
+
+    size = 0
+    pending = [obj]
+    while len(pending) > 0:
+        o = pending.pop()
+        if id(o) in seen or isinstance(o, type):
+            continue
+
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+
+        if isinstance(o, dict):
+            pending.extend(o.keys())
+            pending.extend(o.values())
+        elif isinstance(o, (list, tuple, set)):
+            pending.extend(o)
+
+        if hasattr(o, "__dict__"):
+            pending.append(o.__dict__)
+
+        for klass in type(o).__mro__:
+            for slot in getattr(klass, "__slots__", []):
+                if hasattr(o, slot):
+                    pending.append(getattr(o, slot))
+
+    return size
+
+def measure(lines, compact):
+    elements.setCompactRules(compact)
+    ruleset = IPTSaveFileParser(lines).parse()
+
+    # Count the shared option name table once, together with the rules
+    return deepSize([ruleset, matchers.optionNames], set())
+
+def run():
+    parser = argparse.ArgumentParser(description="Measure the memory used by a parsed ruleset")
+    parser.add_argument("-n", "--rules", type=int, default=100000, help="Number of rules to generate")
+    parser.add_argument("-c", "--chains", type=int, default=100, help="Number of user chains to generate")
+    args = parser.parse_args()
+
+    lines = generateDump(args.rules, args.chains)
+    total = args.rules + args.chains
+    failed = False
+
+    for mode in ['default', 'compact']:
+        size = measure(lines, mode == 'compact')
+        perRule = size / total
+        status = "ok"
+        if perRule > TARGETS[mode]:
+            status = "ABOVE TARGET"
+            failed = True
+
+        print "%-8s %12s bytes  %6s bytes/rule (target %s) %s" % (mode, size, perRule, TARGETS[mode], status)
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run()
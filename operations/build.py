@@ -0,0 +1,47 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+from bbfw.packed import PackedWriter
+from operations import DEFAULT_CONF, DEFAULT_PACKED
+from operations.common import getRuleset
+
+
+def build(args):
+    """
+    Compile a configuration folder into a single packed file, that can be
+    used in place of the folder with -d.
+    Defaults to compiling the default folder ('%s') into '%s'
+    """ % (DEFAULT_CONF, DEFAULT_PACKED)
+
+    confName = args.directory
+    if confName is None:
+        confName = DEFAULT_CONF
+
+    outputName = args.output
+    if outputName is None:
+        outputName = DEFAULT_PACKED
+
+    ruleset = getRuleset(confName)
+    count = PackedWriter(ruleset).write(outputName)
+    print "Compiled %s rules from %s into %s" % (count, confName, outputName)
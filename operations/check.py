@@ -0,0 +1,91 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+
+
+from bbfw.util import testRuleset
+from bbfw.validator import CRITICAL, getFindingLines
+from operations import DEFAULT_CONF
+from operations.common import getRuleset
+
+
+def checkConfig(confName):
+    """
+    Parse a config folder or packed file, validate it and test it with
+    iptables-restore. Return (name, valid, findings, error)
+    """
+
+    findings = []
+    try:
+        ruleset = getRuleset(confName)
+        test = testRuleset(ruleset)
+        findings = getFindingLines(ruleset.validate())
+        (valid, error) = test.getResult()
+        if len([line for line in findings if line.startswith(CRITICAL)]) > 0:
+            valid = False
+    except Exception, e:
+        valid = False
+        error = "%s" % e
+
+    return (confName, valid, findings, error)
+
+def check(args):
+    """
+    Validate configuration folders or packed files, and test them with
+    'iptables-restore --test', without changing netfilter.
+    Defaults to the default folder ('%s' in the current directory).
+    Use -j to check several configurations in parallel.
+    """ % DEFAULT_CONF
+
+    confNames = args.directories
+    if len(confNames) == 0:
+        confNames = [DEFAULT_CONF]
+
+    if args.jobs > 1 and len(confNames) > 1:
+        from multiprocessing import Pool
+        pool = Pool(min(args.jobs, len(confNames)))
+        try:
+            results = pool.map(checkConfig, confNames, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [checkConfig(confName) for confName in confNames]
+
+    failed = 0
+    for confName, valid, findings, error in results:
+        if valid:
+            print "OK      %s" % confName
+        else:
+            failed += 1
+            print "FAILED  %s" % confName
+
+        if len(findings) > 0:
+            print "\n".join(findings)
+        if error is not None:
+            print "%s\n" % error
+
+    if failed > 0:
+        raise Exception("%s of %s configurations are not valid" % (failed, len(results)))
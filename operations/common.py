@@ -0,0 +1,86 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import sys
+from bbfw.parsers import ConfigParser, FileReader, IPTSaveFileParser, PackedParser
+from bbfw.packed import isPacked
+from bbfw.renderers import RulesetSummaryRenderer, FileRenderer
+from operations import DEFAULT_CONF
+
+# Helpers shared by the operations that work on rulesets
+
+
+def getFirstRuleset(conf, fileConf, ruleset=None):
+    configRuleset = None
+
+    if conf is not None:
+        configRuleset = getRuleset(conf, ruleset)
+    elif fileConf is not None:
+        configRuleset = getFileRuleset(fileConf, ruleset)
+    else:
+        configRuleset = getRuleset(DEFAULT_CONF, ruleset)
+
+    return configRuleset
+
+def getRuleset(confFolder, ruleset=None, table=None, chain=None):
+    if isPacked(confFolder):
+        parser = PackedParser(confFolder, ruleset)
+        parser.setFilter(table, chain)
+        config = parser.parse()
+        config.name = "Ruleset loaded from packed file %s" % confFolder
+    else:
+        parser = ConfigParser(confFolder, ruleset)
+        parser.setFilter(table, chain)
+        config = parser.parse()
+        config.name = "Ruleset loaded from directory %s" % confFolder
+
+    return config
+
+def getFileRuleset(fileName, ruleset=None, table=None, chain=None):
+    fileReader = FileReader(fileName)
+    fileConfigParser = IPTSaveFileParser(fileReader.getLines(noComments=True), ruleset)
+    fileConfigParser.setFilter(table, chain)
+    config = fileConfigParser.parse()
+    config.name = "Ruleset loaded from file %s" % fileName
+
+    return config
+
+def printRuleset(ruleset, detailed, table=None, chain=None, annotations=None):
+    renderer = None
+    if not detailed:
+        renderer = RulesetSummaryRenderer(ruleset, annotations)
+    else:
+        renderer = FileRenderer(ruleset)
+
+    renderer.renderTo(sys.stdout, table, chain)
+    print
+
+def prettyPrintChains(tables):
+    text = ""
+    for name, t in tables.items():
+        text = text + "\n * %s table:" % name
+        for c in t.chains():
+            text = text + "\n     - %s" % c.getName()
+
+    return text
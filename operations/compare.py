@@ -0,0 +1,77 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import time
+from bbfw.compare import RulesetComparator
+from bbfw.metrics import writeMetrics, getDriftedChains
+from bbfw.renderers import RulesetDiffRenderer
+from bbfw.util import getCurrentRuleset
+from operations import DEFAULT_FILE
+from operations.common import getRuleset, getFileRuleset
+
+
+def compare(args):
+    """
+    Compare two netfilter configurations.
+    Defaults to comparing the current netfilter configuration with the
+    folder configuration found in the default folder '%s'.
+    Use -c or -o to compare with a different configuration folder or file.
+    Use -j to compare the chains in parallel.
+    Use -u to ignore the order of the rules in every chain.
+    Use -v for a detailed print.
+    Use --metrics to write the current rules, the duration of the compare
+    and the drift to a Prometheus textfile.
+    """ % DEFAULT_FILE    
+
+    start = time.time()
+
+    rightRuleset = None
+    leftRulesset = None
+
+    if args.file is None and args.directory is None:
+        print "Please specify either a config file or a config directory (or both)\n"
+    elif args.metrics is not None and args.file is not None and args.directory is not None:
+        print "--metrics needs the current rules on one side, please specify either a config file or a config directory\n"
+    else:
+        # only read the selected table and chain on both sides
+        if args.directory is None or args.file is None:
+            leftRuleset = getCurrentRuleset(args.table, args.chain, args.metrics is not None)
+            if args.directory is None:
+                rightRuleset = getFileRuleset(args.file, None, args.table, args.chain)
+            else:
+                rightRuleset = getRuleset(args.directory, None, args.table, args.chain)
+
+        else:
+            rightRuleset = getFileRuleset(args.file, None, args.table, args.chain)
+            leftRuleset = getRuleset(args.directory, None, args.table, args.chain)
+
+        comparator = RulesetComparator(leftRuleset, rightRuleset, args.jobs, args.unordered)
+        if comparator.equals():
+            print "No difference.\n"
+        else:
+            renderer = RulesetDiffRenderer(leftRuleset, rightRuleset, args.table, args.chain, comparator, args.unordered)
+            print renderer.render()
+
+        if args.metrics is not None:
+            writeMetrics(args.metrics, leftRuleset, "compare", time.time() - start, args.directory or args.file, getDriftedChains(comparator))
@@ -0,0 +1,43 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+from bbfw.renderers import RulesetSaver
+from bbfw.util import getCurrentRuleset
+from operations import DEFAULT_CONF
+
+
+def export(args):
+    """
+    Export the current netfilter configuration into a configuration folder.
+    Use this to create your first configuration form a running iptables set.
+    Defaults to exporting into the default folder ('%s' in the current directory)
+    """ % DEFAULT_CONF
+
+    confName = args.directory
+    if confName is None:
+        confName = DEFAULT_CONF
+
+    currentRuleset = getCurrentRuleset()
+    renderer = RulesetSaver(currentRuleset, confName, args.update, args.jobs)
+    print renderer.render()
@@ -0,0 +1,79 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+
+
+import os
+from bbfw.fleet import FleetComparator
+from bbfw.renderers import FleetRenderer
+from operations import DEFAULT_CONF, DEFAULT_DRIFT
+from operations.common import getRuleset
+
+
+def fleetcompare(args):
+    """
+    Compare the iptables-save dumps found in a directory, one per host,
+    with a configuration folder or packed file (defaults to '%s').
+    The drift of every host is written to HOST.drift in the output folder
+    (defaults to '%s'), and a report aggregated over all the hosts is
+    written to report.txt and printed.
+    """ % (DEFAULT_CONF, DEFAULT_DRIFT)
+
+    confName = args.directory
+    if confName is None:
+        confName = DEFAULT_CONF
+
+    outputDir = args.output
+    if outputDir is None:
+        outputDir = DEFAULT_DRIFT
+
+    fileNames = []
+    for name in sorted(os.listdir(args.dumps)):
+        path = os.path.join(args.dumps, name)
+        if os.path.isfile(path) and not name.startswith("."):
+            fileNames.append(path)
+
+    if len(fileNames) == 0:
+        print "No dump found in %s\n" % args.dumps
+    else:
+        config = getRuleset(confName)
+        fleet = FleetComparator(config, args.jobs)
+        fleet.compare(fileNames)
+
+        if not os.path.isdir(outputDir):
+            os.makedirs(outputDir)
+
+        renderer = FleetRenderer(fleet)
+        for host in fleet.getHostNames():
+            f = open(os.path.join(outputDir, "%s.drift" % host), 'w')
+            f.write("\n".join(renderer.renderHost(host)) + "\n")
+            f.close()
+
+        report = renderer.render()
+        f = open(os.path.join(outputDir, "report.txt"), 'w')
+        f.write(report + "\n")
+        f.close()
+
+        print report
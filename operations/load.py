@@ -0,0 +1,133 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import time
+from bbfw.compare import RulesetComparator
+from bbfw.metrics import writeMetrics, getDriftedChains
+from bbfw.renderers import RulesetDiffRenderer
+from bbfw.snapshots import takeSnapshot
+from bbfw.validator import printFindings
+from bbfw.util import getCurrentRuleset, loadRuleset, testRuleset
+from operations import DEFAULT_CONF
+from operations.common import getFirstRuleset
+from operations.remote import confirm
+
+
+def load(args):
+    """
+    Load a configuration from disk into netfilter, enabling it.
+    Defaults to using the configuration found in the default folder 
+    ('%s' in the current directory)
+    The config is validated first: critical problems, like jumps to missing
+    chains or loops, stop the load unless --no-validate is used. Only the
+    config chains are validated, their jumps are resolved against the
+    current chains too.
+    It is then checked with 'iptables-restore --test' while the
+    differences are computed, and the current rules are saved as a snapshot
+    before loading, see rollback.
+    With --metrics, the rules, the duration of the load and the drift are
+    written to a Prometheus textfile.
+    """  % DEFAULT_CONF
+
+    start = time.time()
+    waited = 0
+    wipeExisting = args.wipe
+    currentRuleset = getCurrentRuleset()
+    requestedRuleset = getFirstRuleset(args.directory, args.file, currentRuleset)
+
+    valid = True
+    if not args.no_validate:
+        # the current chains the config doesn't manage are not its problems
+        configRuleset = getFirstRuleset(args.directory, args.file)
+        valid = printFindings(configRuleset.validate(requestedRuleset), args.verbose)
+
+    # validate in the background while the differences are computed
+    test = None
+    if valid and not args.no_test:
+        test = testRuleset(requestedRuleset)
+
+    currentRuleset = getCurrentRuleset(counters=args.metrics is not None)
+
+#    leftTables = currentRuleset.getTables()
+#    rightTables = requestedRuleset.getTables()
+#    for n, t in rightTables.items():
+#        print "config table %s has %s chains" % (n, len(t.getChains()))
+#
+#    for n, t in leftTables.items():
+#        print "current table %s has %s chains" % (n, len(t.getChains()))
+
+    comparator = RulesetComparator(requestedRuleset, currentRuleset, args.jobs, args.unordered)
+    loaded = False
+    if not valid:
+        # the metrics below still report the drift
+        print "\nThe config has critical problems, no change applied. Use --no-validate to load it anyway.\n"
+    elif comparator.equals():
+        print "\nConfiguration and current rules are identical, nothing to do.\n"
+    else:
+        renderer = RulesetDiffRenderer(requestedRuleset, currentRuleset, comparator=comparator, unordered=args.unordered)
+
+        if args.verbose:
+            print renderer.render()
+
+        proceed = True
+        if test is not None:
+            (proceed, error) = test.getResult()
+            if proceed:
+                print "\nThe config passed 'iptables-restore --test'."
+            else:
+                print "\nThe config was rejected by 'iptables-restore --test':\n%s" % error
+
+        if proceed:
+            if not wipeExisting:
+                print "\n\nThe chains contained in the selected config will be loaded. If a chain with the same name already exists in the current config, it will be flushed and its contents replaced with the ones from the config."
+            else:
+                print "\n\nAll user chains will be flushed and deleted and all system chains will be flushed before loading the selected config."
+
+        if proceed and not args.force:
+            #print "The following tables will be loaded:\n %s \n" % prettyPrintChains(configRuleset.getTables())
+            asked = time.time()
+            proceed = confirm( "Are you sure you want to continue? (Y/n)" )
+            waited = time.time() - asked
+
+        if proceed:
+            if not args.no_snapshot:
+                snapshotId = takeSnapshot(currentRuleset, args.snapshots, args.keep, "before load of %s" % requestedRuleset.getName())
+                print "Current rules saved as snapshot %s, use 'rollback' to restore them" % snapshotId
+
+            if loadRuleset(requestedRuleset, not args.verbose, wipeExisting):
+                loaded = True
+                print "Config rules loaded succesfully\n"
+            else:
+                print "Config rules were not loaded, netfilter configuration unchanged. Use -v for more details\n"
+        else:
+            print "No change applied.\n"
+
+    if args.metrics is not None:
+        # the rules in netfilter are now the requested ones, whose counters are unknown
+        configName = args.directory or args.file or DEFAULT_CONF
+        duration = time.time() - start - waited
+        if loaded:
+            writeMetrics(args.metrics, requestedRuleset, "load", duration, configName, 0)
+        else:
+            writeMetrics(args.metrics, currentRuleset, "load", duration, configName, getDriftedChains(comparator))
@@ -0,0 +1,58 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import time
+from bbfw.metrics import Metrics, getDriftedChains
+from bbfw.util import getCurrentRuleset
+from operations.common import getRuleset, getFileRuleset
+
+
+def metrics(args):
+    """
+    Write the metrics of the current netfilter configuration as a
+    node_exporter textfile: rule counts, jump depths and the packet and
+    byte counters of every chain, all read with a single 'iptables-save -c'.
+    With -d or -f, the drift from that configuration is written too.
+    The durations of the last load and compare run with --metrics are kept.
+    """
+
+    start = time.time()
+    currentRuleset = getCurrentRuleset(counters=True)
+    duration = time.time() - start
+
+    metrics = Metrics()
+    metrics.addRuleset(currentRuleset)
+    metrics.addOperation("dump", duration)
+
+    configName = args.directory or args.file
+    if configName is not None:
+        from bbfw.compare import RulesetComparator
+        if args.directory is not None:
+            configRuleset = getRuleset(args.directory)
+        else:
+            configRuleset = getFileRuleset(args.file)
+
+        metrics.addDrift(configName, getDriftedChains(RulesetComparator(configRuleset, currentRuleset)))
+
+    metrics.write(args.output)
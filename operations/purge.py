@@ -0,0 +1,48 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+from bbfw.util import getPurgeDelta, applyPurgeDelta, describeChainDelta, getCurrentRuleset
+from operations.remote import confirm
+
+
+def purge(args):
+    """
+    Purge a chain, or all the chains of a table or of all the tables.
+    With -r, the user chains only reachable from the purged ones are purged
+    too. All the changes are listed before asking for confirmation.
+    Use -n to only list them.
+    """
+
+    currentRuleset = getCurrentRuleset()
+    delta = getPurgeDelta(currentRuleset, args.table, args.chain, args.recursive)
+
+    proceed = True
+    if not args.force and not args.dry_run and not delta.isEmpty():
+        msg = "\n\nThe following changes will be applied:\n%s\n\nYou cannot undo this operation. Do you want to continue (Y/n)?" % describeChainDelta(delta)
+        proceed = confirm( msg )
+
+    if proceed:
+        applyPurgeDelta(delta, args.dry_run)
+    else:
+        print "No change applied.\n"
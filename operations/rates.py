@@ -0,0 +1,69 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+from bbfw.sampling import CounterRing, RuleScanner
+from bbfw.util import getCurrentLines
+
+
+def rates(args):
+    """
+    Rank the rules by the packets per second they matched over the last
+    --window seconds, from the samples written by 'sample'. Several
+    comma separated windows can be given, the rules are ranked by the first.
+    Samples are keyed by rule signature, so rules moved within their chain
+    keep their history.
+    """
+
+    windows = [float(window) for window in args.window.split(",")]
+
+    ring = CounterRing(args.ring, create=False)
+    try:
+        ruleRates = ring.getRates(windows)
+    finally:
+        ring.close()
+
+    # where the sampled rules are now
+    rules = {}
+    for signature, tableName, chainName, position, text, packets, byteCount in RuleScanner().scan(getCurrentLines()):
+        rules[signature] = "%s/%s #%s: %s" % (tableName, chainName, position + 1, text)
+
+    ranked = [(rates[0][0], signature) for signature, rates in ruleRates.items() if rates[0] is not None]
+    ranked.sort(reverse=True)
+    if args.top > 0:
+        ranked = ranked[0:args.top]
+
+    if len(ranked) == 0:
+        print "Not enough samples in %s for the last %ss, run 'sample' for longer" % (args.ring, args.window.split(",")[0])
+    else:
+        print "  ".join(["%21s" % ("last %ss pkt/s byte/s" % window) for window in args.window.split(",")]) + "  rule"
+        for rate, signature in ranked:
+            columns = []
+            for windowRate in ruleRates[signature]:
+                if windowRate is None:
+                    columns.append("%21s" % "-")
+                else:
+                    columns.append("%10.2f %10.0f" % windowRate)
+
+            rule = rules.get(signature, "(%016x, no longer loaded)" % signature)
+            print "  ".join(columns) + "  " + rule
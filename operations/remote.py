@@ -0,0 +1,111 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import os, socket
+from bbfw.client import DaemonClient, DaemonException, isDaemonRunning
+from bbfw.logger import log
+from operations import DEFAULT_CONF
+
+# Helpers to run operations on the bbfw daemon; they must stay cheap to import
+
+
+def forwardToDaemon(args):
+    """
+    Run the operation on the daemon, if one is running. Return False if the
+    operation has to be run locally.
+    """
+
+    result = False
+
+    # metrics and costs need the counters, read by this process
+    if getattr(args, 'metrics', None) is not None or getattr(args, 'cost', False):
+        return False
+
+    # the daemon watches config folders, packed files from 'build' are read here
+    directory = getattr(args, 'directory', None)
+    if directory is not None and os.path.isfile(directory):
+        return False
+
+    if not args.no_daemon and isDaemonRunning(args.socket):
+        client = DaemonClient(args.socket)
+        request = dict(vars(args))
+        for name in ['directory', 'file']:
+            if request.get(name) is not None:
+                request[name] = os.path.abspath(request[name])
+
+        if args.operation == 'load':
+            # the daemon only syncs the config chains, in order
+            if request['file'] is not None or args.wipe or args.unordered:
+                return False
+
+            if request['directory'] is None:
+                request['directory'] = os.path.abspath(DEFAULT_CONF)
+
+        try:
+            proceed = True
+            if args.operation in ['load', 'purge'] and not args.force and not getattr(args, 'dry_run', False):
+                if args.operation == 'load':
+                    print client.call('compare', request)
+                    try:
+                        # validate and test before asking, as a local load does
+                        print client.call('preload', request)
+                        request['no_validate'] = True
+                        request['no_test'] = True
+                    except DaemonException, e:
+                        print "%s" % e
+                        return True
+                else:
+                    # list every chain the purge removes before asking
+                    listing = dict(request)
+                    listing['dry_run'] = True
+                    print client.call('purge', listing)
+                proceed = confirm("Are you sure you want to continue? (Y/n)")
+
+            if proceed:
+                print client.call(args.operation, request)
+            else:
+                print "No change applied.\n"
+
+            result = True
+        except socket.error, e:
+            log(20, "Can't reach the bbfw daemon on %s (%s), running locally" % (args.socket, e))
+
+    return result
+
+def confirm(msg):
+    result = False
+
+    done = False
+    answer = "n"
+    while not done:
+        answer = raw_input(msg)
+        if not (answer.find("Y") == 0 or answer.find("n") == 0):
+            print "\nPlease answer 'Y' or 'n'"
+        else:
+            done = True
+                
+    if answer.find("Y") == 0:
+        result = True
+
+    return result
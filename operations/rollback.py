@@ -0,0 +1,72 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+
+
+from bbfw.snapshots import SnapshotStore, takeSnapshot
+from bbfw.util import getCurrentRuleset, getRulesetDelta, describeChainDelta, applyChainDelta
+from operations.remote import confirm
+
+
+def rollback(args):
+    """
+    Restore the ruleset saved in a snapshot, by default the most recent one.
+    Only the chains that differ from the snapshot are changed. Unless
+    --no-snapshot is used, the current ruleset is saved as a new snapshot
+    first, so that the rollback can be undone too.
+    """
+
+    store = SnapshotStore(args.snapshots)
+    snapshotId = args.id
+    if snapshotId is None:
+        snapshotId = store.getLatestId()
+
+    targetRuleset = store.load(snapshotId)
+    currentRuleset = getCurrentRuleset()
+    delta = getRulesetDelta(currentRuleset, targetRuleset)
+
+    if delta.isEmpty():
+        print "\nCurrent rules and %s are identical, nothing to do.\n" % targetRuleset.getName()
+    elif args.dry_run:
+        print "The following changes would be applied:\n%s" % describeChainDelta(delta)
+    else:
+        if args.verbose:
+            print "The following changes will be applied:\n%s" % describeChainDelta(delta)
+
+        proceed = True
+        if not args.force:
+            proceed = confirm("Roll back to %s? (Y/n)" % targetRuleset.getName())
+
+        if proceed:
+            if not args.no_snapshot:
+                savedId = takeSnapshot(currentRuleset, args.snapshots, args.keep, "before rollback to snapshot %s" % snapshotId)
+                print "Current rules saved as snapshot %s" % savedId
+
+            if applyChainDelta(delta, not args.verbose):
+                print "Rolled back to %s\n" % targetRuleset.getName()
+            else:
+                print "Could not roll back, netfilter configuration unchanged. Use -v for more details\n"
+        else:
+            print "No change applied.\n"
@@ -0,0 +1,64 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import time
+from bbfw.sampling import CounterRing, RuleScanner
+from bbfw.util import getCurrentLines
+from bbfw.logger import log
+
+
+def sample(args):
+    """
+    Read the counters of every rule each --interval seconds and append them
+    to a fixed size ring file, keyed by rule signature. Only the lines of
+    'iptables-save -c' are scanned, the rules are not parsed.
+    Runs until interrupted, or for --count samples. Use 'rates' to read
+    the hit rates of the rules.
+    """
+
+    ring = CounterRing(args.ring, args.records)
+    scanner = RuleScanner()
+    taken = 0
+
+    try:
+        start = time.time()
+        while args.count is None or taken < args.count:
+            timestamp = time.time()
+            rules = scanner.scan(getCurrentLines(counters=True))
+            samples = [(signature, packets, byteCount) for signature, tableName, chainName, position, text, packets, byteCount in rules if packets is not None]
+            ring.append(samples, timestamp)
+            taken += 1
+            log(50, "Sampled the counters of %s rules in %.3fs" % (len(samples), time.time() - timestamp))
+
+            if args.count is None or taken < args.count:
+                # keep to the schedule, however long a sample took
+                delay = start + taken * args.interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+    print "%s samples written to %s" % (taken, args.ring)
@@ -0,0 +1,52 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+from bbfw.util import getCurrentRuleset
+from operations.common import getRuleset, getFileRuleset, printRuleset
+
+
+def show(args):
+    """
+    Prints out the current netfilter configuration.
+    Use -v for a detailed print.
+    Use --cost to annotate the chains with the rules a packet is matched
+    against and the kernel memory they take; the averages use the hit
+    counters of the current rules.
+    """
+
+    ruleset = None
+    if args.directory is None and args.file is None:
+        ruleset = getCurrentRuleset(args.table, args.chain, args.cost)
+    else:
+        if args.directory is not None:
+            ruleset = getRuleset(args.directory, None, args.table, args.chain)
+        else:
+            ruleset = getFileRuleset(args.file, None, args.table, args.chain)
+
+    annotations = None
+    if args.cost:
+        from bbfw.cost import CostModel
+        annotations = CostModel(ruleset).getAnnotations()
+
+    printRuleset(ruleset, args.verbose, args.table, args.chain, annotations)
@@ -0,0 +1,68 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+from bbfw.parsers import FileReader
+from bbfw.renderers import SimulationRenderer
+from bbfw.simulator import Simulator, readPackets
+from bbfw.util import getCurrentRuleset
+from operations.common import getRuleset, getFileRuleset
+
+
+def simulate(args):
+    """
+    Replay the flows found in the specified file against a ruleset and print
+    which rules they hit and their final verdict.
+    When a config folder or file is specified, the flows are also replayed
+    against the current netfilter configuration and the verdict differences
+    are printed. If both are specified, the folder is compared with the file.
+    """
+
+    baseRuleset = None
+    ruleset = None
+
+    if args.directory is None and args.file is None:
+        ruleset = getCurrentRuleset(args.table)
+    elif args.directory is not None and args.file is not None:
+        baseRuleset = getRuleset(args.directory, None, args.table)
+        ruleset = getFileRuleset(args.file, None, args.table)
+    else:
+        baseRuleset = getCurrentRuleset(args.table)
+        if args.directory is not None:
+            ruleset = getRuleset(args.directory, None, args.table)
+        else:
+            ruleset = getFileRuleset(args.file, None, args.table)
+
+    fileReader = FileReader(args.flows)
+    packets = readPackets(fileReader.getLines(noComments=True))
+
+    result = Simulator(ruleset, args.table).run(packets, args.chain)
+
+    baseResult = None
+    baseName = None
+    if baseRuleset is not None:
+        baseResult = Simulator(baseRuleset, args.table).run(packets, args.chain)
+        baseName = baseRuleset.getName()
+
+    renderer = SimulationRenderer(packets, result, ruleset.getName(), baseResult, baseName)
+    print renderer.render()
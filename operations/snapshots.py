@@ -0,0 +1,49 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+
+
+import time
+from bbfw.snapshots import SnapshotStore
+
+
+def snapshots(args):
+    """
+    List the snapshots saved before each load and rollback, oldest first.
+    With --keep, only the most recent snapshots are kept.
+    """
+
+    store = SnapshotStore(args.snapshots)
+
+    if args.keep is not None:
+        removed = store.evict(args.keep)
+        print "Removed %s snapshots" % removed
+
+    snapshotList = store.list()
+    if len(snapshotList) == 0:
+        print "There are no snapshots in %s" % args.snapshots
+    else:
+        for snapshotId, created, note, chains in snapshotList:
+            print "%6s  %s  %5s chains  %s" % (snapshotId, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created)), chains, note)
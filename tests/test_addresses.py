@@ -0,0 +1,81 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import unittest
+from bbfw.addresses import parseIP, parseNetwork, parseAddressRange, networkContains, AddressException, IPV4, IPV6
+
+
+class NetworkTest(unittest.TestCase):
+    def testPrefixAndMask(self):
+        self.assertEqual(parseNetwork("10.0.0.0/8"), parseNetwork("10.0.0.0/255.0.0.0"))
+        self.assertEqual(parseNetwork("10.0.0.1"), parseNetwork("10.0.0.1/32"))
+        self.assertEqual(parseNetwork("10.1.2.3/8"), parseNetwork("10.0.0.0/8"))
+        self.assertNotEqual(parseNetwork("10.0.0.0/8"), parseNetwork("10.0.0.0/16"))
+
+    def testIPv6(self):
+        self.assertEqual(parseNetwork("2001:db8::1"), parseNetwork("2001:0db8:0000::1/128"))
+        self.assertEqual(parseNetwork("2001:db8::/32")[0], IPV6)
+
+    def testInvalid(self):
+        for value in ["10.1", "10.0.0.0/33", "host.example.com", "10.0.0.0/ffff::", "2001:db8::/129"]:
+            self.assertRaises(AddressException, parseNetwork, value)
+
+    def testContains(self):
+        self.assertTrue(networkContains(parseNetwork("10.0.0.0/8"), parseNetwork("10.1.0.0/16")))
+        self.assertTrue(networkContains(parseNetwork("10.0.0.0/8"), parseNetwork("10.0.0.0/8")))
+        self.assertFalse(networkContains(parseNetwork("10.1.0.0/16"), parseNetwork("10.0.0.0/8")))
+        self.assertFalse(networkContains(parseNetwork("10.0.0.0/8"), parseNetwork("2001:db8::/32")))
+
+
+class AddressRangeTest(unittest.TestCase):
+    def testIPv4(self):
+        (first, last) = (parseIP("10.0.0.1")[1], parseIP("10.0.0.9")[1])
+        self.assertEqual(parseAddressRange("10.0.0.1"), ((IPV4, first, first), None))
+        self.assertEqual(parseAddressRange("10.0.0.1-10.0.0.9"), ((IPV4, first, last), None))
+        self.assertEqual(parseAddressRange("10.0.0.1:80"), ((IPV4, first, first), "80"))
+        self.assertEqual(parseAddressRange("10.0.0.1-10.0.0.9:80-90"), ((IPV4, first, last), "80-90"))
+
+    def testPortsOnly(self):
+        self.assertEqual(parseAddressRange(":8080"), (None, "8080"))
+
+    def testIPv6(self):
+        (first, last) = (parseIP("2001:db8::1")[1], parseIP("2001:db8::9")[1])
+        self.assertEqual(parseAddressRange("2001:db8::1"), ((IPV6, first, first), None))
+        self.assertEqual(parseAddressRange("[2001:db8::1]"), ((IPV6, first, first), None))
+        self.assertEqual(parseAddressRange("[2001:db8::1]:80"), ((IPV6, first, first), "80"))
+
+    def testIPv6Range(self):
+        (first, last) = (parseIP("2001:db8::1")[1], parseIP("2001:db8::9")[1])
+        self.assertEqual(parseAddressRange("2001:db8::1-2001:db8::9"), ((IPV6, first, last), None))
+        self.assertEqual(parseAddressRange("[2001:db8::1]-[2001:db8::9]"), ((IPV6, first, last), None))
+        self.assertEqual(parseAddressRange("[2001:db8::1]-[2001:db8::9]:80"), ((IPV6, first, last), "80"))
+        self.assertEqual(parseAddressRange("[2001:db8::1]-[2001:db8::9]:80-90"), ((IPV6, first, last), "80-90"))
+
+    def testInvalid(self):
+        self.assertRaises(AddressException, parseAddressRange, "[2001:db8::1")
+        self.assertRaises(AddressException, parseAddressRange, "[2001:db8::1]x")
+        self.assertRaises(AddressException, parseAddressRange, "10.0.0.1-2001:db8::1")
+
+if __name__ == '__main__':
+    unittest.main()
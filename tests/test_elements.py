@@ -0,0 +1,67 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import unittest
+from bbfw.elements import LazyRule
+
+
+class InterruptedRule(LazyRule):
+    """A LazyRule that records what another thread would read while it is being parsed"""
+
+    __slots__ = ('seen',)
+
+    def parseProperties(self, line):
+        self.seen = (self.toStr(), self.getTarget(), self.isGoto())
+        return LazyRule.parseProperties(self, line)
+
+
+class LazyRuleTest(unittest.TestCase):
+    LINE = "-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT"
+
+    def testParsedOnDemand(self):
+        rule = LazyRule(self.LINE)
+        self.assertFalse(rule.isParsed())
+        self.assertEqual(rule.getTarget(), "ACCEPT")
+        self.assertFalse(rule.isParsed())
+
+        self.assertEqual(rule.getProperty("--dport"), "22")
+        self.assertTrue(rule.isParsed())
+        self.assertEqual(rule.getText(), None)
+        self.assertEqual(rule.getTarget(), "ACCEPT")
+        self.assertEqual(rule.toStr(), self.LINE)
+
+    def testReadWhileParsing(self):
+        rule = InterruptedRule(self.LINE)
+        rule.getProperty("-p")
+        self.assertEqual(rule.seen, (self.LINE, "ACCEPT", False))
+        self.assertEqual(len(rule.properties), 5)
+
+    def testGoto(self):
+        rule = LazyRule("-A INPUT -g LOGDROP")
+        self.assertTrue(rule.isGoto())
+        rule.getProperty("-g")
+        self.assertTrue(rule.isGoto())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import unittest
+from bbfw.fleet import FleetComparator, FleetException, getHostName
+from bbfw.elements import Ruleset
+
+
+class HostNameTest(unittest.TestCase):
+    def testDumpSuffix(self):
+        self.assertEqual(getHostName("/var/dumps/web1.save"), "web1")
+        self.assertEqual(getHostName("/var/dumps/web1.rules"), "web1")
+
+    def testFullyQualifiedName(self):
+        self.assertEqual(getHostName("/var/dumps/web1.dc1.example.com"), "web1.dc1.example.com")
+        self.assertEqual(getHostName("web1.dc1.example.com.save"), "web1.dc1.example.com")
+
+    def testDuplicateHost(self):
+        fleet = FleetComparator(Ruleset("empty"))
+        self.assertRaises(FleetException, fleet.scan, ["/var/dumps/web1.save", "/var/dumps/web1.rules"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import sys, unittest, threading
+from bbfw.elements import Rule, Property
+from bbfw.matchers import getOptionId, getOptionName, canonicalLine, getMatcher
+
+
+class OptionAliasTest(unittest.TestCase):
+    def testAliasIds(self):
+        self.assertEqual(getOptionId("--source"), getOptionId("-s"))
+        self.assertEqual(getOptionId("--src"), getOptionId("-s"))
+        self.assertEqual(getOptionId("--destination-port"), getOptionId("--dport"))
+        self.assertNotEqual(getOptionId("--sport"), getOptionId("--dport"))
+
+    def testCanonicalLine(self):
+        self.assertEqual(canonicalLine("--append INPUT --protocol tcp --jump ACCEPT"), "-A INPUT -p tcp -j ACCEPT")
+        self.assertEqual(canonicalLine("-A INPUT -m comment --comment --source"), "-A INPUT -m comment --comment -s")
+
+    def testProperty(self):
+        prop = Property("--in-interface", "eth0")
+        self.assertEqual(prop.name, "-i")
+        self.assertEqual(prop.id, getOptionId("-i"))
+
+
+class PropertyMatcherTest(unittest.TestCase):
+    def matches(self, name, this, that):
+        thisProp = Property(name, this)
+        return getMatcher(thisProp)(thisProp, Property(name, that))
+
+    def testAddresses(self):
+        self.assertTrue(self.matches("-s", "10.0.0.1", "10.0.0.1/32"))
+        self.assertTrue(self.matches("-s", "10.0.0.1/32", "10.0.0.1/255.255.255.255"))
+        self.assertTrue(self.matches("-d", "10.1.2.3/8", "10.0.0.0/8"))
+        self.assertFalse(self.matches("-s", "10.0.0.0/8", "10.0.0.0/16"))
+        self.assertFalse(self.matches("-s", "10.0.0.1", "10.0.0.2"))
+
+    def testIPv6Addresses(self):
+        self.assertTrue(self.matches("-s", "2001:db8::1", "2001:0db8:0:0::1/128"))
+        self.assertFalse(self.matches("-s", "2001:db8::/32", "2001:db8::/48"))
+
+    def testAddressLists(self):
+        self.assertTrue(self.matches("-s", "10.0.0.1,10.0.0.2", "10.0.0.1/32,10.0.0.2/32"))
+        self.assertFalse(self.matches("-s", "10.0.0.1,10.0.0.2", "10.0.0.1"))
+
+    def testOldStyleNegation(self):
+        self.assertTrue(self.matches("-s", "! 10.0.0.1", "! 10.0.0.1/32"))
+        self.assertFalse(self.matches("-s", "! 10.0.0.1", "10.0.0.1"))
+
+    def testHostNames(self):
+        self.assertTrue(self.matches("-d", "host.example.com", "host.example.com"))
+        self.assertFalse(self.matches("-d", "host.example.com", "other.example.com"))
+
+    def testNatAddresses(self):
+        self.assertTrue(self.matches("--to-destination", "10.0.0.1:80", "10.0.0.1-10.0.0.1:80"))
+        self.assertFalse(self.matches("--to-destination", "10.0.0.1:80", "10.0.0.1:81"))
+
+    def testIcmpTypes(self):
+        self.assertTrue(self.matches("--icmp-type", "echo-request", "8"))
+        self.assertFalse(self.matches("--icmp-type", "echo-request", "0"))
+
+
+class RuleEqualityTest(unittest.TestCase):
+    def assertEquivalent(self, this, that):
+        self.assertTrue(Rule(this).equals(Rule(that)))
+        self.assertTrue(Rule(that).equals(Rule(this)))
+
+    def testAliases(self):
+        self.assertEquivalent("-A INPUT --source 10.0.0.1 --protocol tcp --jump ACCEPT", "-A INPUT -s 10.0.0.1/32 -p tcp -j ACCEPT")
+        self.assertEquivalent("-A INPUT -p tcp --destination-port 22 -j ACCEPT", "-A INPUT -p tcp --dport 22 -j ACCEPT")
+
+    def testSignatureUsesCanonicalNames(self):
+        self.assertEqual(Rule("-A INPUT --jump ACCEPT").getSignature(), Rule("-A INPUT -j ACCEPT").getSignature())
+
+    def testDifferentRules(self):
+        self.assertFalse(Rule("-A INPUT -s 10.0.0.1 -j ACCEPT").equals(Rule("-A INPUT -s 10.0.0.1 -j DROP")))
+        self.assertFalse(Rule("-A INPUT -p tcp --dport 22 -j ACCEPT").equals(Rule("-A INPUT -p tcp --sport 22 -j ACCEPT")))
+
+    def testConcurrentRegistration(self):
+        names = ["--test-option-%s" % i for i in range(0, 2000)]
+        found = []
+        start = threading.Event()
+
+        def register():
+            start.wait()
+            found.append([getOptionId(name) for name in names])
+
+        # switch threads as often as possible, to make races likely
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            threads = [threading.Thread(target=register) for i in range(0, 8)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+
+        # every thread got the same ids, one per option
+        ids = found[0]
+        self.assertEqual(len(set(ids)), len(names))
+        for other in found[1:]:
+            self.assertEqual(other, ids)
+        self.assertEqual([getOptionName(i) for i in ids], names)
+
+if __name__ == '__main__':
+    unittest.main()
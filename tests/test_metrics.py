@@ -0,0 +1,56 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import unittest
+from bbfw.parsers import IPTSaveFileParser
+from bbfw.metrics import Metrics
+
+
+DUMP = """
+*filter
+:INPUT ACCEPT [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:SSH - [0:0]
+:UNUSED - [0:0]
+:UNUSEDLOG - [0:0]
+:UNUSEDDROP - [0:0]
+-A INPUT -p tcp -m tcp --dport 22 -j SSH
+-A SSH -j LOG
+-A UNUSED -j UNUSEDLOG
+-A UNUSEDLOG -j UNUSEDDROP
+-A UNUSEDDROP -j DROP
+COMMIT
+"""
+
+
+class MetricsTest(unittest.TestCase):
+    def testMaxJumpDepth(self):
+        # the chains no builtin chain reaches are not walked
+        metrics = Metrics()
+        metrics.addRuleset(IPTSaveFileParser(DUMP.strip().split("\n")).parse())
+        self.assertTrue('bbfw_max_jump_depth{table="filter"} 1' in metrics.render().split("\n"))
+
+if __name__ == '__main__':
+    unittest.main()
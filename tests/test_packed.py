@@ -0,0 +1,148 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import os, shutil, tempfile, unittest
+from bbfw.parsers import IPTSaveFileParser, ConfigParser, PackedParser
+from bbfw.elements import Rule
+from bbfw.packed import PackedWriter, PackedRule, isPacked
+from bbfw.compare import getChainSignature
+
+
+DUMP = """
+*filter
+:INPUT DROP [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:SSH - [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 22 -j SSH
+-A SSH -s 10.0.0.0/8 -j ACCEPT
+-A SSH -j DROP
+COMMIT
+*nat
+:PREROUTING ACCEPT [0:0]
+:INPUT ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:POSTROUTING ACCEPT [0:0]
+-A POSTROUTING -o eth0 -j MASQUERADE
+COMMIT
+"""
+
+
+class PackedTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.folder, "rules.packed")
+        self.ruleset = IPTSaveFileParser(DUMP.strip().split("\n")).parse()
+        PackedWriter(self.ruleset).write(self.fileName)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def testRoundTrip(self):
+        self.assertTrue(isPacked(self.fileName))
+        packed = PackedParser(self.fileName).parse()
+        self.assertTrue(packed.equals(self.ruleset))
+        self.assertTrue(self.ruleset.equals(packed))
+
+        for tableName, table in self.ruleset.getTables().items():
+            packedTable = packed.getTable(tableName)
+            for chain in table.chains():
+                packedChain = packedTable.getChain(chain.getName())
+                self.assertEqual(packedChain.getPolicy(), chain.getPolicy())
+                self.assertEqual([r.toStr() for r in packedChain.getRules()], [r.toStr() for r in chain.getRules()])
+                self.assertEqual(getChainSignature(packedChain), getChainSignature(chain))
+
+    def testUnordered(self):
+        self.ruleset.getTable("filter").getChain("SSH").setUnordered(True)
+        PackedWriter(self.ruleset).write(self.fileName)
+
+        packed = PackedParser(self.fileName).parse()
+        self.assertTrue(packed.getTable("filter").getChain("SSH").isUnordered())
+        self.assertFalse(packed.getTable("filter").getChain("INPUT").isUnordered())
+
+        # an identical base chain takes the marker of the packed one
+        base = IPTSaveFileParser(DUMP.strip().split("\n")).parse()
+        merged = PackedParser(self.fileName, base).parse()
+        self.assertTrue(merged.getTable("filter").getChain("SSH").isUnordered())
+
+    def testSource(self):
+        # a config folder, with a comment shifting the rule lines
+        configFolder = os.path.join(self.folder, "config")
+        os.makedirs(os.path.join(configFolder, "filter"))
+        open(os.path.join(configFolder, "filter.props"), "w").write(":INPUT DROP\n:SSH -\n")
+        open(os.path.join(configFolder, "filter", "INPUT.src"), "w").write("-A INPUT -p tcp -m tcp --dport 22 -j SSH\n")
+        sshName = os.path.join(configFolder, "filter", "SSH.src")
+        open(sshName, "w").write("# trusted networks\n-A SSH -s 10.0.0.0/8 -j ACCEPT\n-A SSH -j DROP\n")
+
+        PackedWriter(ConfigParser(configFolder).parse()).write(self.fileName)
+        chain = PackedParser(self.fileName).parse().getTable("filter").getChain("SSH")
+        self.assertEqual(chain.getRuleSource(0), (sshName, 2))
+        self.assertEqual(chain.getRuleSource(1), (sshName, 3))
+        self.assertEqual(chain.getRuleSource(2), None)
+
+        # chains read from iptables-save have no source
+        PackedWriter(self.ruleset).write(self.fileName)
+        self.assertEqual(PackedParser(self.fileName).parse().getTable("filter").getChain("SSH").getRuleSource(0), None)
+
+    def testLazyRules(self):
+        packed = PackedParser(self.fileName).parse()
+        chain = packed.getTable("filter").getChain("SSH")
+        rule = chain.getRules()[0]
+        self.assertTrue(isinstance(rule, PackedRule))
+        self.assertFalse(rule.isParsed())
+
+        # the stored signature is the one the rule would compute
+        self.assertEqual(rule.getSignature(), Rule.getSignature(rule))
+        self.assertEqual(rule.getTarget(), "ACCEPT")
+        self.assertFalse(rule.isParsed())
+
+        self.assertEqual(rule.getProperty("-s"), "10.0.0.0/8")
+        self.assertTrue(rule.isParsed())
+        self.assertEqual(rule.toStr(), self.ruleset.getTable("filter").getChain("SSH").getRules()[0].toStr())
+
+    def testParent(self):
+        packed = PackedParser(self.fileName).parse()
+        table = packed.getTable("filter")
+        self.assertTrue(table.getChain("SSH").getParent() is table.getChain("INPUT"))
+        self.assertTrue(table.getChain("INPUT").getParent() is table)
+
+    def testChangeRules(self):
+        packed = PackedParser(self.fileName).parse()
+        chain = packed.getTable("filter").getChain("SSH")
+        self.assertTrue(chain.remove(chain.getRules()[1]))
+        self.assertEqual(len(chain), 1)
+        self.assertEqual(chain.getRules()[-1].getTarget(), "ACCEPT")
+
+    def testMergeWithBase(self):
+        base = IPTSaveFileParser(DUMP.replace("-s 10.0.0.0/8", "-s 192.168.0.0/16").strip().split("\n")).parse()
+        baseInput = base.getTable("filter").getChain("INPUT")
+        merged = PackedParser(self.fileName, base).parse()
+
+        # identical chains are kept, different ones replaced
+        self.assertTrue(merged.getTable("filter").getChain("INPUT") is baseInput)
+        self.assertEqual(merged.getTable("filter").getChain("SSH").getRules()[0].getProperty("-s"), "10.0.0.0/8")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import unittest
+from bbfw.parsers import IPTSaveFileParser
+from bbfw.util import getPurgeDelta
+
+
+DUMP = """
+*filter
+:INPUT ACCEPT [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:SSH - [0:0]
+:SSHLOG - [0:0]
+-A INPUT -p tcp -m tcp --dport 22 -j SSH
+-A SSH -s 10.0.0.0/8 -j ACCEPT
+-A SSH -j SSHLOG
+-A SSHLOG -j LOG
+COMMIT
+*nat
+:PREROUTING ACCEPT [0:0]
+:INPUT ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:POSTROUTING ACCEPT [0:0]
+COMMIT
+"""
+
+
+class PurgeDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.ruleset = IPTSaveFileParser(DUMP.strip().split("\n")).parse()
+
+    def testChainWithoutTable(self):
+        delta = getPurgeDelta(self.ruleset, None, "SSH")
+        self.assertEqual(delta.getDeleted("filter"), ["SSH"])
+        self.assertEqual(len(delta.getDeletedRules("filter")), 1)
+        self.assertEqual(delta.getTableNames(), ["filter"])
+
+    def testBuiltinChainWithoutTable(self):
+        delta = getPurgeDelta(self.ruleset, None, "INPUT")
+        self.assertEqual(sorted(delta.getTableNames()), ["filter", "nat"])
+
+    def testRecursive(self):
+        delta = getPurgeDelta(self.ruleset, "filter", "SSH", True)
+        self.assertEqual(sorted(delta.getDeleted("filter")), ["SSH", "SSHLOG"])
+
+    def testUnknownChain(self):
+        self.assertRaises(Exception, getPurgeDelta, self.ruleset, None, "MISSING")
+        self.assertRaises(Exception, getPurgeDelta, self.ruleset, "nat", "SSH")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import unittest
+from bbfw.parsers import IPTSaveFileParser
+from bbfw.util import getRulesetDelta
+
+
+def parseDump(text):
+    return IPTSaveFileParser(text.strip().split("\n")).parse()
+
+DUMP = """
+*filter
+:INPUT DROP [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+%s
+COMMIT
+"""
+
+
+class RulesetDeltaTest(unittest.TestCase):
+    def getReplaced(self, current, target):
+        delta = getRulesetDelta(parseDump(DUMP % current), parseDump(DUMP % target))
+        return [chain.getName() for chain in delta.getReplaced("filter")]
+
+    def testIdentical(self):
+        self.assertEqual(self.getReplaced("-A INPUT -p tcp -j ACCEPT", "-A INPUT -p tcp -j ACCEPT"), [])
+
+    def testLiveRuleWithExtraMatch(self):
+        self.assertEqual(self.getReplaced("-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT", "-A INPUT -p tcp -j ACCEPT"), ["INPUT"])
+
+    def testSnapshotRuleWithExtraMatch(self):
+        self.assertEqual(self.getReplaced("-A INPUT -p tcp -j ACCEPT", "-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT"), ["INPUT"])
+
+    def testAliases(self):
+        self.assertEqual(self.getReplaced("-A INPUT --protocol tcp --jump ACCEPT", "-A INPUT -p tcp -j ACCEPT"), [])
+
+    def testUserChainDeleted(self):
+        current = parseDump(DUMP % ":EXTRA - [0:0]\n-A EXTRA -j ACCEPT")
+        delta = getRulesetDelta(current, parseDump(DUMP % ""))
+        self.assertEqual(delta.getDeleted("filter"), ["EXTRA"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import unittest
+from bbfw.parsers import IPTSaveFileParser
+from bbfw.simulator import Simulator, readPackets
+
+
+DUMP = """
+*filter
+:INPUT DROP [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+%s
+-A INPUT -s 10.0.0.0/8 -p tcp -m tcp --dport 22 -j ACCEPT
+COMMIT
+"""
+
+
+class SimulatorTest(unittest.TestCase):
+    def simulate(self, rules, flows):
+        ruleset = IPTSaveFileParser((DUMP % rules).strip().split("\n")).parse()
+        return Simulator(ruleset).run(readPackets(flows))
+
+    def testVerdicts(self):
+        result = self.simulate("-A INPUT -p udp -j ACCEPT", ["10.1.1.1 10.0.0.1 tcp 1024 22", "192.168.0.1 10.0.0.1 tcp 1024 22", "1.2.3.4 10.0.0.1 udp 53 53"])
+        self.assertEqual(result.verdicts, ["ACCEPT", "DROP", "ACCEPT"])
+        self.assertEqual(result.unsupported, {})
+
+    def testAddressList(self):
+        result = self.simulate("-A INPUT -s 192.168.0.1,192.168.0.2 -j REJECT", ["10.1.1.1 10.0.0.1 tcp 1024 22"])
+        self.assertEqual(result.unsupported.keys(), [("INPUT", 0)])
+
+    def testHostNameAndIPv6(self):
+        result = self.simulate("-A INPUT -d host.example.com -j LOG\n-A INPUT -s 2001:db8::/32 -j LOG", ["10.1.1.1 10.0.0.1 tcp 1024 22"])
+        self.assertEqual(sorted(result.unsupported.keys()), [("INPUT", 0), ("INPUT", 1)])
+        self.assertEqual(result.verdicts, ["ACCEPT"])
+
+    def testUnknownProtocol(self):
+        result = self.simulate("-A INPUT -p ospf -j LOG", ["10.1.1.1 10.0.0.1 tcp 1024 22"])
+        self.assertEqual(result.unsupported.keys(), [("INPUT", 0)])
+        self.assertEqual(result.verdicts, ["ACCEPT"])
+
+    def testOldStyleNegation(self):
+        result = self.simulate("-A INPUT -s ! 192.168.0.1 -j REJECT\n-A INPUT -p tcp -m tcp --dport ! 22 -j REJECT", ["10.1.1.1 10.0.0.1 tcp 1024 22"])
+        self.assertEqual(sorted(result.unsupported.keys()), [("INPUT", 0), ("INPUT", 1)])
+        self.assertEqual(result.verdicts, ["ACCEPT"])
+
+    def testNegation(self):
+        result = self.simulate("-A INPUT ! -s 10.1.1.1 -j REJECT", ["10.1.1.1 10.0.0.1 tcp 1024 22", "10.2.2.2 10.0.0.1 tcp 1024 22"])
+        self.assertEqual(result.verdicts, ["ACCEPT", "DROP"])
+
+    def testUserChains(self):
+        rules = ":SSH - [0:0]\n:WEB - [0:0]\n-A INPUT -p tcp -j SSH\n-A INPUT -p tcp -g WEB\n-A SSH -p tcp --dport 22 -j DROP\n-A SSH -j RETURN\n-A WEB -p tcp --dport 80 -j ACCEPT"
+        result = self.simulate(rules, ["10.1.1.1 10.0.0.1 tcp 1024 22", "1.1.1.1 10.0.0.1 tcp 1024 80", "1.1.1.1 10.0.0.1 tcp 1024 443"])
+        self.assertEqual(result.verdicts, ["DROP", "ACCEPT", "DROP"])
+        self.assertEqual(result.hits[("SSH", 1)], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# This project is maintained at http://github.com/americanpezza/bbfw/
+#
+# Copyright (c) 2013 Mario Beccia
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+import unittest
+from bbfw.parsers import IPTSaveFileParser
+from bbfw.validator import CRITICAL, WARNING, INFO
+
+
+def parseDump(text):
+    return IPTSaveFileParser(text.strip().split("\n")).parse()
+
+FILTER = """
+*filter
+:INPUT ACCEPT [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+%s
+COMMIT
+"""
+
+
+class ValidatorTest(unittest.TestCase):
+    def getMessages(self, findings, severity):
+        return ["%s" % finding for finding in findings[severity]]
+
+    def testClean(self):
+        findings = parseDump(FILTER % ":ALLOWED - [0:0]\n-A INPUT -j ALLOWED\n-A ALLOWED -j ACCEPT").validate()
+        self.assertEqual(findings[CRITICAL] + findings[WARNING] + findings[INFO], [])
+
+    def testDanglingUpperCaseJump(self):
+        findings = parseDump(FILTER % "-A INPUT -j LOGDROP").validate()
+        self.assertEqual(self.getMessages(findings, CRITICAL), ["filter/INPUT rule #1: jumps to chain LOGDROP, that doesn't exist"])
+
+    def testDanglingLowerCaseJump(self):
+        findings = parseDump(FILTER % "-A INPUT -j allowed").validate()
+        self.assertEqual(len(findings[CRITICAL]), 1)
+
+    def testExtensionTargets(self):
+        findings = parseDump(FILTER % "-A INPUT -j LOG --log-prefix x\n-A INPUT -j REJECT\n-A INPUT -j AUDIT --type drop").validate()
+        self.assertEqual(findings[CRITICAL] + findings[WARNING], [])
+
+    def testTargetOfAnotherTable(self):
+        findings = parseDump(FILTER % "-A INPUT -j DNAT --to-destination 10.0.0.1").validate()
+        self.assertEqual(len(findings[WARNING]), 1)
+
+    def testRestrictedTarget(self):
+        findings = parseDump(FILTER % "-A INPUT -j REJECT").validate()
+        self.assertEqual(findings[CRITICAL], [])
+
+    def testLoop(self):
+        findings = parseDump(FILTER % ":A - [0:0]\n:B - [0:0]\n-A INPUT -j A\n-A A -j B\n-A B -j A").validate()
+        self.assertEqual(self.getMessages(findings, CRITICAL), ["filter/B rule #1: chains jump to each other in a loop: A -> B -> A"])
+
+    def testJumpToBuiltin(self):
+        findings = parseDump(FILTER % "-A INPUT -j OUTPUT").validate()
+        self.assertEqual(len(findings[CRITICAL]), 1)
+
+    def testUnreferencedAndEmpty(self):
+        findings = parseDump(FILTER % ":UNUSED - [0:0]").validate()
+        self.assertEqual(self.getMessages(findings, WARNING), ["filter/UNUSED: user chain is never jumped to"])
+        self.assertEqual(self.getMessages(findings, INFO), ["filter/UNUSED: user chain is empty"])
+
+    def testConfigOnTopOfLiveRules(self):
+        live = parseDump(FILTER % ":DOCKER - [0:0]\n:BROKEN - [0:0]\n-A FORWARD -j DOCKER\n-A BROKEN -j MISSING")
+        config = parseDump(FILTER % ":ALLOWED - [0:0]\n-A INPUT -j ALLOWED\n-A ALLOWED -j DOCKER")
+
+        # the live chains are not reported on, but the config can jump to them
+        findings = config.validate(live)
+        self.assertEqual(findings[CRITICAL] + findings[WARNING], [])
+
+        # without them, the jump to DOCKER is dangling
+        findings = config.validate()
+        self.assertEqual(len(findings[CRITICAL]), 1)
+
+    def testLoopThroughLiveChain(self):
+        live = parseDump(FILTER % ":LIVE - [0:0]\n-A LIVE -j ALLOWED")
+        config = parseDump(FILTER % ":ALLOWED - [0:0]\n-A INPUT -j ALLOWED\n-A ALLOWED -j LIVE")
+        findings = config.validate(live)
+        self.assertEqual(len(findings[CRITICAL]), 1)
+
+if __name__ == '__main__':
+    unittest.main()